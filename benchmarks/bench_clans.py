@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+"""
+Time the scraper, the formatters and the newlove extension.
+
+Each benchmark runs on recorded Plans pages (see ``pages.py``), at a
+realistic size and at an extreme one, so no server is needed.
+
+Results can be saved as JSON with ``--json``, and compared against
+an earlier run with ``--compare``:
+
+    python benchmarks/bench_clans.py --json before.json
+    (make changes)
+    python benchmarks/bench_clans.py --compare before.json
+
+Usage: python benchmarks/bench_clans.py [-k PATTERN] [-n REPEAT]
+                                        [--json FILE] [--compare FILE]
+
+"""
+
+from __future__ import print_function
+
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import timeit
+from collections import OrderedDict
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+import clans
+import pages
+
+SIZES = OrderedDict([
+    ('realistic', {'read.html': 1, 'search.html': 1, 'planwatch.html': 1,
+                   'edit.html': 1, 'home.html': 1}),
+    ('extreme', {'read.html': 200, 'search.html': 200,
+                 'planwatch.html': 1000, 'edit.html': 200,
+                 'home.html': 500}),
+    ])
+"""How many times to repeat the repeating part of each page. The
+extreme plan is about 120 kB: html5lib takes time quadratic in the
+length of a plan, so much longer ones take minutes to read."""
+
+FORMATTERS = ['raw', 'json', 'ndjson', 'text', 'color']
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(func):
+    """ Register a benchmark. It returns the function to time. """
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+def _connection(size, parser):
+    served = {'read.php': 'read.html', 'search.php': 'search.html',
+              'planwatch.php': 'planwatch.html', 'edit.php': 'edit.html',
+              'index.php': 'home.html'}
+    return pages.connection(
+        dict((name, pages.scale(page, SIZES[size][page]))
+             for name, page in served.items()), parser=parser)
+
+
+@benchmark
+def read_plan(size, parser):
+    pc = _connection(size, parser)
+    return lambda: pc.read_plan('gorp')
+
+
+@benchmark
+def read_plan_sliced(size, parser):
+    pc = _connection(size, parser)
+    pc.slice_text = True
+    return lambda: pc.read_plan('gorp')
+
+
+@benchmark
+def search_plans(size, parser):
+    pc = _connection(size, parser)
+    return lambda: pc.search_plans('baldwint', planlove=True)
+
+
+@benchmark
+def planwatch(size, parser):
+    pc = _connection(size, parser)
+    return pc.planwatch
+
+
+@benchmark
+def get_edit_text(size, parser):
+    pc = _connection(size, parser)
+    return pc.get_edit_text
+
+
+@benchmark
+def plans_login(size, parser):
+    pc = _connection(size, parser)
+    return lambda: pc.plans_login('baldwint', 'password')
+
+
+def _formatter(name):
+    from clans.ui import ClansSession
+    return ClansSession._load_formatters(None)[name](timezone='US/Central')
+
+
+_PARSED = {}
+
+
+def _parsed(method, size, parser, *args):
+    """ The result of a PlansConnection method, parsed only once """
+    key = (method, size, parser)
+    if key not in _PARSED:
+        pc = _connection(size, parser)
+        _PARSED[key] = getattr(pc, method)(*args)
+    return _PARSED[key]
+
+
+def _plan(size, parser):
+    return _parsed('read_plan', size, parser, 'gorp')
+
+
+def _search(size, parser):
+    return _parsed('search_plans', size, parser, 'baldwint', True)
+
+
+def _filter_html(fmt_name):
+    def bench(size, parser):
+        fmt = _formatter(fmt_name)
+        header, plan = _plan(size, parser)
+        return lambda: fmt.filter_html(plan)
+    bench.__name__ = 'filter_html[%s]' % fmt_name
+    return bench
+
+
+def _format_plan(fmt_name):
+    def bench(size, parser):
+        fmt = _formatter(fmt_name)
+        header, plan = _plan(size, parser)
+        plan = fmt.filter_html(plan)
+        return lambda: fmt.format_plan(plan=plan, **header)
+    bench.__name__ = 'format_plan[%s]' % fmt_name
+    return bench
+
+
+def _search_results(fmt_name):
+    def bench(size, parser):
+        fmt = _formatter(fmt_name)
+        results = _search(size, parser)
+        return lambda: list(fmt.iter_search_results(results))
+    bench.__name__ = 'iter_search_results[%s]' % fmt_name
+    return bench
+
+
+for _name in FORMATTERS:
+    benchmark(_filter_html(_name))
+    benchmark(_format_plan(_name))
+    benchmark(_search_results(_name))
+
+
+def _newlove_log(size, parser):
+    from clans.ext import newlove
+    results = _search(size, parser)
+    log = newlove._rebuild_log({}, results)
+    return newlove, results, log
+
+
+@benchmark
+def newlove_rebuild_log(size, parser):
+    newlove, results, log = _newlove_log(size, parser)
+    return lambda: newlove._rebuild_log(dict(log), results)
+
+
+@benchmark
+def newlove_modify_results(size, parser):
+    import copy
+    newlove, results, log = _newlove_log(size, parser)
+    return lambda: newlove.modify_results(copy.deepcopy(results), log,
+                                          order_by_time=True)
+
+
+@benchmark
+def newlove_save_log(size, parser):
+    newlove, results, log = _newlove_log(size, parser)
+    return lambda: newlove._save_log(log, io.StringIO())
+
+
+@benchmark
+def newlove_load_log(size, parser):
+    newlove, results, log = _newlove_log(size, parser)
+    fl = io.StringIO()
+    newlove._save_log(log, fl)
+    text = fl.getvalue()
+    return lambda: newlove._load_log(io.StringIO(text))
+
+
+def time_func(func, repeat, min_time=0.05):
+    """
+    Best time per call of ``func``, over ``repeat`` runs of enough
+    calls to take at least ``min_time`` seconds.
+
+    """
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time or number >= 10**6:
+            break
+        number *= 10
+    best = min([elapsed] + timer.repeat(repeat - 1, number))
+    return best / number, number
+
+
+def run(pattern=None, repeat=5, parser='html5lib'):
+    """
+    Run the benchmarks whose names contain ``pattern``, and return
+    their results, keyed by 'name/size'.
+
+    """
+    results = OrderedDict()
+    for name, setup in BENCHMARKS.items():
+        for size in SIZES:
+            key = '%s/%s' % (name, size)
+            if pattern and pattern not in key:
+                continue
+            best, number = time_func(setup(size, parser), repeat)
+            results[key] = {'seconds': best, 'number': number}
+            yield key, results[key]
+
+
+def _duration(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e3), ('us', 1e6)):
+        if seconds * scale >= 1:
+            return '%8.2f %-2s' % (seconds * scale, unit)
+    return '%8.2f ns' % (seconds * 1e9)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-k', dest='pattern',
+                        help='only run benchmarks whose names contain this')
+    parser.add_argument('-n', '--repeat', type=int, default=5)
+    parser.add_argument('--parser', default='html5lib',
+                        help='HTML parser for the scraper to use')
+    parser.add_argument('--json', dest='json_file', metavar='FILE',
+                        help='save the results to FILE')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='compare with results saved in FILE')
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as fl:
+            baseline = json.load(fl)['results']
+
+    results = OrderedDict()
+    for key, result in run(args.pattern, args.repeat, args.parser):
+        results[key] = result
+        line = '%-44s %s' % (key, _duration(result['seconds']))
+        if key in baseline:
+            ratio = result['seconds'] / baseline[key]['seconds']
+            line += '  %5.2fx' % ratio
+        print(line)
+        sys.stdout.flush()
+
+    if args.json_file:
+        report = OrderedDict([
+            ('clans', clans.__version__),
+            ('python', platform.python_version()),
+            ('implementation', platform.python_implementation()),
+            ('platform', platform.platform()),
+            ('parser', args.parser),
+            ('results', results),
+            ])
+        with open(args.json_file, 'w') as fl:
+            json.dump(report, fl, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+"""
+Time how long clans takes to start up.
+
+Each command is run in a fresh interpreter, as it is from the shell,
+so that the cost of importing clans is included.
+
+Usage: python benchmarks/bench_startup.py [-n REPEAT]
+
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+COMMANDS = [
+    ('python -c pass', ['-c', 'pass']),
+    ('import clans.ui', ['-c', 'import clans.ui']),
+    ('clans --version', ['-c', 'import clans.ui; clans.ui.main()',
+                         '--version']),
+    ('clans config --dir', ['-c', 'import clans.ui; clans.ui.main()',
+                            'config', '--dir']),
+]
+
+
+def time_command(args, repeat, env):
+    """ Best wall-clock time of ``repeat`` runs of python ``args`` """
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        subprocess.check_call([sys.executable] + args, env=env,
+                              stdout=open(os.devnull, 'w'))
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-n', '--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    env = dict(os.environ, CLANS_DIR=tempfile.mkdtemp())
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(
+        [root] + [p for p in [env.get('PYTHONPATH')] if p])
+    for name, cmd in COMMANDS:
+        best = time_command(cmd, args.repeat, env)
+        print('%-20s %8.1f ms' % (name, best * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Recorded Plans pages, for benchmarks.
+
+The pages are the ones recorded for the unit tests, in
+``tests/pages``. Each can be scaled up, by repeating the part of it
+that grows with use (the plan text, the list of search results, and
+so on), to make pages of extreme sizes.
+
+"""
+
+from __future__ import unicode_literals
+
+import io
+import os
+import re
+import sys
+
+if sys.version_info < (3,):
+    from HTMLParser import HTMLParser
+    unescape = HTMLParser().unescape
+else:
+    from html import unescape
+
+from clans.util import plans_md5, convert_endings
+
+PAGEDIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'tests', 'pages')
+
+# the part of each page that repeats: it lies between the first
+# occurrence of the first string and the next occurrence of the second
+REPEATS = {
+    'read.html': ('<div class="plan_text">', '</div>'),
+    'search.html': ('<ul id="search_results">\n',
+                    '</ul>\n</div>\n<div id="footer">'),
+    'planwatch.html': ('<ul id="new_plan_list">\n', '</ul>'),
+    'edit.html': ('name="plan" id="plan">', '</textarea>'),
+    'home.html': ('<ul class="autoread_level">\n', '</ul>'),
+    }
+
+# usernames in lists of plans, which are numbered in each repeat so
+# that they stay distinct
+_USERNAME = re.compile(r'>(\w+)</a>( <span>|</li>)')
+
+
+def load(name):
+    """ The recorded page ``name``, as text """
+    with io.open(os.path.join(PAGEDIR, name), 'r', encoding='utf8',
+                 newline='') as fl:
+        return fl.read()
+
+
+def scale(name, n):
+    """
+    The recorded page ``name``, with its repeating part repeated
+    ``n`` times.
+
+    """
+    page = load(name)
+    if n == 1:
+        return page
+    begin, end = REPEATS[name]
+    start = page.index(begin) + len(begin)
+    stop = page.index(end, start)
+    part = page[start:stop]
+    if name == 'edit.html':
+        parts = [part] * n
+    else:
+        parts = [_USERNAME.sub(r'>\g<1>%d</a>\2' % i, part)
+                 for i in range(n)]
+    page = page[:start] + ''.join(parts) + page[stop:]
+    if name == 'edit.html':
+        # the server sends the hash of the plan along with it
+        plan = unescape(''.join(parts))
+        md5 = plans_md5(convert_endings(plan, 'CRLF'))
+        page = re.sub(r'(name="edit_text_md5" value=")\w+', r'\g<1>' + md5,
+                      page)
+    return page
+
+
+class FakeResponse(object):
+    """Stands in for a ``requests.Response`` serving a page."""
+
+    def __init__(self, text, url):
+        self.text = text
+        self.content = text.encode('utf8')
+        self.encoding = 'utf-8'
+        self.url = url
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+
+def connection(pages, parser='html5lib'):
+    """
+    A PlansConnection that serves ``pages``, a dict of page text
+    keyed by name (as in 'read.php'), instead of the network.
+
+    """
+    from clans.scraper import PlansConnection
+    base_url = 'http://localhost/phplans/'
+    pc = PlansConnection(base_url=base_url, parser=parser)
+    pc.username = 'baldwint'
+
+    def get_page(name, **kwargs):
+        # a successful login is redirected home
+        url = base_url + ('home.php' if name == 'index.php' else name)
+        return FakeResponse(pages[name], url)
+    pc._get_page = get_page
+    return pc
@@ -0,0 +1,219 @@
+"""
+Provides an asyncio client interface to Plans.
+
+This requires Python 3.6+ and the aiohttp package.
+
+"""
+
+from urllib.parse import urlencode, urljoin
+from urllib.request import Request
+
+import aiohttp
+
+from .scraper import (PlansConnection, PlansError, _DivScanner,
+                      RESULT_GROUP_TAG)
+
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 30
+CONNECTION_ERROR = "Check your internet connection. Plans could also be down."
+
+
+class AsyncResponse(object):
+    """
+    A page retrieved by :class:`AsyncPlansConnection`.
+
+    This has the attributes of ``requests.Response`` that the parsing
+    methods of :class:`PlansConnection` rely on.
+
+    """
+
+    def __init__(self, url, content, encoding=None):
+        self.url = url
+        self.content = content
+        self.encoding = encoding
+        self.apparent_encoding = 'utf-8'
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or self.apparent_encoding,
+                                   'replace')
+
+
+class _CookieResponse(object):
+    """ Lets a cookie jar read Set-Cookie headers from aiohttp """
+
+    def __init__(self, headers):
+        self.headers = headers
+
+    def info(self):
+        return self
+
+    def get_all(self, name, default=None):
+        return self.headers.getall(name, default)
+
+
+class AsyncPlansConnection(PlansConnection):
+    """
+    Encapsulates an active login to plans, for use with asyncio.
+
+    The scraping methods of :class:`PlansConnection` are available
+    here as coroutines, and can be run concurrently:
+
+    .. code-block:: python
+
+        async with AsyncPlansConnection() as pc:
+            await pc.plans_login('baldwint', 'not_my_password_lol')
+            plans = await asyncio.gather(pc.read_plan('gorp'),
+                                         pc.read_plan('climb'))
+
+    Pages are parsed exactly as they are by :class:`PlansConnection`.
+    Cookies are kept in the same kind of cookie jar, so those saved
+    by one class can be loaded by the other.
+
+    """
+
+    def __init__(self, cookiejar=None, limit=100, **kwargs):
+        """
+        Create a new plans connection.
+
+        Takes the same keyword arguments as :class:`PlansConnection`,
+        plus ``limit``, the maximum number of simultaneous
+        connections to the server.
+
+        """
+        PlansConnection.__init__(self, cookiejar, **kwargs)
+        self.limit = limit
+        self.session = None  # created on first use, inside the loop
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """
+        Close all connections to the server.
+
+        """
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _open(self, name, get=None, post=None):
+        """
+        Request an HTML page from plans. Returns its URL and the
+        aiohttp response, whose body is yet to be read.
+
+        Redirects are followed here, rather than by aiohttp, so that
+        cookies set along the way are stored in our own cookie jar.
+
+        """
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.limit),
+                cookie_jar=aiohttp.DummyCookieJar())
+        method = 'GET' if post is None else 'POST'
+        url = '/'.join((self.base_url, name))
+        if get is not None:
+            url += '?' + urlencode(get)
+        data = None if post is None else urlencode(post)
+        for i in range(MAX_REDIRECTS):
+            request = Request(url, method=method)
+            self.cookiejar.add_cookie_header(request)
+            headers = dict(request.header_items())
+            if data is not None:
+                headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            try:
+                response = await self.session.request(
+                    method, url, data=data, headers=headers,
+                    allow_redirects=False)
+            except aiohttp.ClientError:
+                raise PlansError(CONNECTION_ERROR)
+            self.cookiejar.extract_cookies(
+                _CookieResponse(response.headers), request)
+            location = response.headers.get('Location')
+            if response.status not in REDIRECT_CODES or location is None:
+                return url, response
+            response.release()
+            url = urljoin(url, location)
+            if response.status in (301, 302, 303):
+                method, data = 'GET', None
+        raise PlansError('Too many redirects from %s' % name)
+
+    async def _get_page(self, name, get=None, post=None):
+        """
+        Retrieve an HTML page from plans.
+
+        """
+        url, response = await self._open(name, get=get, post=post)
+        try:
+            content = await response.read()
+        except aiohttp.ClientError:
+            raise PlansError(CONNECTION_ERROR)
+        finally:
+            response.release()
+        return AsyncResponse(url, content, response.charset)
+
+    async def plans_login(self, username='', password=''):
+        login_info = {'username': username,
+                      'password': password,
+                      'submit': 'Login'}
+        response = await self._get_page('index.php', post=login_info)
+        return self._parse_login(response)
+    plans_login.__doc__ = PlansConnection.plans_login.__doc__
+
+    async def get_edit_text(self):
+        response = await self._get_page('edit.php')
+        return self._parse_edit_text(response)
+    get_edit_text.__doc__ = PlansConnection.get_edit_text.__doc__
+
+    async def set_edit_text(self, newtext, md5):
+        edit_info = self._edit_info(newtext, md5)
+        response = await self._get_page('edit.php', post=edit_info)
+        return self._parse_edit_result(response)
+    set_edit_text.__doc__ = PlansConnection.set_edit_text.__doc__
+
+    async def get_autofinger(self, cached=True):
+        if cached and self.autoread is not None:
+            return PlansConnection.get_autofinger(self)
+        get = {'task': 'autofingerlist'}
+        response = await self._get_page('api/1/index.php', get=get)
+        return self._parse_autofinger(response)
+    get_autofinger.__doc__ = PlansConnection.get_autofinger.__doc__
+
+    async def read_plan(self, plan):
+        get = {'searchname': plan}
+        response = await self._get_page('read.php', get=get)
+        return self._parse_plan(response)
+    read_plan.__doc__ = PlansConnection.read_plan.__doc__
+
+    async def search_plans(self, term, planlove=False):
+        get = {'mysearch': term,
+               'planlove': int(bool(planlove))}
+        response = await self._get_page('search.php', get=get)
+        return self._parse_search(response)
+    search_plans.__doc__ = PlansConnection.search_plans.__doc__
+
+    async def search_plans_iter(self, term, planlove=False,
+                                chunk_size=8192):
+        get = {'mysearch': term,
+               'planlove': int(bool(planlove))}
+        url, response = await self._open('search.php', get=get)
+        encoding = response.charset or 'utf-8'
+        scanner = _DivScanner(RESULT_GROUP_TAG)
+        try:
+            async for chunk in response.content.iter_chunked(chunk_size):
+                for div in scanner.feed(chunk):
+                    yield self._parse_result_div(div, encoding)
+        except aiohttp.ClientError:
+            raise PlansError(CONNECTION_ERROR)
+        finally:
+            response.release()
+    search_plans_iter.__doc__ = PlansConnection.search_plans_iter.__doc__
+
+    async def planwatch(self, hours=12):
+        post = {'mytime': str(hours)}
+        response = await self._get_page('planwatch.php', post=post)
+        return self._parse_planwatch(response)
+    planwatch.__doc__ = PlansConnection.planwatch.__doc__
@@ -0,0 +1,181 @@
+"""
+Local storage of plans, to avoid downloading them more than necessary.
+
+"""
+
+import math
+import sqlite3
+from datetime import datetime
+
+from .scraper import PlansError
+from .util import ISO8601_UTC_FMT
+
+REWATCH_SECONDS = 60
+"""How long a planwatch result is reused for freshness checks."""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS plans (
+    name TEXT PRIMARY KEY,
+    username TEXT,
+    planname TEXT,
+    lastupdated TEXT,
+    lastlogin TEXT,
+    plan TEXT,
+    fetched TEXT NOT NULL
+)
+"""
+
+
+def _seconds(delta):
+    """ ``delta.total_seconds()``, which Python 2.6 lacks """
+    return delta.days * 86400 + delta.seconds + delta.microseconds / 1e6
+
+
+def _dump_date(date):
+    return None if date is None else date.strftime(ISO8601_UTC_FMT)
+
+
+def _load_date(string):
+    return None if string is None else datetime.strptime(string,
+                                                         ISO8601_UTC_FMT)
+
+
+class PlanCache(object):
+    """
+    Stores plans read from Plans in an SQLite database.
+
+    Each plan is stored with its header, including the time it was
+    last updated. When a stored plan is requested again, planwatch is
+    checked for updates since it was stored. If there are none, the
+    stored copy is returned instead of downloading the plan again.
+
+    Note that Plans does not mark a plan as read on your autoread
+    list unless it is downloaded.
+
+    """
+
+    def __init__(self, path, max_hours=6):
+        """
+        Open the plan cache stored in the file at ``path``.
+
+        Stored plans older than ``max_hours`` hours are always
+        downloaded again, rather than checked against planwatch:
+        planwatch for a long time can be bigger than the plan.
+
+        """
+        self.path = path
+        self.max_hours = max_hours
+        self.db = sqlite3.connect(path)
+        self.db.execute(SCHEMA)
+        self._watched = None  # (time, hours, {username: lastupdated})
+
+    def close(self):
+        self.db.close()
+
+    def get(self, name):
+        """
+        Return the stored (header, plan, fetched) for plan ``name``.
+
+        ``fetched`` is the time at which the plan was downloaded.
+        Returns None if the plan is not stored.
+
+        """
+        row = self.db.execute(
+            'SELECT username, planname, lastupdated, lastlogin, plan,'
+            ' fetched FROM plans WHERE name = ?', (name.lower(),)).fetchone()
+        if row is None:
+            return None
+        username, planname, lastupdated, lastlogin, plan, fetched = row
+        header = {'username': username,
+                  'planname': planname,
+                  'lastupdated': _load_date(lastupdated),
+                  'lastlogin': _load_date(lastlogin)}
+        return header, plan, _load_date(fetched)
+
+    def put(self, name, header, plan, fetched=None):
+        """
+        Store plan ``name``, as returned by ``read_plan``.
+
+        """
+        if fetched is None:
+            fetched = datetime.utcnow()
+        with self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO plans VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (name.lower(), header['username'], header['planname'],
+                 _dump_date(header['lastupdated']),
+                 _dump_date(header['lastlogin']),
+                 plan, _dump_date(fetched)))
+
+    def _updates(self, pc, since):
+        """
+        Return a dictionary of plans updated since ``since``.
+
+        Keys are usernames; values are the time of the update.
+        Returns None if this can't be determined from planwatch.
+
+        """
+        now = datetime.utcnow()
+        hours = int(math.ceil(_seconds(now - since) / 3600.)) + 1
+        if hours > self.max_hours:
+            return None
+        if self._watched is not None:
+            # reuse an earlier planwatch if it covers the time since then
+            watched_at, watched_hours, updates = self._watched
+            age = _seconds(now - watched_at)
+            if watched_hours >= hours and age < REWATCH_SECONDS:
+                return updates
+        try:
+            updates = dict(pc.planwatch(hours=hours))
+        except PlansError:
+            return None
+        self._watched = (now, hours, updates)
+        return updates
+
+    def _is_fresh(self, pc, stored):
+        header, plan, fetched = stored
+        updates = self._updates(pc, fetched)
+        if updates is None:
+            return False
+        updated = updates.get(header['username'])
+        return updated is None or (header['lastupdated'] is not None and
+                                   updated <= header['lastupdated'])
+
+    def read_plan(self, pc, name):
+        """
+        Retrieve plan ``name`` like ``pc.read_plan`` does.
+
+        The stored copy is returned if it is up to date; otherwise
+        the plan is downloaded using the PlansConnection ``pc``,
+        and stored.
+
+        """
+        stored = self.get(name)
+        if stored is not None and self._is_fresh(pc, stored):
+            header, plan, fetched = stored
+            return header, plan
+        header, plan = pc.read_plan(name)
+        self.put(name, header, plan)
+        return header, plan
+
+    def read_plans(self, pc, names, max_workers=4):
+        """
+        Retrieve several plans like ``pc.read_plans`` does.
+
+        Plans that are not stored, or are out of date, are downloaded
+        together. Up-to-date plans are returned from storage.
+
+        """
+        results = {}
+        for name in names:
+            stored = self.get(name)
+            if stored is not None and self._is_fresh(pc, stored):
+                header, plan, fetched = stored
+                results[name] = (name, (header, plan), None)
+        stale = [name for name in names if name not in results]
+        for name, result, err in pc.read_plans(stale,
+                                               max_workers=max_workers):
+            if result is not None:
+                self.put(name, *result)
+            results[name] = (name, result, err)
+        return [results[name] for name in names]
@@ -0,0 +1,237 @@
+"""
+Record and replay the HTTP traffic of a PlansConnection.
+
+A cassette is a gzipped file of JSON lines, one per request made
+to Plans, holding the request and the response it got. Recording
+appends to the cassette, so it can collect the traffic of many clans
+runs; replaying serves the recorded responses, in the same order,
+without touching the network.
+
+Clans records to the cassette named by the ``CLANS_RECORD``
+environment variable, or replays the one named by ``CLANS_REPLAY``.
+
+"""
+
+import base64
+import gzip
+import json
+import re
+import threading
+import time
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from .scraper import PlansError
+
+HEADERS = ('Content-Type', 'Location')
+"""Response headers kept in the cassette. Cookies are left out."""
+
+_PASSWORD = re.compile(r'(^|&)password=[^&]*')
+
+
+class CassetteError(PlansError):
+    """Exception raised when a cassette has no response to replay."""
+    pass
+
+
+def _body(request):
+    """ The body of a prepared request, as text, without passwords """
+    body = request.body
+    if body is None:
+        return None
+    if isinstance(body, bytes):
+        body = body.decode('utf8', 'replace')
+    return _PASSWORD.sub(r'\1password=', body)
+
+
+def _dump_content(content):
+    try:
+        return {'text': content.decode('utf8')}
+    except UnicodeDecodeError:
+        return {'base64': base64.b64encode(content).decode('ascii')}
+
+
+def _load_content(entry):
+    if 'base64' in entry:
+        return base64.b64decode(entry['base64'])
+    return entry['text'].encode('utf8')
+
+
+def load(path):
+    """ Read the recorded interactions in the cassette at ``path`` """
+    with gzip.open(path, 'rb') as fl:
+        return [json.loads(line.decode('utf8')) for line in fl if line.strip()]
+
+
+class _RecordingBody(object):
+    """
+    Stands in for the ``raw`` body of a response, keeping what is read
+    from it. Once it has all been read, or the response is closed, the
+    body is passed to ``record``, with whether it was cut short by the
+    close.
+
+    """
+
+    def __init__(self, raw, record):
+        self._raw = raw
+        self._record = record
+        self._chunks = []
+        self._done = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def stream(self, amt=2 ** 16, decode_content=None):
+        for chunk in self._raw.stream(amt, decode_content=decode_content):
+            self._chunks.append(chunk)
+            yield chunk
+        self._finish(False)
+
+    def read(self, amt=None, *args, **kwargs):
+        data = self._raw.read(amt, *args, **kwargs)
+        self._chunks.append(data)
+        if amt is None or not data:
+            self._finish(False)
+        return data
+
+    def close(self):
+        self._finish(True)
+        self._raw.close()
+
+    def _finish(self, partial):
+        if not self._done:
+            self._done = True
+            self._record(b''.join(self._chunks), partial)
+
+
+class RecordingAdapter(HTTPAdapter):
+    """
+    Sends requests over the network, as usual, and appends each
+    request and its response to the cassette at ``path``.
+
+    Responses are recorded as they are read, so streamed responses
+    still stream. A response is written to the cassette once it has
+    all been read, or is closed. One closed before it was all read is
+    marked ``partial``, and isn't replayed.
+
+    """
+
+    def __init__(self, path, **kwargs):
+        HTTPAdapter.__init__(self, **kwargs)
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        start = time.time()
+        response = HTTPAdapter.send(self, request, **kwargs)
+
+        def record(content, partial):
+            entry = {'method': request.method,
+                     'url': request.url,
+                     'body': _body(request),
+                     'status': response.status_code,
+                     'reason': response.reason,
+                     'headers': dict((name, response.headers[name])
+                                     for name in HEADERS
+                                     if name in response.headers),
+                     'elapsed': round(time.time() - start, 6)}
+            entry.update(_dump_content(content))
+            if partial:
+                entry['partial'] = True
+            self._write(entry)
+        response.raw = _RecordingBody(response.raw, record)
+        return response
+
+    def _write(self, entry):
+        line = json.dumps(entry, separators=(',', ':')) + '\n'
+        with self._lock:
+            # each line is a gzip member of its own, so that a run
+            # which is interrupted leaves a readable cassette
+            with gzip.open(self.path, 'ab') as fl:
+                fl.write(line.encode('utf8'))
+
+
+class ReplayAdapter(BaseAdapter):
+    """
+    Answers requests with the responses recorded in the cassette at
+    ``path``, never touching the network.
+
+    A request gets the first unplayed response to a request with the
+    same method, URL and body. Failing that, it gets one to a request
+    for the same method and URL (a login with other credentials, say),
+    and failing that, the last response played for either. Requests
+    unlike any recorded raise :class:`CassetteError`. Responses that
+    were only partly read when recorded are never played.
+
+    """
+
+    def __init__(self, path):
+        BaseAdapter.__init__(self)
+        self.path = path
+        self.interactions = load(path)
+        self._exact = {}
+        self._loose = {}
+        for i, entry in enumerate(self.interactions):
+            if entry.get('partial'):
+                continue
+            self._exact.setdefault(
+                (entry['method'], entry['url'], entry['body']), []).append(i)
+            self._loose.setdefault(
+                (entry['method'], entry['url']), []).append(i)
+        self._played = set()
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def _pick(self, request):
+        body = _body(request)
+        keys = [(self._exact, (request.method, request.url, body)),
+                (self._loose, (request.method, request.url))]
+        with self._lock:
+            for index, key in keys:
+                for i in index.get(key, ()):
+                    if i not in self._played:
+                        self._played.add(i)
+                        self._last[key] = i
+                        return self.interactions[i]
+            for index, key in keys:
+                if key in self._last:
+                    return self.interactions[self._last[key]]
+        raise CassetteError('No response recorded for %s %s'
+                            % (request.method, request.url))
+
+    def send(self, request, stream=False, timeout=None, verify=True,
+             cert=None, proxies=None):
+        entry = self._pick(request)
+        response = requests.Response()
+        response.status_code = entry['status']
+        response.reason = entry['reason']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response._content = _load_content(entry)
+        response._content_consumed = True
+        return response
+
+    def close(self):
+        pass
+
+
+def use_cassette(session, record=None, replay=None):
+    """
+    Make the requests ``session`` record to the cassette at the path
+    ``record``, or replay the one at ``replay``.
+
+    """
+    if replay:
+        adapter = ReplayAdapter(replay)
+    elif record:
+        adapter = RecordingAdapter(record)
+    else:
+        return
+    for prefix in ('http://', 'https://'):
+        session.mount(prefix, adapter)
@@ -0,0 +1,273 @@
+"""
+Serve clans commands from a long-running process.
+
+``clans daemon`` logs in once, then listens on a Unix domain socket in
+the profile directory. While it runs, the ``clans`` command sends its
+arguments there instead of starting up and logging in itself, and
+prints what comes back.
+
+Each request is one line of JSON, from client to daemon::
+
+    {"argv": [...], "cwd": "...", "tty": true}
+
+and the daemon answers with one line of JSON::
+
+    {"stdout": "...", "stderr": "...", "status": 0, "page": false}
+
+or ``{"fallback": true}`` if the command should be run by the client
+itself (because it is interactive, for example).
+
+"""
+
+from __future__ import print_function
+
+import io
+import json
+import os
+import socket
+import sys
+import traceback
+if sys.version_info >= (3,):
+    import socketserver
+else:
+    import SocketServer as socketserver
+    str = unicode
+
+from . import ui
+
+SOCKET_NAME = 'clans.sock'
+"""Name of the daemon's socket, in the profile directory."""
+
+SERVED = (ui.read, ui.autoread, ui.love, ui.search, ui.watch)
+"""Commands the daemon runs. Others are run by the client."""
+
+
+def socket_path(profile_dir):
+    return os.path.join(profile_dir, SOCKET_NAME)
+
+
+class Fallback(Exception):
+    """Raised when a request must be run by the client instead."""
+    pass
+
+
+class _Output(io.StringIO):
+    """ Captured output, which is a terminal if the client's is """
+
+    def __init__(self, tty=False):
+        io.StringIO.__init__(self)
+        self.tty = tty
+
+    def isatty(self):
+        return self.tty
+
+
+class DaemonSession(ui.ClansSession):
+    """
+    A ClansSession that stays open to run commands for clients.
+
+    The plans connection and plan cache are made once, and reused by
+    every command run in this session.
+
+    """
+
+    def __init__(self, profile_dir=None, username=''):
+        ui.ClansSession.__init__(self, profile_dir)
+        self.username = username or self.config.get('login', 'username')
+        self.serving = False
+        self.paged = False
+        self._pc = None
+        self._cache = None
+        self.stats.reset()  # each command is timed from scratch
+
+    def run(self, argv=None):
+        # check the command can be served here, before running it
+        args = vars(self.commands.main.parse_args(argv))
+        username = args['username'] or self.config.get('login', 'username')
+        if (args['func'] not in SERVED or args['password'] or
+                args['logout'] or username != self.username):
+            raise Fallback()
+        self.paged = False
+        if self._pc is not None:
+            # the autoread list seen by the last command may be out of
+            # date by now; have this one fetch it again
+            self._pc.autoread = None
+        ui.ClansSession.run(self, argv)
+
+    def make_plans_connection(self):
+        if self._pc is None:
+            self._pc = ui.ClansSession.make_plans_connection(self)
+        return self._pc
+
+    def make_plan_cache(self):
+        if self._cache is None:
+            # left open for the next command, unlike a session's own
+            self._cache = self._open_plan_cache()
+        return self._cache
+
+    def _relogin(self, pc):
+        if self.serving:
+            # can't prompt for a password from here. Let the client
+            # log in, and pick up its cookie next time
+            self._pc = None
+            raise Fallback()
+        return ui.ClansSession._relogin(self, pc)
+
+    def page(self, chunks):
+        if isinstance(chunks, str):
+            chunks = [chunks]
+        for chunk in chunks:
+            sys.stdout.write(chunk)
+        self.paged = True
+
+    def handle(self, request):
+        """
+        Run the command in ``request``, and return the response.
+
+        """
+        stdout = _Output(request.get('tty', False))
+        stderr = _Output()
+        real_stdout, real_stderr = sys.stdout, sys.stderr
+        cwd = os.getcwd()
+        status = 0
+        try:
+            sys.stdout, sys.stderr = stdout, stderr
+            os.chdir(request.get('cwd', cwd))
+            self.run(request['argv'])
+        except Fallback:
+            return {'fallback': True}
+        except SystemExit as err:
+            if err.code is None or isinstance(err.code, int):
+                status = err.code or 0
+            else:
+                print(err.code, file=stderr)
+                status = 1
+        except Exception:
+            traceback.print_exc(file=stderr)
+            status = 1
+        finally:
+            sys.stdout, sys.stderr = real_stdout, real_stderr
+            os.chdir(cwd)
+        return {'stdout': stdout.getvalue(),
+                'stderr': stderr.getvalue(),
+                'status': status,
+                'page': self.paged}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode('utf8'))
+        except ValueError:
+            return
+        response = self.server.session.handle(request)
+        self.wfile.write(json.dumps(response).encode('utf8') + b'\n')
+
+
+class DaemonServer(socketserver.UnixStreamServer):
+    """
+    Serves requests from clients one at a time, with ``session``.
+
+    """
+
+    def __init__(self, path, session):
+        self.session = session
+        # only the owner may use the socket, since it is logged in
+        umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.__init__(self, path, _Handler)
+        finally:
+            os.umask(umask)
+
+
+def call(path, argv, timeout=1.0):
+    """
+    Ask the daemon listening at ``path`` to run a clans command.
+
+    Returns the response, or None if there is no daemon there.
+    ``timeout`` applies to connecting only, since commands can take
+    as long as they need.
+
+    """
+    if not hasattr(socket, 'AF_UNIX') or not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.settimeout(None)
+        request = {'argv': argv,
+                   'cwd': os.getcwd(),
+                   'tty': sys.stdout.isatty()}
+        sock.sendall(json.dumps(request).encode('utf8') + b'\n')
+        with sock.makefile('rb') as fl:
+            line = fl.readline()
+    except socket.error:
+        return None
+    finally:
+        sock.close()
+    try:
+        return json.loads(line.decode('utf8'))
+    except ValueError:
+        return None  # daemon went away in the middle
+
+
+def _listening(path):
+    """ Return True if something is listening at ``path`` """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        return True
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+
+
+def run_client(profile_dir, argv):
+    """
+    Run a clans command in the daemon, if one is running.
+
+    Returns the exit status of the command, or None if it was not run.
+
+    """
+    response = call(socket_path(profile_dir), argv)
+    if response is None or response.get('fallback'):
+        return None
+    sys.stderr.write(response['stderr'])
+    if response['page'] and sys.stdout.isatty():
+        ui.pager(response['stdout'])
+    else:
+        sys.stdout.write(response['stdout'])
+    return response['status']
+
+
+def serve(cs):
+    """
+    Run the daemon for the session ``cs``, until interrupted.
+
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+        print('The daemon requires Unix domain sockets.', file=sys.stderr)
+        sys.exit(1)
+    path = socket_path(cs.profile_dir)
+    if _listening(path):
+        print('The daemon is already running.', file=sys.stderr)
+        sys.exit(1)
+    if os.path.exists(path):
+        os.unlink(path)  # left over from a daemon that didn't exit
+    session = DaemonSession(cs.profile_dir, cs.username)
+    session.args = cs.args
+    session.make_plans_connection()  # log in now, while we can prompt
+    session.finish()
+    server = DaemonServer(path, session)
+    print('Serving [%s] at %s' % (session.username, path), file=sys.stderr)
+    session.serving = True
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(path)
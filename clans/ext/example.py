@@ -119,5 +119,8 @@ def post_search(cs, results):
     Lists are mutable, so results may be filtered by modifying this
     list in-place.
 
+    When no extension implements this hook, search results are
+    printed as they arrive, rather than all at once.
+
     """
     pass
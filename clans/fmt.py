@@ -6,7 +6,6 @@ Formatters (views) for clans
 from __future__ import print_function, unicode_literals
 import sys
 
-#TODO only import these if needed
 if sys.version_info >= (3,3):
     from itertools import zip_longest
 elif sys.version_info < (3,):
@@ -20,14 +19,10 @@ elif sys.version_info >= (2, 6):
 
 import re
 import json
-import colorama as cr
-from babel.dates import format_datetime, get_timezone, LOCALTZ
+from operator import itemgetter
 
 from .util import json_output, ISO8601_UTC_FMT
 
-#in colorama, add support for underlining
-cr.Style.UNDERLINE = '\x1b[4m'
-
 HEADERS = [('Username', '{username}'),
            ('Last Updated', '{lastupdated}'),
            ('Last Login', '{lastlogin}'),
@@ -35,6 +30,14 @@ HEADERS = [('Username', '{username}'),
 
 
 class RawFormatter(object):
+    """
+    Formats plans and lists for output.
+
+    The ``iter_*`` methods yield output in chunks, as it is produced,
+    so it can be streamed to the terminal or the pager. The
+    ``print_*`` methods write those chunks to stdout.
+
+    """
 
     def __init__(self, **kwargs):
         pass
@@ -42,22 +45,40 @@ class RawFormatter(object):
     def filter_html(self, html):
         return html
 
+    # printed between plans, when reading several
+    page_break = '\n\n'
+
+    # a clans.stats.Stats to time the output in, if any
+    stats = None
+
     def format_date(self, date):
         return str(date)
 
     def format_plan(self, **kwargs):
-        read_fmt = '\n'.join(': '.join(header) for header in HEADERS)
-        read_fmt += "\n\n{plan}"
+        return ''.join(self.iter_plan(**kwargs))
+
+    def headers(self):
+        """ (name, template) pairs for the header of a plan """
+        return HEADERS
+
+    def iter_plan(self, plan='', **kwargs):
+        """
+        yield a plan in chunks: its header, then its text.
+
+        """
         kwargs['lastupdated'] = self.format_date(kwargs['lastupdated'])
         kwargs['lastlogin'] = self.format_date(kwargs['lastlogin'])
-        return read_fmt.format(**kwargs)
+        read_fmt = '\n'.join(': '.join(header) for header in self.headers())
+        yield read_fmt.format(**kwargs)
+        yield '\n\n'
+        yield plan
 
     def format_planlove(self, un):
         return "[%s]" % un
 
-    def print_list(self, items, bullets=False, **kw):
+    def iter_list(self, items, bullets=False):
         """
-        prints a list line by line
+        yields a list line by line
 
         :param items: a list of strings to print.
 
@@ -66,11 +87,11 @@ class RawFormatter(object):
             item = self.filter_html(item)
             if bullets:
                 item = (u" - {0}").format(item)
-            print(str(item), **kw)
+            yield str(item) + '\n'
 
-    def print_search_results(self, results, **kw):
+    def iter_search_results(self, results):
         """
-        prints search results to stdout.
+        yields search results, one line at a time.
 
         :param results: whatever was returned by the ``search_plans``
         method on PlansConnection.
@@ -78,16 +99,63 @@ class RawFormatter(object):
         """
         for un, count, snips in results:
             username = self.format_planlove(un)
-            print((u"{0}: {1}\n"
-                   ).format(username, count), **kw)
-            self.print_list(snips, bullets=True, **kw)
-            print(u"", **kw)
+            yield (u"{0}: {1}\n\n").format(username, count)
+            for line in self.iter_list(snips, bullets=True):
+                yield line
+            yield u"\n"
 
-    def print_autoread(self, results, **kw):
+    def iter_autoread(self, results):
         for level in sorted(results.keys()):
-            print(u"{level}:".format(level=level), **kw)
-            self.print_list(results[level], **kw)
-            print(u"", **kw)
+            yield u"{level}:\n".format(level=level)
+            for line in self.iter_list(results[level]):
+                yield line
+            yield u"\n"
+
+    def iter_planwatch(self, results):
+        """
+        yields the names of recently updated plans.
+
+        :param results: (username, lastupdated) pairs, as returned by
+        the ``planwatch`` method on PlansConnection.
+
+        """
+        return self.iter_list([un for un, t in results])
+
+    def print_list(self, items, bullets=False, **kw):
+        """
+        prints a list line by line
+
+        :param items: a list of strings to print.
+
+        """
+        self._emit(self.iter_list(items, bullets=bullets), **kw)
+
+    def print_search_results(self, results, **kw):
+        """
+        prints search results to stdout.
+
+        :param results: whatever was returned by the ``search_plans``
+        method on PlansConnection.
+
+        """
+        self._emit(self.iter_search_results(results), **kw)
+
+    def print_autoread(self, results, **kw):
+        self._emit(self.iter_autoread(results), **kw)
+
+    def print_planwatch(self, results, **kw):
+        self._emit(self.iter_planwatch(results), **kw)
+
+    def _emit(self, chunks, **kw):
+        """ write chunks of output. kw is passed on to print. """
+        for chunk in self._timed(chunks):
+            print(chunk, end='', **kw)
+
+    def _timed(self, chunks):
+        """ time the making of each chunk, if there are ``stats`` """
+        if self.stats is None:
+            return chunks
+        return self.stats.iterate('format', chunks)
 
 
 class JSONFormatter(RawFormatter):
@@ -105,22 +173,172 @@ class JSONFormatter(RawFormatter):
             ])
         return json_output(dic)
 
-    def print_list(self, results, **kw):
-        j = json_output(results)
-        print(str(j), **kw)
+    def iter_plan(self, **kwargs):
+        yield self.format_plan(**kwargs)
 
-    def print_search_results(self, results, **kw):
-        j = json_output(results)
-        print(str(j), **kw)
+    def iter_list(self, results, **kw):
+        yield str(json_output(results)) + '\n'
 
-    def print_autoread(self, results, **kw):
+    def iter_search_results(self, results):
+        yield str(json_output(list(results))) + '\n'
+
+    def iter_autoread(self, results):
         dic = OrderedDict([
             ('Level 1', results['Level 1']),
             ('Level 2', results['Level 2']),
             ('Level 3', results['Level 3']),
             ])
-        j = json_output(dic)
-        print(str(j), **kw)
+        yield str(json_output(dic)) + '\n'
+
+
+
+class NDJSONFormatter(JSONFormatter):
+    """
+    Newline-delimited JSON: one compact record per line, for each
+    plan, search result, autoread name or planwatch entry. Records
+    are written out as soon as they are made.
+
+    """
+
+    page_break = ''
+
+    def _record(self, obj):
+        return str(json_output(obj, compact=True)) + '\n'
+
+    def iter_plan(self, **kwargs):
+        yield self._record(OrderedDict(
+            (key, kwargs[key]) for key in
+            ('username', 'lastupdated', 'lastlogin', 'planname', 'plan')))
+
+    def format_plan(self, **kwargs):
+        return ''.join(self.iter_plan(**kwargs))
+
+    def iter_list(self, results, **kw):
+        for item in results:
+            yield self._record(item)
+
+    def iter_search_results(self, results):
+        for un, count, snips in results:
+            yield self._record(OrderedDict([
+                ('username', un), ('count', count), ('snippets', snips)]))
+
+    def iter_autoread(self, results):
+        for level in sorted(results.keys()):
+            for un in results[level]:
+                yield self._record(OrderedDict([
+                    ('level', level), ('username', un)]))
+
+    def iter_planwatch(self, results):
+        for un, lastupdated in results:
+            yield self._record(OrderedDict([
+                ('username', un), ('lastupdated', lastupdated)]))
+
+    def _emit(self, chunks, **kw):
+        out = kw.get('file') or sys.stdout
+        for chunk in self._timed(chunks):
+            print(chunk, end='', **kw)
+            out.flush()  # so readers downstream can start right away
+
+_TEMPLATES = {}  # parsed by _sub_elements
+
+
+def _sub_elements(start, close, template, html, dotall=False):
+    """
+    ``re.sub(start + '(.+?)' + close, template, html)``, in linear time.
+
+    ``start`` is a compiled regex matching the opening tag, and
+    ``close`` the closing tag as a string. In ``template``, ``\\1``,
+    ``\\2``, ... are the groups of ``start`` followed by the contents
+    of the element, and at least one must be used.
+
+    Rather than searching onward from each opening tag, the next
+    ``close`` and newline are found once and reused until they are
+    passed, so unclosed tags don't make this quadratic.
+
+    """
+    if template not in _TEMPLATES:
+        parts = re.split(r'\\(\d)', template)
+        _TEMPLATES[template] = (
+            '%s'.join(part.replace('%', '%%') for part in parts[::2]),
+            itemgetter(*[int(n) - 1 for n in parts[1::2]]))
+    form, pick = _TEMPLATES[template]
+    search, find = start.search, html.find
+    pieces = []
+    done = 0        # html[:done] has been copied to pieces
+    stop = -1       # next close, from where it was last looked for
+    newline = len(html) if dotall else -1  # likewise the next newline
+    found = search(html)
+    while found is not None:
+        begin = found.end()
+        if stop <= begin:  # the contents can't be empty
+            stop = find(close, begin + 1)
+            if stop < 0:
+                break  # nothing after here is closed
+        if newline < begin:
+            newline = find('\n', begin)
+            if newline < 0:
+                newline = len(html)
+        if newline < stop:
+            # .+? doesn't cross a newline; try the next opening tag
+            found = search(html, found.start() + 1)
+            continue
+        pieces.append(html[done:found.start()])
+        pieces.append(form % pick(found.groups() + (html[begin:stop],)))
+        done = stop + len(close)
+        found = search(html, done)
+    pieces.append(html[done:])
+    return ''.join(pieces)
+
+
+def _unescape(html):
+    """ decode the entities filter_html knows about """
+    return html.replace('&quot;', '"').replace('&gt;', '>') \
+        .replace('&lt;', '<').replace('&amp;', '&')
+
+
+# babel date pattern fields that strftime can make, in English. \x01
+# marks a number that babel doesn't pad with a zero
+_STRFTIME = {('E', 1): '%a', ('E', 2): '%a', ('E', 3): '%a',
+             ('E', 4): '%A',
+             ('M', 1): '\x01%m', ('M', 2): '%m',
+             ('M', 3): '%b', ('M', 4): '%B',
+             ('d', 1): '\x01%d', ('d', 2): '%d',
+             ('y', 1): '%Y', ('y', 2): '%y', ('y', 4): '%Y',
+             ('Y', 1): '%Y', ('Y', 4): '%Y',
+             ('h', 1): '\x01%I', ('h', 2): '%I',
+             ('H', 1): '\x01%H', ('H', 2): '%H',
+             ('m', 1): '\x01%M', ('m', 2): '%M',
+             ('s', 1): '\x01%S', ('s', 2): '%S',
+             ('a', 1): '%p'}
+
+
+def _strftime_format(pattern):
+    """
+    Translate a babel date pattern to a strftime format, or return
+    None if it can't be.
+
+    """
+    from babel.dates import tokenize_pattern
+    parts = []
+    for kind, value in tokenize_pattern(pattern):
+        if kind == 'chars':
+            if '\x01' in value:
+                return None
+            parts.append(value.replace('%', '%%'))
+        elif value in _STRFTIME:
+            parts.append(_STRFTIME[value])
+        else:
+            return None
+    return ''.join(parts)
+
+
+def _strftime(date, strftime):
+    """ format ``date`` with a format from :func:`_strftime_format` """
+    text = date.strftime(strftime)
+    if '\x01' in text:
+        # drop the zeros babel doesn't pad with
+        text = text.replace('\x010', '').replace('\x01', '')
+    return text
 
 
 class TextFormatter(RawFormatter):
@@ -129,23 +347,90 @@ class TextFormatter(RawFormatter):
                  date_format='E MMMM d YYYY, h:mm a',
                  timezone=None,
                  ):
+        # babel is slow to import, so wait until a formatter needs it
+        from babel.core import Locale
+        from babel.dates import get_timezone, parse_pattern, LOCALTZ, LC_TIME
         self.date_format = date_format
         if timezone is not None:
             self.tzinfo = get_timezone(timezone)
         else:
             self.tzinfo = LOCALTZ
+        # work out how to format dates once, rather than every time
+        self._locale = Locale.parse(LC_TIME)
+        self._dates = {}
+        self._pattern = self._strftime = None
+        self._week_year = False
+        if date_format not in ('full', 'long', 'medium', 'short'):
+            self._pattern = parse_pattern(date_format)
+            strftime = _strftime_format(date_format)
+            if strftime is not None and self._strftime_matches(strftime):
+                self._strftime = strftime
+            # the week-numbering year 'Y' differs from the calendar
+            # year around new year, so strftime can't be used then
+            self._week_year = 'Y' in self._pattern.format
 
     REGEX_LOVE = r'<a href="[^\s]*" class="planlove">(.+?)</a>'
     REGEX_LINK = r'<a href="([^\s]*)" class="onplan">(.+?)</a>'
     REGEX_SUB = r'<p class="sub">(.+?)</p>'
     REGEX_UL = r'<span class="underline">(.+?)</span><!--u-->'
 
+    _RE_BR = re.compile(r'<br ?/?>')
+    _RE_HR = re.compile(r'<hr ?/?>')
+    # opening tags of the elements above, for _sub_elements
+    _RE_B = re.compile(r'<b>')
+    _RE_I = re.compile(r'<i>')
+    _RE_LOVE = re.compile(r'<a href="[^\s]*" class="planlove">')
+    _RE_LINK = re.compile(r'<a href="([^\s]*)" class="onplan">')
+    _RE_SUB = re.compile(r'<p class="sub">')
+    _RE_UL = re.compile(r'<span class="underline">')
+
     hr = '\n' + 70*'=' + '\n'
     a = r'[\1|\2]'
 
     def format_date(self, date):
-        return format_datetime(date, self.date_format,
-                               tzinfo=self.tzinfo)
+        try:
+            return self._dates[date]
+        except KeyError:
+            pass
+        if self._pattern is None:
+            from babel.dates import format_datetime
+            text = format_datetime(date, self.date_format,
+                                   tzinfo=self.tzinfo, locale=self._locale)
+        else:
+            text = self._format_date(date)
+        if len(self._dates) >= 1000:
+            self._dates.clear()
+        self._dates[date] = text
+        return text
+
+    def _format_date(self, date):
+        """ format a date with the compiled pattern, as babel would """
+        from babel.dates import UTC
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=UTC)  # naive dates are UTC
+        date = date.astimezone(self.tzinfo)
+        if hasattr(self.tzinfo, 'normalize'):
+            date = self.tzinfo.normalize(date)
+        if self._strftime is None or (self._week_year and (
+                date.month == 1 and date.day < 7 or
+                date.month == 12 and date.day > 25)):
+            return self._pattern.apply(date, self._locale)
+        return _strftime(date, self._strftime)
+
+    def _strftime_matches(self, strftime):
+        """
+        Does ``strftime`` format dates as babel does in our locale?
+        Only some English locales use the names and AM/PM that
+        strftime does, so try a date in each month, at various hours.
+
+        """
+        from datetime import datetime
+        for month in range(1, 13):
+            date = datetime(2015, month, month + 9, month * 5 % 24, month)
+            if (_strftime(date, strftime) !=
+                    self._pattern.apply(date, self._locale)):
+                return False
+        return True
 
     def filter_html(self, html):
         """
@@ -153,23 +438,20 @@ class TextFormatter(RawFormatter):
 
         """
         html = html.replace('\n','').replace('\r','')
-        html = re.sub(r'<br ?/?>', '\n', html)
-        html = re.sub(r'&quot;', '"', html)
-        html = re.sub(r'&gt;', '>', html)
-        html = re.sub(r'&lt;', '<', html)
-        html = re.sub(r'&amp;', '&', html)
-        html = re.sub(r'<b>(.+?)</b>', r'\1', html)
-        html = re.sub(r'<i>(.+?)</i>', r'\1', html)
-        html = re.sub(self.REGEX_UL,   r'\1', html)
-        html = re.sub(self.REGEX_LOVE, r'\1', html)
-        html = re.sub(self.REGEX_LINK, self.a, html)
-        html = re.sub(re.compile(self.REGEX_SUB, flags=re.DOTALL), r'\1', html)
-        html = re.sub(r'<hr ?/?>', self.hr, html)
+        html = self._RE_BR.sub('\n', html)
+        html = _unescape(html)
+        html = _sub_elements(self._RE_B, '</b>', r'\1', html)
+        html = _sub_elements(self._RE_I, '</i>', r'\1', html)
+        html = _sub_elements(self._RE_UL, '</span><!--u-->', r'\1', html)
+        html = _sub_elements(self._RE_LOVE, '</a>', r'\1', html)
+        html = _sub_elements(self._RE_LINK, '</a>', self.a, html)
+        html = _sub_elements(self._RE_SUB, '</p>', r'\1', html, dotall=True)
+        html = self._RE_HR.sub(self.hr, html)
         return html
 
-    def print_list(self, items, columns=None, **kwargs):
+    def iter_list(self, items, bullets=False, columns=None):
         """
-        print a list of text strings, formatting into columns
+        yields a list of text strings, formatting into columns
 
         """
         lst = list(items)
@@ -183,30 +465,46 @@ class TextFormatter(RawFormatter):
         if (not columns) or (ncols < 2):
             # if we are piping output, or only one column,
             # fall back to non-fancy formatting
-            RawFormatter.print_list(self, items, **kwargs)
+            for line in RawFormatter.iter_list(self, lst, bullets=bullets):
+                yield line
             return
         args = [iter(lst)] * ncols
         for group in zip_longest(fillvalue='', *args):
-            print("".join(word.ljust(max_len) for word in group).rstrip(),
-                    **kwargs)
+            line = "".join(word.ljust(max_len) for word in group)
+            yield line.rstrip() + '\n'
+
+    def print_list(self, items, bullets=False, columns=None, **kw):
+        """
+        print a list of text strings, formatting into columns
+
+        """
+        self._emit(self.iter_list(items, bullets=bullets, columns=columns),
+                   **kw)
+
+
+def _colorama():
+    """ import colorama, with added support for underlining """
+    import colorama
+    colorama.Style.UNDERLINE = '\x1b[4m'
+    return colorama
 
 
 class ColorFormatter(TextFormatter):
 
-    hr = '\n' + cr.Fore.RED + 70*'=' + cr.Fore.RESET + '\n'
-    a = r'[%s\1%s|%s\2%s]' % (cr.Fore.GREEN, cr.Fore.RESET,
-                              cr.Fore.MAGENTA, cr.Fore.RESET)
+    def __init__(self, **kwargs):
+        TextFormatter.__init__(self, **kwargs)
+        self.cr = cr = _colorama()
+        self.hr = '\n' + cr.Fore.RED + 70*'=' + cr.Fore.RESET + '\n'
+        self.a = r'[%s\1%s|%s\2%s]' % (cr.Fore.GREEN, cr.Fore.RESET,
+                                       cr.Fore.MAGENTA, cr.Fore.RESET)
 
-    def format_plan(self, **kwargs):
-        color_headers = [(cr.Style.BRIGHT + k + cr.Style.NORMAL, v)
-                         for k, v in HEADERS]
-        read_fmt = '\n'.join(': '.join(header) for header in color_headers)
-        read_fmt += "\n\n{plan}"
-        kwargs['lastupdated'] = self.format_date(kwargs['lastupdated'])
-        kwargs['lastlogin'] = self.format_date(kwargs['lastlogin'])
-        return read_fmt.format(**kwargs)
+    def headers(self):
+        cr = self.cr
+        return [(cr.Style.BRIGHT + k + cr.Style.NORMAL, v)
+                for k, v in HEADERS]
 
     def format_planlove(self, un):
+        cr = self.cr
         return "[" + cr.Style.BRIGHT + cr.Fore.BLUE + \
             un + cr.Style.NORMAL + cr.Fore.RESET + "]"
 
@@ -215,14 +513,16 @@ class ColorFormatter(TextFormatter):
         format html for display in the terminal, with colors.
 
         """
-        html = re.sub(r'(<b>.+?</b>)',
-                      cr.Style.BRIGHT + r'\1' + cr.Style.NORMAL, html)
-        html = re.sub(r'(<i>.+?</i>)',
-                      cr.Style.DIM + r'\1' + cr.Style.NORMAL, html)
-        html = re.sub(self.REGEX_UL,  # Style.NORMAL doesn't reset underline
-                      cr.Style.UNDERLINE + r'\1' + cr.Style.RESET_ALL, html)
-        html = re.sub(self.REGEX_LOVE,
-                      cr.Style.BRIGHT + cr.Fore.BLUE +
-                      r'\1' + cr.Style.NORMAL + cr.Fore.RESET, html)
+        cr = self.cr
+        html = _sub_elements(self._RE_B, '</b>',
+            cr.Style.BRIGHT + r'<b>\1</b>' + cr.Style.NORMAL, html)
+        html = _sub_elements(self._RE_I, '</i>',
+            cr.Style.DIM + r'<i>\1</i>' + cr.Style.NORMAL, html)
+        html = _sub_elements(self._RE_UL, '</span><!--u-->',
+            # Style.NORMAL doesn't reset underline
+            cr.Style.UNDERLINE + r'\1' + cr.Style.RESET_ALL, html)
+        html = _sub_elements(self._RE_LOVE, '</a>',
+            cr.Style.BRIGHT + cr.Fore.BLUE +
+            r'\1' + cr.Style.NORMAL + cr.Fore.RESET, html)
         html = super(ColorFormatter, self).filter_html(html)
         return html
@@ -9,29 +9,56 @@ if sys.version_info >= (3,3):
     from urllib.parse import urlparse, parse_qsl
     from http.cookiejar import LWPCookieJar
     from html.parser import HTMLParser
+    from html import unescape
 elif sys.version_info < (3,):
     from urlparse import urlparse, parse_qsl
     from cookielib import LWPCookieJar
     from HTMLParser import HTMLParser
+    unescape = HTMLParser().unescape
     str = unicode
 
 
+import functools
 import json
 import re
-import bs4
-import requests
+import threading
 
-from .util import plans_md5, convert_endings, parse_plans_date
+from .stats import Stats
+from .util import plans_md5, convert_endings, parse_plans_dates
 
 class PlansError(Exception):
     """Exception raised when there is an error talking to plans."""
     pass
 
 
+PARSERS = ('html5lib', 'lxml', 'html.parser')
+"""Names of the BeautifulSoup tree builders PlansConnection can use.
+
+html5lib is the most lenient, and the slowest. lxml is much faster,
+but requires the lxml package. html.parser is built into Python.
+"""
+
+
 class PlansPageParser(HTMLParser):
-    """HTML parser for GrinnellPlans pages."""
+    """
+    HTML parser for GrinnellPlans pages.
+
+    If the page has the autoread sidebar, its levels are collected
+    into the ``autoread`` dictionary, in the same form as returned by
+    :meth:`PlansConnection.get_autofinger`.
+
+    """
+
+    def reset(self):
+        HTMLParser.reset(self)
+        self.autoread = None
+        self._autoread_depth = 0  # ul nesting level inside the sidebar
+        self._autoread_level = None  # name of the level being parsed
+        self._autoread_tag = None    # tag whose text is being collected
+        self._autoread_text = None
 
     def handle_starttag(self, tag, attrs):
+        self._autoread_starttag(tag, attrs)
         if tag == 'body':
             # parse out id of body tag
             # (can use to identify page)
@@ -54,12 +81,228 @@ class PlansPageParser(HTMLParser):
                 start, stop = comment.index('['), comment.index(']')
                 self.username = comment[start + 1:stop]
 
+    def handle_endtag(self, tag):
+        self._autoread_endtag(tag)
+
+    def handle_data(self, data):
+        if self._autoread_text is not None:
+            self._autoread_text.append(data)
+
+    def _autoread_starttag(self, tag, attrs):
+        if tag == 'ul':
+            if self._autoread_depth:
+                self._autoread_depth += 1
+            elif ('id', 'autoread') in attrs:
+                self._autoread_depth = 1
+                self.autoread = {}
+        elif not self._autoread_depth:
+            pass
+        elif ((tag == 'span' and ('class', 'autoreadname') in attrs) or
+                (tag == 'a' and self._autoread_level is not None)):
+            self._autoread_tag, self._autoread_text = tag, []
+
+    def _autoread_endtag(self, tag):
+        if not self._autoread_depth:
+            return
+        if tag == 'ul':
+            self._autoread_depth -= 1
+        elif tag == self._autoread_tag:
+            text = ''.join(self._autoread_text).strip()
+            if tag == 'span':
+                self._autoread_level = text
+                self.autoread[text] = []
+            else:
+                self.autoread[self._autoread_level].append(text)
+            self._autoread_tag, self._autoread_text = None, None
+
+PLAN_TEXT_TAG = b'<div class="plan_text">'
+RESULT_GROUP_TAG = b'<div class="result_user_group">'
+DIV_TAG = re.compile(br'<(/?)div\b', re.IGNORECASE)
+
+
+def _find_div(content, start_tag, pos=0):
+    """
+    Locate the contents of a div in a raw (bytes) page.
+
+    ``start_tag`` is the exact opening tag of the div, as served,
+    and the search for it starts at offset ``pos``.
+    Returns the (start, stop) byte offsets of whatever is between
+    that tag and its matching closing tag, or None if either
+    could not be found.
+
+    """
+    start = content.find(start_tag, pos)
+    if start < 0:
+        return None
+    start += len(start_tag)
+    depth = 1
+    for match in DIV_TAG.finditer(content, start):
+        depth += -1 if match.group(1) else 1
+        if depth == 0:
+            return start, match.start()
+    return None
+
+class PlanHeaderParser(PlansPageParser):
+    """
+    Streaming HTML parser for the header of a plan (read.php) page.
+
+    In one pass, this collects the plan header fields into the
+    ``header`` dictionary, along with the ``page_id`` and the
+    logged-in ``username`` found by :class:`PlansPageParser`.
+    Header values are left as they appear on the page; dates are
+    not converted.
+
+    """
+
+    FIELDS = ('username', 'planname', 'lastupdated', 'lastlogin')
+    DATES = ('lastupdated', 'lastlogin')
+
+    def reset(self):
+        PlansPageParser.reset(self)
+        self.header = None
+        self.username = None
+        self._depth = 0      # div nesting level inside the header div
+        self._key = None     # header field being parsed, if any
+        self._spans = []     # classes of open spans in that field
+        self._text = None    # text collected for that field
+
+    def handle_starttag(self, tag, attrs):
+        PlansPageParser.handle_starttag(self, tag, attrs)
+        if tag == 'div':
+            if self._depth:
+                self._depth += 1
+            elif ('id', 'header') in attrs:
+                self._depth = 1
+                self.header = {}
+        elif not self._depth:
+            pass
+        elif tag == 'li':
+            key = dict(attrs).get('class')
+            if key in self.FIELDS:
+                self._key, self._spans, self._text = key, [], None
+        elif tag == 'span' and self._key is not None:
+            self._spans.append(dict(attrs).get('class'))
+            if self._spans[-1] == self._value_class():
+                self._text = []
+
+    def handle_endtag(self, tag):
+        PlansPageParser.handle_endtag(self, tag)
+        if not self._depth:
+            return
+        if tag == 'div':
+            self._depth -= 1
+        elif tag == 'li' and self._key is not None:
+            self._key = None
+        elif tag == 'span' and self._spans:
+            if self._spans.pop() == self._value_class():
+                text = ''.join(self._text)
+                self.header[self._key] = text or None
+                self._text = None
+
+    def handle_data(self, data):
+        PlansPageParser.handle_data(self, data)
+        if self._text is not None:
+            self._text.append(data)
+
+    def handle_entityref(self, name):
+        # only called if the parser does not convert charrefs itself
+        self.handle_data(unescape('&%s;' % name))
+
+    def handle_charref(self, name):
+        self.handle_data(unescape('&#%s;' % name))
+
+    def _value_class(self):
+        """ class of the span holding the value of the current field """
+        return 'long' if self._key in self.DATES else 'value'
+
+class _DivScanner(object):
+    """
+    Finds the divs opened by ``start_tag`` in a page that arrives in
+    chunks, as :func:`_find_div` does for a whole page.
+
+    Each byte is searched once, and the chunks making up a div are
+    joined once, when its closing tag arrives.
+
+    """
+
+    def __init__(self, start_tag):
+        self.start_tag = start_tag
+        self._chunks = []   # bytes received, from offset _base on
+        self._base = 0
+        self._tail = b''    # bytes received from offset _scanned on
+        self._scanned = 0   # offset up to which tags have been found
+        self._start = None  # offset of the open div's tag, if any
+        self._depth = 0
+
+    def feed(self, chunk):
+        """
+        Add the next ``chunk`` of the page. Returns a list of the divs
+        it completes, each from its opening tag up to (not including)
+        its closing tag.
+
+        """
+        self._chunks.append(chunk)
+        window = self._tail + chunk
+        offset = self._scanned  # of window[0] in the page
+        pos = 0
+        divs = []
+        while True:
+            if self._start is None:
+                i = window.find(self.start_tag, pos)
+                if i < 0:
+                    # the tag may be cut off at the end of the chunk
+                    pos = max(pos, len(window) - len(self.start_tag) + 1)
+                    break
+                self._start, self._depth = offset + i, 1
+                pos = i + len(self.start_tag)
+            match = DIV_TAG.search(window, pos)
+            if match is None or match.end() == len(window):
+                # no tag, or one that may be cut off
+                pos = match.start() if match else max(pos, len(window) - 5)
+                break
+            pos = match.end()
+            self._depth += -1 if match.group(1) else 1
+            if self._depth == 0:
+                divs.append(self._cut(offset + match.start()))
+                self._start = None
+        self._tail = window[pos:]
+        self._scanned = offset + pos
+        if self._start is None:
+            # nothing before the tail is needed any more
+            self._chunks, self._base = [self._tail], self._scanned
+        return divs
+
+    def _cut(self, stop):
+        """ The open div, ending at offset ``stop``, and forget it """
+        data = b''.join(self._chunks)
+        div = data[self._start - self._base:stop - self._base]
+        self._chunks = [data[stop - self._base:]]
+        self._base = stop
+        return div
+
 # -------------------------------------------
 #              PLANS SCRAPEY-I
 # get it? like "api" except... oh, never mind
 # -------------------------------------------
 
 
+def _timed(name=None):
+    """
+    Time calls to a PlansConnection method as a span of its stats,
+    named ``name`` or else after the method.
+
+    """
+    def decorator(func):
+        span = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with self.stats.span(span):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
 class PlansConnection(object):
     """
     Encapsulates an active login to plans.
@@ -68,7 +311,11 @@ class PlansConnection(object):
 
     def __init__(self, cookiejar=None,
                  base_url="https://www.grinnellplans.com",
-                 server_tz='US/Central'):
+                 server_tz='US/Central',
+                 parser='html5lib',
+                 slice_text=False,
+                 relogin=None,
+                 stats=None):
         """
         Create a new plans connection.
 
@@ -79,8 +326,38 @@ class PlansConnection(object):
         base_url --  URL at which to access plans, no trailing slash.
         server_tz --  Name of the timezone used by the server.
                       This class will convert dates to UTC.
+        parser --    Name of the HTML parser BeautifulSoup should use
+                     to build page trees. One of ``PARSERS``.
+        slice_text -- If True, ``read_plan`` returns the plan text
+                      exactly as served, by slicing it out of the
+                      page, rather than parsing and reserializing it.
+        relogin --   a function to call, with this connection, when
+                     a request is turned away because we are not
+                     logged in. If it logs back in and returns True,
+                     the request is tried again.
+        stats --     a :class:`clans.stats.Stats` to record the
+                     timings of requests and parsing in, and the
+                     bytes received. A new one by default.
 
         """
+        # bs4 and requests are imported here, rather than with the
+        # module, so that importing PlansError etc. stays quick
+        import bs4
+        import requests
+        if parser not in PARSERS:
+            raise PlansError('Unknown HTML parser "%s"' % parser)
+        if bs4.builder.builder_registry.lookup(parser) is None:
+            raise PlansError('HTML parser "%s" is not installed' % parser)
+        self.html_parser = parser
+        self.slice_text = slice_text
+        self.relogin = relogin
+        # read_plans may find it logged out in several threads at once,
+        # but only one of them should log in again
+        self._relogin_lock = threading.Lock()
+        self._relogins = 0        # times relogin has succeeded
+        self._relogin_failed = None  # value of _relogins when it failed
+        self.stats = Stats() if stats is None else stats
+        self.autoread = None  # as of the last page seen with the sidebar
         self.base_url = base_url
         self.server_tz = server_tz
         if cookiejar is None:
@@ -92,23 +369,92 @@ class PlansConnection(object):
         self.parser = PlansPageParser()
         self.username = None
 
-    def _get_page(self, name, get=None, post=None):
+    def _get_page(self, name, get=None, post=None, stream=False):
         """
         Retrieve an HTML page from plans.
 
+        If ``stream`` is True, only the response headers are read
+        before returning; the body can then be read incrementally.
+
+        The time taken until the headers arrive is recorded as the
+        'connect' span of ``stats``, and the time to read the body as
+        'transfer'.
+
         """
+        import requests
+        relogins = self._relogins
         method = 'GET' if post is None else 'POST'
         url = '/'.join((self.base_url, name))
         req = requests.Request(method, url, params=get, data=post)
         prepped = self.session.prepare_request(req)
         try:
-            handle = self.session.send(prepped,
-                                       verify=url.startswith('https'))
+            with self.stats.span('connect', method=method,
+                                 url=prepped.url) as details:
+                handle = self.session.send(prepped, stream=True,
+                                           verify=url.startswith('https'))
+                details['status'] = handle.status_code
+            self.stats.count('requests')
+            self.stats.count('redirects', len(handle.history))
+            self.stats.count('status %d' % handle.status_code)
+            if not stream:
+                with self.stats.span('transfer'):
+                    handle.content  # read the body
+                self._count_bytes(handle)
         except requests.exceptions.ConnectionError:
             err = "Check your internet connection. Plans could also be down."
             raise PlansError(err)
+        if (self.relogin is not None and name != 'index.php'
+                and self._bounced(handle) and self._relogin(relogins)):
+            # logged back in, so try again
+            return self._get_page(name, get=get, post=post, stream=stream)
         return handle
 
+    def _relogin(self, relogins):
+        """
+        Log back in with ``relogin``, after a request sent when it had
+        succeeded ``relogins`` times was bounced to the login page.
+
+        Returns True if logged in. If another thread has logged in
+        since the request was sent, that login is used.
+
+        """
+        with self._relogin_lock:
+            if (relogins == self._relogins and
+                    relogins != self._relogin_failed):
+                if self.relogin(self):
+                    self._relogins += 1
+                else:
+                    self._relogin_failed = self._relogins
+            return self._relogins != relogins
+
+    def _count_bytes(self, response):
+        """ Count the bytes of ``response`` read from the network """
+        tell = getattr(getattr(response, 'raw', None), 'tell', None)
+        self.stats.count('bytes', tell() if tell else len(response.content))
+
+    def _decode(self, response):
+        """ The text of ``response`` """
+        with self.stats.span('decode'):
+            return response.text
+
+    @staticmethod
+    def _bounced(response):
+        """
+        Return True if a request was redirected to the login page.
+
+        """
+        return bool(response.history) and \
+            urlparse(response.url).path.endswith('/index.php')
+
+    def _soup(self, html):
+        """
+        Parse an HTML page into a BeautifulSoup tree.
+
+        """
+        import bs4
+        with self.stats.span('parse'):
+            return bs4.BeautifulSoup(html, self.html_parser)
+
     def _parse_message(self, soup):
         """
         Scrape details from an infomessage or alertmessage div.
@@ -174,6 +520,7 @@ class PlansConnection(object):
         regex = "([%s])" % ''.join(repls.keys())
         return re.sub(regex, repl, string)
 
+    @_timed()
     def plans_login(self, username='', password=''):
         """
         Log into plans.
@@ -190,13 +537,27 @@ class PlansConnection(object):
                       'password': password,
                       'submit': 'Login'}
         response = self._get_page('index.php', post=login_info)
+        return self._parse_login(response)
+
+    @_timed('extract')
+    def _parse_login(self, response):
         # if login is successful, we'll be redirected to home
         success = response.url[-9:] == '/home.php'
         if success:
-            self.parser.feed(response.text)  # parse out username
+            # parse out username, and autoread list while we're at it
+            html = self._decode(response)
+            with self.stats.span('parse'):
+                self.parser.feed(html)
             self.username = self.parser.username
+            self._update_autoread(self.parser)
         return success
 
+    def _update_autoread(self, parser):
+        """ Remember the autoread list, if ``parser`` found one """
+        if parser.autoread is not None:
+            self.autoread = parser.autoread
+
+    @_timed()
     def get_edit_text(self):
         """
         Retrieve contents of the edit plan field.
@@ -207,9 +568,13 @@ class PlansConnection(object):
         """
         # grab edit page
         response = self._get_page('edit.php')
-        html = response.text
+        return self._parse_edit_text(response)
+
+    @_timed('extract')
+    def _parse_edit_text(self, response):
+        html = self._decode(response)
         # parse out existing plan
-        soup = bs4.BeautifulSoup(html, 'html5lib')
+        soup = self._soup(html)
         plan = soup.find('textarea')
         if plan is None:
             raise PlansError("Couldn't get edit text, are we logged in?")
@@ -226,9 +591,14 @@ class PlansConnection(object):
         # also, explicitly compute the hash, for kicks
         assert md5sum == plans_md5(plan)
         # verify that username has not changed
-        assert self.username == self.parser.username
+        parser = PlansPageParser()
+        with self.stats.span('parse'):
+            parser.feed(html)
+        assert self.username == parser.username
+        self._update_autoread(parser)
         return plan, md5sum
 
+    @_timed()
     def set_edit_text(self, newtext, md5):
         """
         Update plan with new content.
@@ -240,14 +610,21 @@ class PlansConnection(object):
         Returns info message.
 
         """
+        edit_info = self._edit_info(newtext, md5)
+        response = self._get_page('edit.php', post=edit_info)
+        return self._parse_edit_result(response)
+
+    def _edit_info(self, newtext, md5):
         # convert to CRLF line endings
         newtext = convert_endings(newtext, 'CRLF')
         newtext = newtext.encode('utf8')
-        edit_info = {'plan': newtext,
-                     'edit_text_md5': md5,
-                     'submit': 'Change Plan'}
-        response = self._get_page('edit.php', post=edit_info)
-        soup = bs4.BeautifulSoup(response.text, "html5lib")
+        return {'plan': newtext,
+                'edit_text_md5': md5,
+                'submit': 'Change Plan'}
+
+    @_timed('extract')
+    def _parse_edit_result(self, response):
+        soup = self._soup(self._decode(response))
         alert = soup.find('div', {'class': 'alertmessage'})
         info = soup.find('div', {'class': 'infomessage'})
         if alert is not None:
@@ -261,7 +638,8 @@ class PlansConnection(object):
             msg = self._parse_message(info)
             return msg['body']
 
-    def get_autofinger(self):
+    @_timed()
+    def get_autofinger(self, cached=True):
         """
         Retrieve all levels of the autofinger (autoread) list.
 
@@ -269,12 +647,23 @@ class PlansConnection(object):
         "Level 1", "Level 2", etc. and the values are a list of
         usernames waiting to be read.
 
+        Pages such as the one seen on login show the list in a
+        sidebar. If ``cached`` is True, the list from the last of
+        those pages is returned, if any, instead of asking again.
+
         """
+        if cached and self.autoread is not None:
+            return dict((level, list(names))
+                        for level, names in self.autoread.items())
         # this actually doesn't scrape; there's a function for it
         # in the old JSON API.
         get = {'task': 'autofingerlist'}
         response = self._get_page('api/1/index.php', get=get)
-        data = json.loads(response.text)
+        return self._parse_autofinger(response)
+
+    @_timed('extract')
+    def _parse_autofinger(self, response):
+        data = json.loads(self._decode(response))
         # the returned JSON is crufty; clean it up
         autofinger = {}
         for group in data['autofingerList']:
@@ -282,6 +671,7 @@ class PlansConnection(object):
             autofinger[name] = group['usernames']
         return autofinger
 
+    @_timed()
     def read_plan(self, plan):
         """
         Retrieve the contents of the specified plan.
@@ -292,45 +682,124 @@ class PlansConnection(object):
         """
         get = {'searchname': plan}
         response = self._get_page('read.php', get=get)
-        soup = bs4.BeautifulSoup(response.text, 'html5lib')
-        header = soup.find('div', {'id': 'header'})
+        return self._parse_plan(response)
+
+    @_timed('extract')
+    def _parse_plan(self, response):
+        content = response.content
+        encoding = response.encoding or response.apparent_encoding
+        span = _find_div(content, PLAN_TEXT_TAG)
+        if span is None:
+            # no plan, or not served the way we expect
+            return self._parse_plan_soup(response)
+        # the plan body can be skipped when parsing the header,
+        # since everything else is before or after it
+        start, stop = span
+        parser = PlanHeaderParser()
+        with self.stats.span('decode'):
+            before = content[:start].decode(encoding, 'replace')
+            after = content[stop:].decode(encoding, 'replace')
+        with self.stats.span('parse'):
+            parser.feed(before)
+            parser.feed(after)
+            parser.close()
+        if parser.header is None:
+            return self._parse_plan_soup(response)
+        self._update_autoread(parser)
+        header_dict = self._header_dict(parser.header)
+        if self.slice_text:
+            with self.stats.span('decode'):
+                plan = content[start:stop].decode(encoding, 'replace')
+            if plan.startswith('\n'):
+                plan = plan[1:]  # drop leading newline
+            return header_dict, plan
+        # parse the plan_text div on its own
+        with self.stats.span('decode'):
+            html = content[start - len(PLAN_TEXT_TAG):stop].decode(
+                encoding, 'replace')
+        text = self._soup(html + '</div>').find('div', {'class': 'plan_text'})
+        return header_dict, self._plan_html(text)
+
+    def _parse_plan_soup(self, response):
+        """
+        Parse a plan page in full. Slower than :meth:`_parse_plan`,
+        but does not depend on the exact markup of the plan text div.
+
+        """
+        html = self._decode(response)
+        parser = PlanHeaderParser()
+        with self.stats.span('parse'):
+            parser.feed(html)
+            parser.close()
+        self._update_autoread(parser)
+        soup = self._soup(html)
         text = soup.find('div', {'class': 'plan_text'})
-        if text is None or header is None:
+        if text is None or parser.header is None:
             # probably a nonexistent user
             alert = soup.find('div', {'class': 'alertmessage'})
+            if alert is None:
+                raise PlansError('Could not read plan')
             msg = self._parse_message(alert)
             raise PlansError(msg['title'])
-        # convert header html into a python dictionary
-        header_dict = {}
-        for key in ('username', 'planname'):
-            content = header.find(
-                'li', {'class': key}
-                ).find(
-                'span', {'class': 'value'}
-                ).contents
-            value = str(content[0]) if len(content) > 0 else None
-            header_dict[key] = value
-        for key in ('lastupdated', 'lastlogin'):
-            content = header.find(
-                'li', {'class': key}
-                ).find(
-                'span', {'class': 'value'}
-                ).find(
-                'span', {'class': 'long'}
-                ).contents
-            if len(content) > 0:
-                value = str(content[0])
-                value = parse_plans_date(value, tz_name=self.server_tz)
-            else:
-                value = None
-            header_dict[key] = value
+        return self._header_dict(parser.header), self._plan_html(text)
+
+    def _header_dict(self, header):
+        """ Plan header fields found by :class:`PlanHeaderParser` """
+        header_dict = dict((key, header.get(key))
+                           for key in PlanHeaderParser.FIELDS)
+        dates = [key for key in PlanHeaderParser.DATES
+                 if header_dict[key] is not None]
+        values = parse_plans_dates([header_dict[key] for key in dates],
+                                   tz_name=self.server_tz)
+        header_dict.update(zip(dates, values))
+        return header_dict
+
+    def _plan_html(self, text):
+        """ The contents of the plan_text div ``text``, as served """
         text.hidden = True  # prevents BS from wrapping contents in
                             # <div> upon conversion to unicode string
         plan = text.decode(formatter=self._html_esc)  # soup to unicode
-        assert plan[0] == '\n'  # drop leading newline
-        plan = self._canonicalize_plantext(plan[1:])
-        return header_dict, plan
+        if plan.startswith('\n'):
+            plan = plan[1:]  # drop leading newline
+        return self._canonicalize_plantext(plan)
+
+    @_timed()
+    def read_plans(self, plans, max_workers=4):
+        """
+        Retrieve the contents of several plans at once.
+
+        Up to ``max_workers`` plans are fetched and parsed at the
+        same time, sharing this connection's login and its pool of
+        HTTP connections.
+
+        Returns a list with one 3-tuple per plan, in the order given:
+         - plan name
+         - the (header, text) 2-tuple returned by :meth:`read_plan`,
+           or None if the plan could not be read
+         - the PlansError raised when reading the plan, or None
 
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        import requests.adapters
+        if max_workers > requests.adapters.DEFAULT_POOLSIZE:
+            # let every worker keep its connection open. Other kinds
+            # of adapter, as from clans.cassette, are left in place
+            for prefix in ('http://', 'https://'):
+                adapter = self.session.get_adapter(prefix)
+                if type(adapter) is requests.adapters.HTTPAdapter:
+                    self.session.mount(prefix, requests.adapters.HTTPAdapter(
+                        pool_maxsize=max_workers))
+
+        def read(plan):
+            try:
+                return plan, self.read_plan(plan), None
+            except PlansError as err:
+                return plan, None, err
+
+        with ThreadPoolExecutor(max_workers) as pool:
+            return list(pool.map(read, plans))
+
+    @_timed()
     def search_plans(self, term, planlove=False):
         """
         Search plans for the provided ``term``.
@@ -352,7 +821,11 @@ class PlansConnection(object):
         get = {'mysearch': term,
                'planlove': int(bool(planlove))}
         response = self._get_page('search.php', get=get)
-        soup = bs4.BeautifulSoup(response.text, 'html5lib')
+        return self._parse_search(response)
+
+    @_timed('extract')
+    def _parse_search(self, response):
+        soup = self._soup(self._decode(response))
         results = soup.find('ul', {'id': 'search_results'})
         if results is None:
             return []  # no results
@@ -360,23 +833,69 @@ class PlansConnection(object):
         # on which the result was found
         user_groups = results.findAll(
             'div', {'class': 'result_user_group'})
-        resultlist = []
-        for group in user_groups:
-            user = group.find('a', {'class': 'planlove'}).contents[0]
-            count = group.find('span').contents[0]
-            # now extract snippets
-            snippetlist = group.findAll('li')
-            snippets = []
-            for li in snippetlist:
-                tag = li.find('span')
-                tag.hidden = True  # prevents BS from wrapping contents in
-                                   # <span> upon conversion to unicode string
-                snip = tag.decode(formatter=self._html_esc)  # soup to unicode
-                snip = self._canonicalize_plantext(snip)
-                snippets.append(snip)
-            resultlist.append((str(user), int(count), snippets))
-        return resultlist
+        return [self._parse_result_group(group) for group in user_groups]
+
+    def search_plans_iter(self, term, planlove=False, chunk_size=8192):
+        """
+        Search plans for the provided ``term``, streaming the results.
+
+        This is a generator version of :meth:`search_plans`, yielding
+        the same 3-tuples. The search page is downloaded in chunks of
+        ``chunk_size`` bytes, and each result is yielded as soon as
+        it has been received.
 
+        """
+        get = {'mysearch': term,
+               'planlove': int(bool(planlove))}
+        response = self._get_page('search.php', get=get, stream=True)
+        encoding = response.encoding or 'utf-8'
+        chunks = response.iter_content(chunk_size)
+        scanner = _DivScanner(RESULT_GROUP_TAG)
+        try:
+            while True:
+                with self.stats.span('transfer'):
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                for div in scanner.feed(chunk):
+                    yield self._parse_result_div(div, encoding)
+        finally:
+            self._count_bytes(response)
+            response.close()
+
+    def _parse_result_div(self, div, encoding):
+        """
+        Scrape a search result 3-tuple from the raw bytes of a
+        result_user_group div, as found by :class:`_DivScanner`.
+
+        """
+        with self.stats.span('decode'):
+            html = div.decode(encoding, 'replace')
+        soup = self._soup(html + '</div>')
+        with self.stats.span('extract'):
+            return self._parse_result_group(soup.find(
+                'div', {'class': 'result_user_group'}))
+
+    def _parse_result_group(self, group):
+        """
+        Scrape a search result 3-tuple from a result_user_group div.
+
+        """
+        user = group.find('a', {'class': 'planlove'}).contents[0]
+        count = group.find('span').contents[0]
+        # now extract snippets
+        snippetlist = group.findAll('li')
+        snippets = []
+        for li in snippetlist:
+            tag = li.find('span')
+            tag.hidden = True  # prevents BS from wrapping contents in
+                               # <span> upon conversion to unicode string
+            snip = tag.decode(formatter=self._html_esc)  # soup to unicode
+            snip = self._canonicalize_plantext(snip)
+            snippets.append(snip)
+        return (str(user), int(count), snippets)
+
+    @_timed()
     def planwatch(self, hours=12):
         """
         Return plans updated in the last ``hours`` hours.
@@ -386,13 +905,17 @@ class PlansConnection(object):
         """
         post = {'mytime': str(hours)}
         response = self._get_page('planwatch.php', post=post)
-        soup = bs4.BeautifulSoup(response.text, 'html5lib')
+        return self._parse_planwatch(response)
+
+    @_timed('extract')
+    def _parse_planwatch(self, response):
+        soup = self._soup(self._decode(response))
         results = soup.find('ul', {'id': 'new_plan_list'})
         new_plans = results.findAll('div', {'class': 'newplan'})
-        resultlist = []
+        users = []
+        times = []
         for div in new_plans:
-            user = div.find('a', {'class': 'planlove'}).contents[0]
-            time = div.find('span').contents[0]
-            time = parse_plans_date(time, tz_name=self.server_tz)
-            resultlist.append((user, time))
-        return resultlist
+            users.append(div.find('a', {'class': 'planlove'}).contents[0])
+            times.append(div.find('span').contents[0])
+        times = parse_plans_dates(times, tz_name=self.server_tz)
+        return list(zip(users, times))
@@ -0,0 +1,223 @@
+"""
+Timing and counting the work clans does, for ``clans --stats`` and
+``clans --trace``, and profiling it, for ``clans --profile``.
+
+"""
+
+import cProfile
+import io
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None  # Python 2
+if sys.version_info < (3,):
+    str = unicode
+if sys.version_info >= (2, 7):
+    from collections import OrderedDict
+elif sys.version_info >= (2, 6):
+    from ordereddict import OrderedDict
+
+timer = getattr(time, 'perf_counter', time.time)
+
+_END = object()
+
+
+class Stats(object):
+    """
+    Collects timing spans and counters.
+
+    A span times a named stage of work, such as parsing a page, each
+    time it happens. Spans nest: each has a total time, and its own
+    time, which leaves out the spans opened inside it (on the same
+    thread). Counters add up quantities, such as bytes received.
+
+    If ``trace`` is True, every span is also kept as an event, to be
+    written out by :meth:`write_trace` for a trace viewer.
+
+    """
+
+    def __init__(self, trace=False):
+        self.trace = trace
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        """ Forget all spans, counters and events """
+        with self._lock:
+            self.spans = OrderedDict()  # name -> [calls, total, own]
+            self.counters = OrderedDict()
+            self.events = []
+            self._threads = {}  # thread ids -> names, for the trace
+            self._origin = timer()
+
+    def stop_trace(self):
+        """ Stop keeping events, and forget those kept so far """
+        with self._lock:
+            self.trace = False
+            self.events = []
+            self._threads = {}
+
+    def _stack(self):
+        """ time spent in the child spans of each open span """
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = []
+            return self._local.stack
+
+    @contextmanager
+    def span(self, name, **args):
+        """
+        Time the body of a ``with`` statement as a span.
+
+        Keyword arguments are details to show with the span in a
+        trace. The ``with`` statement gets them as a dictionary, to
+        which more can be added.
+
+        """
+        stack = self._stack()
+        stack.append(0.0)
+        start = timer()
+        try:
+            yield args
+        finally:
+            elapsed = timer() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            self.add_span(name, elapsed, elapsed - children)
+            if self.trace:
+                self._event(name, start, elapsed, args)
+
+    def iterate(self, name, iterable):
+        """
+        Iterate over ``iterable``, timing each step as a span. This
+        is for generators that do their work as they are iterated.
+
+        """
+        it = iter(iterable)
+        while True:
+            with self.span(name):
+                item = next(it, _END)
+            if item is _END:
+                return
+            yield item
+
+    def add_span(self, name, total, own=None):
+        """ Record a span that was timed some other way """
+        with self._lock:
+            span = self.spans.setdefault(name, [0, 0.0, 0.0])
+            span[0] += 1
+            span[1] += total
+            span[2] += total if own is None else own
+
+    def count(self, name, n=1):
+        """ Add ``n`` to the counter ``name`` """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def _event(self, name, start, elapsed, args):
+        thread = threading.current_thread()
+        event = {'name': name, 'ph': 'X', 'pid': os.getpid(),
+                 'tid': thread.ident,
+                 'ts': round((start - self._origin) * 1e6, 3),
+                 'dur': round(elapsed * 1e6, 3)}
+        if args:
+            event['args'] = args
+        with self._lock:
+            self.events.append(event)
+            self._threads.setdefault(thread.ident, thread.name)
+
+    def report(self):
+        """ A table of the spans, longest first, and the counters """
+        width = max([20] + [len(name) for name in self.spans])
+        lines = ['%-*s %6s %12s %12s' % (width, 'span', 'calls', 'total',
+                                         'own')]
+        spans = sorted(self.spans.items(), key=lambda item: -item[1][1])
+        for name, (calls, total, own) in spans:
+            lines.append('%-*s %6d %9.1f ms %9.1f ms'
+                         % (width, name, calls, total * 1e3, own * 1e3))
+        if self.counters:
+            lines.append('')
+            lines.extend('%-*s %6d' % (width, name, n)
+                         for name, n in self.counters.items())
+        return '\n'.join(lines)
+
+    def write_trace(self, fl, **metadata):
+        """
+        Write the events to the file ``fl``, as JSON in the Trace
+        Event Format read by chrome://tracing and Perfetto.
+
+        """
+        with self._lock:
+            events = [{'name': 'thread_name', 'ph': 'M',
+                       'pid': os.getpid(), 'tid': tid,
+                       'args': {'name': name}}
+                      for tid, name in self._threads.items()]
+            events.extend(self.events)
+        fl.write(str(json.dumps({'traceEvents': events,
+                                 'displayTimeUnit': 'ms',
+                                 'otherData': metadata}, default=str)))
+
+
+class Profile(object):
+    """
+    Runs the body of a ``with`` statement under cProfile, and if
+    ``memory`` is True, tracemalloc too, to be saved by :meth:`save`.
+
+    """
+
+    def __init__(self, memory=False, top=30):
+        if memory and tracemalloc is None:
+            raise RuntimeError('Memory profiling requires Python 3.4+')
+        self.memory = memory
+        self.top = top
+        self.profile = cProfile.Profile()
+        self.snapshot = None
+        self.peak = None
+
+    def __enter__(self):
+        self._tracing = self.memory and not tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.start()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profile.disable()
+        if self.memory:
+            self.snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            ])
+            self.peak = tracemalloc.get_traced_memory()[1]
+            if self._tracing:
+                tracemalloc.stop()
+
+    def save(self, path):
+        """
+        Save the profile to ``path + '.pstats'``, and the top
+        allocation sites to ``path + '.memory.txt'``. Returns the
+        paths written.
+
+        """
+        written = [path + '.pstats']
+        self.profile.dump_stats(written[0])
+        if self.snapshot is not None:
+            written.append(path + '.memory.txt')
+            stats = self.snapshot.statistics('lineno')
+            with io.open(written[1], 'w') as fl:
+                fl.write(str('peak %.1f KiB, %.1f KiB in %d blocks at end\n'
+                             % (self.peak / 1024.,
+                                sum(stat.size for stat in stats) / 1024.,
+                                sum(stat.count for stat in stats))))
+                for stat in stats[:self.top]:
+                    fl.write(str('%s\n' % stat))
+        return written
@@ -6,23 +6,22 @@ from __future__ import print_function
 import os
 import sys
 import io
-if sys.version_info >= (3,3):
-    from http.cookiejar import LWPCookieJar
-elif sys.version_info < (3,):
+import json
+import time
+if sys.version_info < (3,):
     str = unicode
-    from cookielib import LWPCookieJar
-elif sys.version_info >= (3,):
+elif sys.version_info < (3,3):
     sys.stderr.write('Clans requires Python 3.3+')
     sys.exit(1)
 
 
 import tempfile
 import subprocess
-import pydoc
-from clans.scraper import PlansConnection, PlansError
 import getpass as getpass_mod
 import argparse
 import clans.fmt
+from clans.stats import Stats, Profile, timer
+from contextlib import contextmanager
 
 if sys.version_info >= (2, 7):
     from collections import OrderedDict
@@ -82,12 +81,60 @@ def getpass(*args, **kwargs):
     return password
 
 
-def pager(text):
-    """ unicode version of pager for py2 """
-    if sys.version_info < (3,):
-        # convert to bytestring
-        text = text.encode('utf8')
-    pydoc.pager(text)
+def _pager_command():
+    """
+    Return the command to page output with, '' to write output
+    straight to stdout, or None to leave it to pydoc.
+
+    """
+    if not (sys.stdin.isatty() and sys.stdout.isatty()):
+        return ''
+    cmd = os.environ.get('MANPAGER') or os.environ.get('PAGER')
+    if cmd:
+        return cmd
+    if sys.platform == 'win32' or os.environ.get('TERM') in ('dumb', 'emacs'):
+        return None
+    if subprocess.call('(less) 2>/dev/null', shell=True) == 0:
+        return 'less'
+    return None
+
+
+def pager(chunks):
+    """
+    Show text one screen at a time.
+
+    ``chunks`` is a string, or an iterable of strings, which are
+    passed on to the pager as they are produced.
+
+    """
+    if isinstance(chunks, str):
+        chunks = [chunks]
+    cmd = _pager_command()
+    if cmd is None:
+        import pydoc
+        text = ''.join(chunks)
+        if sys.version_info < (3,):
+            # convert to bytestring
+            text = text.encode('utf8')
+        pydoc.pager(text)
+    elif not cmd:
+        for chunk in chunks:
+            print(chunk, end='')
+    else:
+        encoding = getattr(sys.stdout, 'encoding', None) or 'utf8'
+        proc = subprocess.Popen(cmd, shell=True, stdin=subprocess.PIPE)
+        try:
+            for chunk in chunks:
+                proc.stdin.write(chunk.encode(encoding, 'backslashreplace'))
+            proc.stdin.close()
+        except (IOError, OSError):
+            pass  # the user quit the pager early
+        while True:
+            try:
+                proc.wait()
+                break
+            except KeyboardInterrupt:
+                pass  # let the pager handle it
 
 
 class CommandSet(dict):
@@ -146,6 +193,7 @@ class CommandSet(dict):
 
 def edit(cs, pc=None):
     """ plan-editing command """
+    from clans.scraper import PlansError
     pc = pc or cs.make_plans_connection()
 
     plan_text, md5 = pc.get_edit_text()
@@ -188,17 +236,55 @@ def edit(cs, pc=None):
 
 def read(cs, pc=None, fmt=None):
     """ plan-reading command """
+    from clans.scraper import PlansError
     pc = pc or cs.make_plans_connection()
     fmt = fmt or cs.make_formatter()
+    cache = cs.make_plan_cache()
 
-    try:
-        header, plan = pc.read_plan(cs.args['plan'])
-    except PlansError as e:
-        print(e, file=sys.stderr)
+    if len(cs.args['plan']) == 1:
+        try:
+            if cache is None:
+                header, plan = pc.read_plan(cs.args['plan'][0])
+            else:
+                header, plan = cache.read_plan(pc, cs.args['plan'][0])
+        except PlansError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+
+        cs.page(_iter_pages(fmt, [(header, plan)]))
+        return
+
+    # several plans: fetch them all at once
+    plans = []
+    failed = False
+    if cache is None:
+        results = pc.read_plans(cs.args['plan'])
+    else:
+        results = cache.read_plans(pc, cs.args['plan'])
+    for name, result, err in results:
+        if err is not None:
+            print('[%s]: %s' % (name, err), file=sys.stderr)
+            failed = True
+            continue
+        plans.append(result)
+    if plans:
+        cs.page(_iter_pages(fmt, plans))
+    if failed:
         sys.exit(1)
 
-    plan = fmt.filter_html(plan)
-    pager(fmt.format_plan(plan=plan, **header))
+
+def _iter_pages(fmt, plans):
+    """
+    Format (header, plan) pairs one after another, as the pager asks
+    for them.
+
+    """
+    for i, (header, plan) in enumerate(plans):
+        if i:
+            yield fmt.page_break
+        plan = fmt.filter_html(plan)
+        for chunk in fmt.iter_plan(plan=plan, **header):
+            yield chunk
 
 
 def autoread(cs, pc=None, fmt=None):
@@ -216,8 +302,12 @@ def love(cs, pc=None, fmt=None):
     fmt = fmt or cs.make_formatter()
 
     cs.hook('pre_search', pc.username, planlove=True)
-    results = pc.search_plans(pc.username, planlove=True)
-    cs.hook('post_search', results)
+    results = pc.search_plans_iter(pc.username, planlove=True)
+    if cs.has_hook('post_search'):
+        # extensions may reorder or filter the result list,
+        # so it has to be complete before printing
+        results = list(results)
+        cs.hook('post_search', results)
     fmt.print_search_results(results)
 
 
@@ -227,8 +317,10 @@ def search(cs, pc=None, fmt=None):
     fmt = fmt or cs.make_formatter()
 
     cs.hook('pre_search', cs.args['term'], planlove=cs.args['love'])
-    results = pc.search_plans(cs.args['term'], planlove=cs.args['love'])
-    cs.hook('post_search', results)
+    results = pc.search_plans_iter(cs.args['term'], planlove=cs.args['love'])
+    if cs.has_hook('post_search'):
+        results = list(results)
+        cs.hook('post_search', results)
     fmt.print_search_results(results)
 
 
@@ -238,7 +330,13 @@ def watch(cs, pc=None, fmt=None):
     fmt = fmt or cs.make_formatter()
 
     results = pc.planwatch(hours=cs.args['hours'])
-    fmt.print_list([un for un,t in results])
+    fmt.print_planwatch(results)
+
+
+def daemon(cs):
+    """ command to serve other commands from a running process """
+    from clans.daemon import serve
+    serve(cs)
 
 
 def config(cs):
@@ -259,10 +357,14 @@ if sys.version_info >= (3,3):
 elif sys.version_info < (3,):
     from ConfigParser import ConfigParser
 
-import appdirs
 import importlib
 
 
+def _user_data_dir():
+    import appdirs
+    return appdirs.user_data_dir(appname='clans', appauthor='baldwint')
+
+
 class ClansSession(object):
     """
     This object is created on each `clans` incantation as a storage
@@ -275,19 +377,31 @@ class ClansSession(object):
         # profile folder: either passed directly (for testing only),
         # set by CLANS_DIR environment variable, or the standard user
         # data directory for this OS
-        self.profile_dir = profile_dir or (
-            os.environ.get('CLANS_DIR', '')
-            or appdirs.user_data_dir(appname='clans',
-                                     appauthor='baldwint'))
+        self.profile_dir = (profile_dir or os.environ.get('CLANS_DIR', '')
+                            or _user_data_dir())
 
         # config file location: in data directory
         self.config_loc = os.path.join(self.profile_dir, 'clans.cfg')
 
+        # plan cache opened by make_plan_cache, if any
+        self._plan_cache = None
+
+        # timings of the work done by each command, for --stats and
+        # --trace. Tracing starts now, before we know if it's wanted,
+        # and stops once the arguments say it isn't
+        self.stats = Stats(trace=True)
+
         # load config, extensions, and define command line args
-        self.config = self._load_config()
-        self.extensions = self._load_extensions()
+        with self.stats.span('load_config'):
+            self.config = self._load_config()
+        # extension hooks slower than this (in seconds) get a warning
+        self.hook_budget = self._load_hook_budget()
+        with self.stats.span('load_extensions'):
+            self.extensions = self._load_extensions()
+            self._hooks = {}  # dispatch table, filled in by _dispatch
         self.formatters = self._load_formatters()
-        self.commands = self._load_commands()
+        with self.stats.span('load_commands'):
+            self.commands = self._load_commands()
 
         # let extensions modify command list
         self.hook('post_load_commands')
@@ -300,6 +414,10 @@ class ClansSession(object):
         # get command line arguments
         self.args = self.commands.main.parse_args(argv)
         self.args = vars(self.args)
+        if self.args['trace']:
+            self.stats.trace = True
+        else:
+            self.stats.stop_trace()
 
         # let command line args override equivalent config file settings
         self.username = (self.args['username'] or
@@ -308,10 +426,56 @@ class ClansSession(object):
         try:
             # pass execution to the subcommand
             func = self.args['func']
-            func(self)
+            with self.stats.span(func.__name__):
+                with self._profile():
+                    func(self)
         finally:
             # do this part always, even if subcommand fails
-            self.finish()
+            with self.stats.span('finish'):
+                self.finish()
+            self._report_stats()
+
+    def _report_stats(self):
+        """
+        Print the stats and write the trace, if asked to, and start
+        over for the next command.
+
+        """
+        if self.args['stats']:
+            print(self.stats.report(), file=sys.stderr)
+        if self.args['trace']:
+            with io.open(self.args['trace'], 'w') as fl:
+                self.stats.write_trace(fl, command=self.args['func'].__name__,
+                                       clans=clans.__version__)
+        self.stats.reset()
+
+    @contextmanager
+    def _profile(self):
+        """
+        Profile the body of the ``with`` statement, if asked to with
+        --profile, and save the results in the profile directory.
+
+        """
+        memory = self.args['profile_memory']
+        if not (self.args['profile'] or memory):
+            yield
+            return
+        try:
+            profile = Profile(memory=memory)
+        except RuntimeError as err:
+            print(err, file=sys.stderr)
+            profile = Profile()
+        try:
+            with profile:
+                yield
+        finally:
+            dest = os.path.join(self.profile_dir, 'profiles')
+            if not os.path.isdir(dest):
+                os.makedirs(dest)
+            name = '%s-%s-%d' % (self.args['func'].__name__,
+                                 time.strftime('%Y%m%d-%H%M%S'), os.getpid())
+            for path in profile.save(os.path.join(dest, name)):
+                print('Profile written to %s' % path, file=sys.stderr)
 
     def _load_config(self):
         # set config file defaults
@@ -319,12 +483,17 @@ class ClansSession(object):
         config.add_section('login')
         config.set('login', 'username', '')
         config.set('login', 'url', 'https://www.grinnellplans.com')
+        config.set('login', 'verify_interval', '3600')
         config.add_section('clans')
         # text editor: either specified in config file, or $EDITOR, or pico
         config.set('clans', 'editor', os.environ.get('EDITOR', 'pico'))
         config.set('clans', 'format', 'raw')
         config.set('clans', 'timezone', '')
         config.set('clans', 'date_format', '')
+        config.set('clans', 'parser', 'html5lib')
+        config.set('clans', 'cache', 'no')
+        config.set('clans', 'cache_hours', '6')
+        config.set('clans', 'hook_budget', '')
 
         # create profile directory if it doesn't exist
         try:
@@ -338,6 +507,22 @@ class ClansSession(object):
 
         return config
 
+    def _load_hook_budget(self):
+        """
+        Read the ``hook_budget`` config option, in seconds, or None
+        if it is not set.
+
+        """
+        budget = self.config.get('clans', 'hook_budget')
+        if not budget:
+            return None
+        try:
+            return float(budget) / 1e3
+        except ValueError:
+            print('hook_budget must be a number of milliseconds, not "%s"'
+                  % budget, file=sys.stderr)
+            sys.exit(1)
+
     def _load_extensions(self):
         """
         Load Clans extensions.
@@ -354,7 +539,8 @@ class ClansSession(object):
                         # if no value is specified,
                         # assume it is for a built-in extension
                         path = 'clans.ext.%s' % name
-                    mod = importlib.import_module(path)
+                    with self.stats.span('import %s' % name, module=path):
+                        mod = importlib.import_module(path)
                     assert mod.__name__ == path
                 except ImportError:
                     print('Failed to load extension "%s".' % name,
@@ -371,27 +557,81 @@ class ClansSession(object):
         formatters = {
             'raw': clans.fmt.RawFormatter,
             'json': clans.fmt.JSONFormatter,
+            'ndjson': clans.fmt.NDJSONFormatter,
             'text': clans.fmt.TextFormatter,
             'color': clans.fmt.ColorFormatter,
             }
         return formatters
 
-    def hook(self, name, *args, **kwargs):
+    def _dispatch(self, name):
         """
-        Call the method named ``name`` in every loaded extension.
+        Find the extensions that implement hook ``name``. They are
+        looked up the first time the hook is called, and kept in the
+        dispatch table after that.
 
-        Returns: a list of return values.
+        Returns: a list of (index, extension name, function, span
+        name) for each extension that implements it, where index is
+        the extension's place in the order they were loaded.
 
         """
-        def run_hook(ext, name):
+        try:
+            return self._hooks[name]
+        except KeyError:
+            pass
+        entries = []
+        for i, (ext_name, ext) in enumerate(self.extensions.items()):
             func = getattr(ext, name, None)
             if func is not None:
-                return func(self, *args, **kwargs)
-            else:
-                return None
-        results = [run_hook(ext, name) for ext in self.extensions.values()]
+                entries.append((i, ext_name, func,
+                                '%s.%s' % (ext_name, name)))
+        self._hooks[name] = entries
+        return entries
+
+    def add_extension(self, name, ext):
+        """
+        Load the module ``ext`` as an extension named ``name``, after
+        startup. Its hooks are called from the next hook on.
+
+        """
+        self.extensions[name] = ext
+        self._hooks = {}
+
+    def hook(self, name, *args, **kwargs):
+        """
+        Call the method named ``name`` in every loaded extension.
+
+        Returns: a list of return values, one per extension (None
+        for those that don't implement the hook).
+
+        """
+        results = [None] * len(self.extensions)
+        for i, ext_name, func, span in self._dispatch(name):
+            start = timer()
+            with self.stats.span(span, extension=ext_name, hook=name):
+                results[i] = func(self, *args, **kwargs)
+            self._check_hook_budget(ext_name, name, timer() - start)
         return results
 
+    def _check_hook_budget(self, ext_name, name, elapsed):
+        """
+        Warn if an extension took longer than the ``hook_budget``
+        config option allows to run a hook.
+
+        """
+        if self.hook_budget is None or elapsed <= self.hook_budget:
+            return
+        self.stats.count('slow hooks')
+        print('Extension "%s" took %.0f ms in %s (hook_budget is %.0f ms)'
+              % (ext_name, elapsed * 1e3, name, self.hook_budget * 1e3),
+              file=sys.stderr)
+
+    def has_hook(self, name):
+        """
+        Return True if any loaded extension implements hook ``name``.
+
+        """
+        return bool(self._dispatch(name))
+
     def _load_commands(self):
         # define command line arguments
 
@@ -410,6 +650,25 @@ class ClansSession(object):
             '--logout', dest='logout',
             action='store_true', default=False,
             help='Log out before quitting.')
+        global_parser.add_argument(
+            '--stats', dest='stats',
+            action='store_true', default=False,
+            help='When the command finishes, print how long it spent'
+                 ' waiting on the network, parsing pages, and so on.')
+        global_parser.add_argument(
+            '--trace', dest='trace', metavar='FILE', default=None,
+            help='Write a timeline of the command to FILE, to open'
+                 ' in chrome://tracing or ui.perfetto.dev.')
+        global_parser.add_argument(
+            '--profile', dest='profile',
+            action='store_true', default=False,
+            help='Run the command under cProfile, and save the results'
+                 ' to the profiles folder of the profile directory.')
+        global_parser.add_argument(
+            '--profile-memory', dest='profile_memory',
+            action='store_true', default=False,
+            help='Like --profile, and also save the places that'
+                 ' allocated the most memory.')
         global_parser.add_argument(
             '--version', action='version',
             version='%(prog)s ' + clans.__version__,
@@ -447,8 +706,9 @@ class ClansSession(object):
             description="Read someone else's plan.",
             help="Read a plan.",)
         commands["read"].add_argument(
-            'plan', default=False, metavar='PLAN',
-            help="Name of plan to be read.")
+            'plan', nargs='+', metavar='PLAN',
+            help="Name of plan to be read. Give several to read them"
+            " all at once.")
 
         # autoread list parser
         commands.add_command(
@@ -485,6 +745,14 @@ class ClansSession(object):
             default=12, metavar='HOURS',
             help="Specify how many hours' worth of plan updates to show.")
 
+        # daemon parser
+        commands.add_command(
+            'daemon', daemon, parents=[global_parser],
+            description="Stay logged in, and run other clans commands"
+            " from this process until interrupted. This saves"
+            " starting up and logging in every time.",
+            help="Run clans commands from a background process.")
+
         # config parser
         commands.add_command(
             'config', config, parents=[global_parser, filter_parser],
@@ -504,6 +772,15 @@ class ClansSession(object):
         Connects to plans, prompting for passwords if necessary
 
         """
+        # the scraper and cookie jar are slow to import, so they
+        # are only imported by commands that connect to plans
+        with self.stats.span('import scraper'):
+            from clans.scraper import PlansConnection, PlansError
+            if sys.version_info >= (3,):
+                from http.cookiejar import LWPCookieJar
+            else:
+                from cookielib import LWPCookieJar
+
         # create a cookie
         self.cookie = LWPCookieJar(
             os.path.join(self.profile_dir, '%s.cookie' % self.username))
@@ -513,23 +790,129 @@ class ClansSession(object):
             pass                # no cookie saved for this user
 
         # create plans connection using cookie
-        pc = PlansConnection(self.cookie,
-                             base_url=self.config.get('login', 'url'))
-
-        if pc.plans_login():
-            pass           # we're still logged in
+        try:
+            # mostly importing bs4 and requests
+            with self.stats.span('open_connection'):
+                pc = PlansConnection(
+                    self.cookie, base_url=self.config.get('login', 'url'),
+                    parser=self.config.get('clans', 'parser'),
+                    relogin=self._relogin, stats=self.stats)
+        except PlansError as err:
+            print(err, file=sys.stderr)
+            sys.exit(1)
+
+        # record or replay traffic, if asked to by the environment
+        record = os.environ.get('CLANS_RECORD')
+        replay = os.environ.get('CLANS_REPLAY')
+        if record or replay:
+            from clans.cassette import use_cassette
+            use_cassette(pc.session, record=record, replay=replay)
+
+        session = self._load_session_info()
+        if session is not None:
+            # logged in recently enough to skip checking. If it turns
+            # out we aren't, the connection will call _relogin
+            pc.username = session['username']
+        elif pc.plans_login():
+            self._save_session_info(pc)  # we're still logged in
         else:
             # we're not logged in, prompt for password if necessary
-            password = (self.args['password'] or
-                        getpass("[%s]'s password: " % self.username))
-            success = pc.plans_login(self.username, password)
-            if not success:
-                print('Failed to log in as [%s].' % self.username,
-                      file=sys.stderr)
-                sys.exit(1)
+            self._relogin(pc)
 
         return pc
 
+    def _relogin(self, pc):
+        """
+        Log ``pc`` in, prompting for a password if necessary.
+
+        """
+        password = (self.args['password'] or
+                    getpass("[%s]'s password: " % self.username))
+        success = pc.plans_login(self.username, password)
+        if not success:
+            print('Failed to log in as [%s].' % self.username,
+                  file=sys.stderr)
+            sys.exit(1)
+        self._save_session_info(pc)
+        return success
+
+    def _session_info_loc(self):
+        return os.path.join(self.profile_dir, '%s.session' % self.username)
+
+    def _load_session_info(self):
+        """
+        Read back the login recorded by ``_save_session_info``.
+
+        Returns None if there is no record of a login that was
+        verified within the last ``verify_interval`` seconds, and
+        whose cookie has not yet expired.
+
+        """
+        interval = self.config.getint('login', 'verify_interval')
+        if len(self.cookie) == 0:
+            return None
+        try:
+            with io.open(self._session_info_loc(), 'r') as fl:
+                session = json.load(fl)
+        except (IOError, ValueError):
+            return None
+        now = time.time()
+        if now - session['verified'] > interval:
+            return None
+        if session['expires'] is not None and now > session['expires']:
+            return None
+        return session
+
+    def _save_session_info(self, pc):
+        """
+        Record that ``pc`` has been verified as logged in.
+
+        """
+        expiry = [cookie.expires for cookie in self.cookie
+                  if cookie.expires is not None]
+        session = {'username': pc.username,
+                   'verified': time.time(),
+                   'expires': min(expiry) if expiry else None}
+        with io.open(self._session_info_loc(), 'w') as fl:
+            fl.write(str(json.dumps(session)))
+
+    def make_plan_cache(self):
+        """
+        Open the plan cache in the profile directory.
+
+        Returns None if the plan cache is not enabled.
+
+        """
+        self._plan_cache = self._open_plan_cache()  # closed by finish()
+        return self._plan_cache
+
+    def _open_plan_cache(self):
+        if not self.config.getboolean('clans', 'cache'):
+            return None
+        from clans.cache import PlanCache
+        hours = self.config.get('clans', 'cache_hours')
+        try:
+            hours = float(hours)
+        except ValueError:
+            print('cache_hours must be a number of hours, not "%s"' % hours,
+                  file=sys.stderr)
+            sys.exit(1)
+        return PlanCache(os.path.join(self.profile_dir, 'plans.sqlite'),
+                         max_hours=hours)
+
+    def page(self, chunks):
+        """
+        Show text to the user, one screen at a time.
+
+        ``chunks`` is a string or an iterable of strings, as for
+        :func:`pager`.
+
+        """
+        if not isinstance(chunks, str):
+            chunks = self.stats.iterate('format', chunks)
+        with self.stats.span('page'):
+            pager(chunks)
+
     def make_formatter(self):
         """
         Initialize and return the appropriate output formatter.
@@ -542,25 +925,41 @@ class ClansSession(object):
         # if a key is None, remove it and rely on the default
         kwargs = dict((k,v) for k,v in kwargs.items() if v is not None)
         fmt = Fmt(**kwargs)
+        fmt.stats = self.stats
         return fmt
 
     def finish(self):
         """
         Cookie-related cleanup.
 
-        Either save the updated cookie, or delete it to log out
+        Either save the updated cookie, or delete it to log out.
+        Also closes the plan cache, if one was opened.
 
         """
+        if self._plan_cache is not None:
+            self._plan_cache.close()
+            self._plan_cache = None
         if not hasattr(self, 'cookie'):
             return  # no plans connection was made
         elif self.args['logout']:
             os.unlink(self.cookie.filename)
+            if os.path.exists(self._session_info_loc()):
+                os.unlink(self._session_info_loc())
         else:
             # save cookie
             self.cookie.save()
 
 
 def main():
+    # if a daemon is running, let it do the work. Not when recording
+    # or replaying, though, which the daemon would know nothing of
+    if not any(os.environ.get(name) for name in
+               ('CLANS_NO_DAEMON', 'CLANS_RECORD', 'CLANS_REPLAY')):
+        from clans.daemon import run_client
+        profile_dir = os.environ.get('CLANS_DIR', '') or _user_data_dir()
+        status = run_client(profile_dir, sys.argv[1:])
+        if status is not None:
+            sys.exit(status)
     cs = ClansSession()
     cs.run()
 
@@ -1,7 +1,5 @@
 from hashlib import md5
 import re
-import dateutil.parser
-import pytz
 from datetime import datetime
 
 import json
@@ -33,26 +31,154 @@ naive datetimes that are assumed to be UTC.
 """
 
 
-def json_output(dic):
+class DatetimeEncoder(json.JSONEncoder):
+    """ Handles encoding of datetimes as ISO 8601 format text in JSON """
+    def default(self, obj):
+        if isinstance(obj, datetime):
+            return obj.strftime(ISO8601_UTC_FMT)
+        return json.JSONEncoder.default(self, obj)
+
+
+# encoders for json_output, keyed by (compact, sort_keys).
+# separators are given, since python prior to 3.4 put spaces after
+# commas in indented json
+_ENCODERS = {
+    (False, False): DatetimeEncoder(indent=2, separators=(',', ': ')),
+    (False, True): DatetimeEncoder(indent=2, separators=(',', ': '),
+                                   sort_keys=True),
+    (True, False): DatetimeEncoder(separators=(',', ':'),
+                                   ensure_ascii=False),
+    (True, True): DatetimeEncoder(separators=(',', ':'),
+                                  ensure_ascii=False, sort_keys=True),
+    }
+
+_fast_dumps = None
+
+
+def _datetime_default(obj):
+    if isinstance(obj, datetime):
+        return obj.strftime(ISO8601_UTC_FMT)
+    raise TypeError('%r is not JSON serializable' % (obj,))
+
+
+def _load_fast_dumps():
+    """
+    Return a function to make compact JSON with orjson or ujson, if
+    either is installed, or False.
+
+    """
+    try:
+        import orjson
+    except ImportError:
+        pass
+    else:
+        base = (orjson.OPT_PASSTHROUGH_DATETIME |
+                orjson.OPT_NON_STR_KEYS)
+
+        def dumps(obj, sort_keys):
+            option = base | orjson.OPT_SORT_KEYS if sort_keys else base
+            return orjson.dumps(obj, default=_datetime_default,
+                                option=option).decode('utf8')
+        return dumps
+    try:
+        import ujson
+        ujson.dumps(datetime(2000, 1, 1), default=_datetime_default)
+    except (ImportError, TypeError):
+        pass  # not installed, or too old to take a default
+    else:
+        def dumps(obj, sort_keys):
+            return ujson.dumps(obj, default=_datetime_default,
+                               sort_keys=sort_keys, ensure_ascii=False,
+                               escape_forward_slashes=False)
+        return dumps
+    return False
+
+
+def json_output(dic, compact=False):
     """Standard JSON output for clans.
 
     This handles some finer points, like converting datetimes to ISO
     8601 format, stripping whitespace, etc.
+
+    By default the output is indented, for people to read. With
+    ``compact``, it all goes on one line, with no spaces and with
+    non-ASCII characters left as they are. Compact output is made with
+    orjson or ujson, if one is installed.
     """
-    # first, a custom encoder class to handle datetimes
-    class DatetimeEncoder(json.JSONEncoder):
-        """ Handles encoding of datetimes as ISO 8601 format text in JSON """
-        def default(self, obj):
-            if isinstance(obj, datetime):
-                return obj.strftime(ISO8601_UTC_FMT)
-            return json.JSONEncoder.default(self, obj)
+    global _fast_dumps
     # if the provided dictionary is ordered, don't sort
     sort_keys = not isinstance(dic, OrderedDict)
-    string = json.dumps(dic, indent=2,
-                        cls=DatetimeEncoder,
-                        sort_keys=sort_keys)
-    # python prior to 3.4 inserted spaces after commas in json
-    return re.sub(r', \n', ',\n', string)
+    if compact:
+        if _fast_dumps is None:
+            _fast_dumps = _load_fast_dumps()
+        if _fast_dumps:
+            return _fast_dumps(dic, sort_keys)
+    return _ENCODERS[compact, sort_keys].encode(dic)
+
+
+_PLANS_DATE = re.compile(
+    r'\s*(?:[A-Za-z]+,? )?([A-Za-z]+)\.? (\d{1,2})(?:st|nd|rd|th)?,? (\d{4}),?'
+    r' (\d{1,2}):(\d{2})(?::(\d{2}))? ?([AaPp][Mm])\s*$')
+"""The format of dates in plan headers and planwatch, as in
+'Wed January 28th 2015, 5:46 PM'."""
+
+_MONTHS = dict((name.lower(), i + 1) for i, name in enumerate(
+    ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+     'August', 'September', 'October', 'November', 'December']))
+_MONTHS.update((name[:3], i) for name, i in list(_MONTHS.items()))
+
+_TIMEZONES = {}
+_OFFSETS = {}
+
+
+def _utcoffset(dt, tz_name):
+    """
+    The UTC offset in the time zone ``tz_name``, at the naive local
+    time ``dt``.
+
+    Offsets are cached by the quarter hour, since time zones change
+    their offsets on the hour, or sometimes on the half or quarter
+    hour.
+
+    """
+    quarter = dt.minute - dt.minute % 15
+    key = (tz_name, dt.year, dt.month, dt.day, dt.hour, quarter)
+    try:
+        return _OFFSETS[key]
+    except KeyError:
+        pass
+    try:
+        tz = _TIMEZONES[tz_name]
+    except KeyError:
+        import pytz
+        tz = _TIMEZONES[tz_name] = pytz.timezone(tz_name)
+    if len(_OFFSETS) > 10000:
+        _OFFSETS.clear()
+    start = dt.replace(minute=quarter, second=0, microsecond=0)
+    offset = _OFFSETS[key] = tz.localize(start).utcoffset()
+    return offset
+
+
+def _parse_local_date(string):
+    """
+    Parse a date in the format Plans uses, without dateutil. Returns
+    a naive datetime, or None if the string is in some other format.
+
+    """
+    match = _PLANS_DATE.match(string)
+    if match is None:
+        return None
+    month, day, year, hour, minute, second, ampm = match.groups()
+    month = _MONTHS.get(month.lower())
+    hour = int(hour)
+    if month is None or not 1 <= hour <= 12:
+        return None
+    hour = hour % 12 + (12 if ampm.upper() == 'PM' else 0)
+    try:
+        return datetime(int(year), month, int(day), hour, int(minute),
+                        int(second or 0))
+    except ValueError:
+        return None
 
 
 def parse_plans_date(string, tz_name='US/Central'):
@@ -67,8 +193,18 @@ def parse_plans_date(string, tz_name='US/Central'):
 
     """
     # first, parse the string format. This yields a naive datetime
-    dt = dateutil.parser.parse(string)
-    # now add the timezone information
-    dt = pytz.timezone(tz_name).localize(dt)
-    # convert to UTC and make it naive again
-    return dt.astimezone(pytz.utc).replace(tzinfo=None)
+    dt = _parse_local_date(string)
+    if dt is None:
+        import dateutil.parser
+        dt = dateutil.parser.parse(string)
+    # now convert from local time to UTC
+    return dt - _utcoffset(dt, tz_name)
+
+
+def parse_plans_dates(strings, tz_name='US/Central'):
+    """Convert a list of date strings to python datetimes.
+
+    See :func:`parse_plans_date`.
+
+    """
+    return [parse_plans_date(string, tz_name) for string in strings]
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 from setuptools import setup
+from setuptools.command.build_py import build_py
 import sys
 
 # build dependency list
@@ -8,7 +9,9 @@ reqs = ['appdirs', 'beautifulsoup4', 'html5lib', 'colorama',
         'requests', 'pytz', 'python-dateutil', 'babel']
 extras = {'tests': ['pymysql', 'coverage',
                     'pytest', 'pytest-cov', 'tox'],
-          'docs':  ['sphinx', ]}
+          'docs':  ['sphinx', ],
+          'lxml':  ['lxml', ],
+          'async': ['aiohttp', ]}
 
 if sys.version_info < (3, 3):
     extras['tests'].append('mock')
@@ -16,15 +19,26 @@ if sys.version_info < (3, 3):
 if sys.version_info >= (3,):
     pass
 elif sys.version_info >= (2, 7):
-    pass
+    reqs.append('futures')
 elif sys.version_info >= (2, 6):
-    reqs.extend(['argparse', 'ordereddict', 'importlib'])
+    reqs.extend(['argparse', 'ordereddict', 'importlib', 'futures'])
     extras['tests'].append('unittest2')
     extras['tests'].append('subprocess32')
 else:
     sys.stderr.write("Clans requires Python 2.6+ or 3.3+\n")
     sys.exit(1)
 
+
+
+class BuildPy(build_py):
+    """ Leave out clans.aio, which needs Python 3.6+ to compile """
+
+    def find_package_modules(self, package, package_dir):
+        modules = build_py.find_package_modules(self, package, package_dir)
+        if sys.version_info < (3, 6):
+            modules = [m for m in modules if m[:2] != ('clans', 'aio')]
+        return modules
+
 # http://stackoverflow.com/a/7071358/735926
 import re
 VERSIONFILE='clans/__init__.py'
@@ -66,6 +80,7 @@ setup(name='clans',
       install_requires=reqs,
       extras_require=extras,
       packages=['clans', 'clans.ext'],
+      cmdclass={'build_py': BuildPy},
       entry_points = {
           'console_scripts': ['clans=clans.ui:main'],
       },
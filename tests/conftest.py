@@ -0,0 +1,4 @@
+import sys
+
+# clans.aio and its tests use syntax that older Pythons cannot compile
+collect_ignore = ['test_aio.py'] if sys.version_info < (3, 6) else []
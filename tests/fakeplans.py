@@ -0,0 +1,576 @@
+#!/usr/bin/env python
+"""
+A fake GrinnellPlans server, for testing clans offline.
+
+:class:`FakePlansServer` serves the pages that
+:class:`clans.scraper.PlansConnection` uses, in the same form as the
+real site, for a :class:`Corpus` of made-up users. It can be told to
+answer slowly, or to fail some of the time, so that the client and its
+caches can be load tested without touching the real site.
+
+From Python:
+
+    with FakePlansServer(Corpus(1000), latency=0.05) as server:
+        pc = PlansConnection(base_url=server.url)
+        pc.plans_login('user0', 'password')
+        ...
+
+Or from the command line, for clans to use by setting ``url`` in the
+``[login]`` section of its config to the address printed:
+
+    python tests/fakeplans.py --users 1000 --port 8000 --latency 0.05
+
+Every user's password is 'password'.
+
+"""
+
+from __future__ import print_function, unicode_literals
+
+import sys
+if sys.version_info >= (3,):
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+    from http.cookies import SimpleCookie
+else:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+    from Cookie import SimpleCookie
+
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from email.utils import formatdate
+from datetime import datetime, timedelta
+
+import pytz
+
+if __name__ == '__main__':
+    # run as a script: use the clans next to it, installed or not
+    HERE = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.dirname(HERE))
+
+from clans.util import plans_md5, convert_endings
+
+PASSWORD = 'password'
+
+WORDS = ('the plan of a fake user has words in it like gorp and climb '
+         'and the dining hall and a quiet aside about the weather or '
+         'what is for dinner tonight and maybe a link').split()
+
+LEVELS = 3
+
+
+def _ordinal(n):
+    if 10 <= n % 100 < 20:
+        return '%dth' % n
+    return '%d%s' % (n, {1: 'st', 2: 'nd', 3: 'rd'}.get(n % 10, 'th'))
+
+
+def plans_date(dt, tz):
+    """ Format a UTC datetime as Plans does, in timezone ``tz`` """
+    local = pytz.utc.localize(dt).astimezone(tz)
+    hour = local.hour % 12 or 12
+    return '%s %s %s %d, %d:%02d %s' % (
+        local.strftime('%a'), local.strftime('%B'), _ordinal(local.day),
+        local.year, hour, local.minute, local.strftime('%p'))
+
+
+def escape(text):
+    """ Escape text for html, as Plans does """
+    for char, entity in (('&', '&amp;'), ('<', '&lt;'), ('>', '&gt;'),
+                         ('"', '&quot;')):
+        text = text.replace(char, entity)
+    return text
+
+
+def render(text):
+    """
+    Render the edit text of a plan as html.
+
+    This is a small part of what Plans does: a few tags are allowed,
+    [name] and [name:text] become planlove, and newlines become <br>.
+
+    """
+    html = escape(text)
+    html = re.sub(r'&lt;(/?(?:b|i|tt))&gt;', r'<\1>', html)
+    html = html.replace('&lt;hr&gt;\n', '<hr>').replace('&lt;hr&gt;', '<hr>')
+    html = re.sub(r'\[(\w+)(?::([^\]\n]+))?\]', lambda m: (
+        '[<a href="read.php?searchname=%s" class="planlove">%s</a>]'
+        % (m.group(1), m.group(2) or m.group(1))), html)
+    return html.replace('\n', '<br>\n')
+
+
+class User(object):
+    """ A fake Plans user """
+
+    def __init__(self, username, plan, lastupdated, lastlogin):
+        self.username = username
+        self.planname = username.capitalize()
+        self.plan = plan  # edit text, with LF line endings
+        self.lastupdated = lastupdated
+        self.lastlogin = lastlogin
+        self.autoread = {}  # level -> set of usernames
+        self.lastread = {}  # username -> when this user last read it
+
+
+class Corpus(object):
+    """
+    A synthetic set of ``size`` Plans users, named 'user0' and so on.
+
+    Plans are made of random words, with planlove for other users, and
+    were updated at random in the ``days`` before ``now``. Each user
+    has some others on their autoread list. The same ``seed`` makes
+    the same corpus.
+
+    """
+
+    def __init__(self, size=100, seed=0, now=None, days=7, lines=10):
+        rnd = random.Random(seed)
+        self.now = now or datetime.utcnow().replace(second=0, microsecond=0)
+        self.lock = threading.Lock()
+        names = ['user%d' % i for i in range(size)]
+        self.users = {}
+        for name in names:
+            text = []
+            for i in range(rnd.randint(1, lines)):
+                words = rnd.sample(WORDS, rnd.randint(3, 12))
+                if rnd.random() < 0.3:
+                    words.insert(rnd.randint(0, len(words)),
+                                 '[%s]' % rnd.choice(names))
+                text.append(' '.join(words))
+            updated = self.now - timedelta(
+                minutes=rnd.randint(0, days * 24 * 60))
+            self.users[name] = User(name, '\n'.join(text), updated,
+                                    updated + timedelta(minutes=5))
+        for user in self.users.values():
+            for name in rnd.sample(names, min(size, 6)):
+                level = rnd.randint(1, LEVELS)
+                user.autoread.setdefault(level, set()).add(name)
+
+    def get(self, username):
+        return self.users.get(username.lower())
+
+    def autoread(self, user):
+        """ The autoread list of ``user``: unread plans, by level """
+        lists = {}
+        for level in range(1, LEVELS + 1):
+            lists[level] = sorted(
+                name for name in user.autoread.get(level, ())
+                if self.users[name].lastupdated >
+                user.lastread.get(name, datetime.min))
+        return lists
+
+    def search(self, term, planlove=False):
+        """
+        Search the plans for ``term``, or for planlove of the user
+        ``term``. Returns (username, count, matching lines) tuples.
+
+        """
+        if planlove:
+            regex = re.compile(r'\[%s(?::[^\]\n]+)?\]' % re.escape(term),
+                               re.IGNORECASE)
+        else:
+            regex = re.compile(re.escape(term), re.IGNORECASE)
+        results = []
+        for name in sorted(self.users):
+            plan = self.users[name].plan
+            count = len(regex.findall(plan))
+            if count:
+                lines = [line for line in plan.split('\n')
+                         if regex.search(line)]
+                results.append((name, count, lines))
+        return results
+
+    def edit(self, user, text, md5):
+        """ Update the plan of ``user``, if ``md5`` is of its text """
+        if md5 != plans_md5(convert_endings(user.plan, 'CRLF')):
+            return False
+        user.plan = convert_endings(text, 'LF')
+        user.lastupdated = datetime.utcnow().replace(second=0, microsecond=0)
+        return True
+
+
+PAGE = '''<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>GrinnellPlans%(title)s</title>
+</head>
+<body id="%(body_id)s">
+<div id="wrapper">
+%(nav)s<div id="main">
+%(main)s</div>
+<div id="footer">
+<a href="https://github.com/grinnellplans/grinnellplans-php/issues/new?body=%%0A%%0A----%%0ASubmitted+by+%%5B%(username)s%%5D+from+%(page)s">Report a bug</a>
+</div>
+</div>
+</body>
+</html>
+'''
+
+LOGIN_PAGE = '''<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>GrinnellPlans</title>
+</head>
+<body id="login">
+<form action="index.php" method="post">
+<input type="text" name="username">
+<input type="password" name="password">
+<input type="submit" name="submit" value="Login">
+</form>
+</body>
+</html>
+'''
+
+
+def _link(name):
+    return ('<a href="read.php?searchname=%s" class="planlove">%s</a>'
+            % (name, name))
+
+
+def _message(kind, title, body):
+    return '<div class="%s"><h3>%s</h3><p>%s</p></div>\n' % (
+        kind, escape(title), escape(body))
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    Serves one request to a :class:`FakePlansServer`.
+
+    Each page is made by the method named in ``PAGES``, which returns
+    its html. Pages other than the login page redirect there unless
+    there is a session cookie.
+
+    """
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # headers and body are sent apart
+
+    PAGES = {'index.php': '_login',
+             'home.php': '_home',
+             'read.php': '_read',
+             'search.php': '_search',
+             'planwatch.php': '_planwatch',
+             'edit.php': '_edit',
+             'api/1/index.php': '_api'}
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._serve({})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf8')
+        self._serve(_params(body))
+
+    def _serve(self, post):
+        server = self.server
+        url = urlparse(self.path)
+        page = url.path.lstrip('/') or 'index.php'
+        server.count(page)
+        if server.latency:
+            time.sleep(server.random.uniform(*server.latency))
+        if server.error_rate and server.random.random() < server.error_rate:
+            return self._send(server.error_status, 'Internal Server Error',
+                              'text/plain')
+        if page not in self.PAGES:
+            return self._send(404, 'Not Found', 'text/plain')
+        user = server.session_user(self.headers.get('Cookie'))
+        if page == 'index.php':
+            return self._login(user, post)
+        if user is None:
+            return self._redirect('index.php')
+        with server.corpus.lock:
+            text = getattr(self, self.PAGES[page])(user, _params(url.query),
+                                                   post)
+        if page.startswith('api/'):
+            self._send(200, text, 'application/json')
+        else:
+            self._send(200, text)
+
+    def _send(self, status, text, content_type='text/html', headers=()):
+        data = text.encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', '%s; charset=utf-8' % content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for header in headers:
+            self.send_header(*header)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _redirect(self, page, headers=()):
+        self.send_response(302)
+        self.send_header('Location', '%s/%s' % (self.server.url, page))
+        self.send_header('Content-Length', '0')
+        for header in headers:
+            self.send_header(*header)
+        self.end_headers()
+
+    def _page(self, user, page, body_id, main, title=''):
+        nav = self._sidebar(user) if page in self.server.sidebar else ''
+        return PAGE % dict(title=' - ' + title if title else '',
+                           body_id=body_id, nav=nav, main=main,
+                           username=user.username, page=page)
+
+    def _sidebar(self, user):
+        lines = ['<div id="nav">', '<ul id="autoread">']
+        for level, names in sorted(self.server.corpus.autoread(user).items()):
+            lines.append('<li class="autoreadlevel">'
+                         '<span class="autoreadname">Level %d</span>' % level)
+            lines.append('<ul class="autoread_level">')
+            lines.extend('<li class="autoreadentry">%s</li>' % _link(name)
+                         for name in names)
+            lines.extend(['</ul>', '</li>'])
+        lines.extend(['</ul>', '</div>', ''])
+        return '\n'.join(lines)
+
+    def _login(self, user, post):
+        # as on Plans, a valid session cookie trumps the password
+        if user is None and 'username' in post:
+            user = self.server.corpus.get(post['username'])
+            if post.get('password') != PASSWORD:
+                user = None
+        if user is None:
+            return self._send(200, LOGIN_PAGE)
+        # a session cookie would not be saved by clans between runs
+        cookie = 'PHPSESSID=%s; Path=/; Expires=%s' % (
+            self.server.new_session(user),
+            formatdate(time.time() + 86400, usegmt=True))
+        self._redirect('home.php', [('Set-Cookie', cookie)])
+
+    def _home(self, user, query, post):
+        return self._page(user, 'home.php', 'home',
+                          '<div id="home_content">\n'
+                          '<h2>Welcome to GrinnellPlans</h2>\n</div>\n',
+                          'Home')
+
+    def _read(self, user, query, post):
+        name = query.get('searchname', '')
+        plan = self.server.corpus.get(name)
+        if plan is None:
+            return self._page(user, 'read.php', 'planread', _message(
+                'alertmessage', 'Could not find plan %s' % name,
+                'There is no user by that name.'))
+        user.lastread[plan.username] = datetime.utcnow()
+        tz = self.server.tz
+        fields = [('username', 'Username', escape(plan.username))]
+        for key, title in (('lastupdated', 'Last Updated'),
+                           ('lastlogin', 'Last Login')):
+            when = getattr(plan, key)
+            local = pytz.utc.localize(when).astimezone(tz)
+            fields.append((key, title, '<span class="long">%s</span>'
+                           '<span class="short">%s</span>' % (
+                               plans_date(when, tz),
+                               local.strftime('%m/%d/%y %I:%M %p'))))
+        fields.append(('planname', 'Name', escape(plan.planname)))
+        main = ['<div id="header">', '<ul>']
+        main.extend('<li class="%s"><span class="title">%s:</span> '
+                    '<span class="value">%s</span></li>' % field
+                    for field in fields)
+        main.extend(['</ul>', '</div>', '<div class="plan_text">',
+                     render(plan.plan), '</div>', ''])
+        return self._page(user, 'read.php', 'planread', '\n'.join(main),
+                          plan.username)
+
+    def _search(self, user, query, post):
+        term = query.get('mysearch', '')
+        results = self.server.corpus.search(
+            term, planlove=query.get('planlove') == '1')
+        main = ['<h2>Search results for %s</h2>' % escape(term)]
+        if not results:
+            main.append('<p>No results found.</p>')
+        else:
+            main.append('<ul id="search_results">')
+            for name, count, lines in results:
+                main.extend(['<li>', '<div class="result_user_group">',
+                             '%s <span>%d</span>' % (_link(name), count),
+                             '<ul>'])
+                main.extend('<li><span>%s</span></li>' % render(line)
+                            for line in lines)
+                main.extend(['</ul>', '</div>', '</li>'])
+            main.append('</ul>')
+        main.append('')
+        return self._page(user, 'search.php', 'search', '\n'.join(main),
+                          'Search')
+
+    def _planwatch(self, user, query, post):
+        hours = int(post.get('mytime') or 12)
+        since = datetime.utcnow() - timedelta(hours=hours)
+        updated = sorted((u for u in self.server.corpus.users.values()
+                          if u.lastupdated > since),
+                         key=lambda u: u.lastupdated, reverse=True)
+        main = ['<h2>Plans updated in the last %d hours</h2>' % hours,
+                '<ul id="new_plan_list">']
+        main.extend('<li><div class="newplan">%s <span>%s</span></div></li>'
+                    % (_link(u.username),
+                       plans_date(u.lastupdated, self.server.tz))
+                    for u in updated)
+        main.extend(['</ul>', ''])
+        return self._page(user, 'planwatch.php', 'planwatch',
+                          '\n'.join(main), 'Planwatch')
+
+    def _edit(self, user, query, post):
+        if 'plan' in post:
+            if self.server.corpus.edit(user, post['plan'],
+                                       post.get('edit_text_md5')):
+                main = _message('infomessage', 'Success',
+                                'Plan changed successfully.')
+            else:
+                main = _message('alertmessage', 'Error',
+                                'Your plan was changed elsewhere since '
+                                'you started editing it.')
+        else:
+            md5 = plans_md5(convert_endings(user.plan, 'CRLF'))
+            main = ('<form action="edit.php" method="post">\n'
+                    '<textarea rows="25" cols="60" name="plan" id="plan">'
+                    '%s</textarea>\n'
+                    '<input type="hidden" name="edit_text_md5" value="%s">\n'
+                    '<input type="submit" name="submit" '
+                    'value="Change Plan">\n'
+                    '</form>\n' % (escape(user.plan), md5))
+        return self._page(user, 'edit.php', 'edit', main, 'Edit Plan')
+
+    def _api(self, user, query, post):
+        if query.get('task') != 'autofingerlist':
+            return json.dumps({'success': False})
+        lists = [{'level': str(level), 'usernames': names}
+                 for level, names in
+                 sorted(self.server.corpus.autoread(user).items())
+                 if names]
+        return json.dumps({'autofingerList': lists})
+
+
+def _params(qs):
+    return dict((key, values[0]) for key, values in
+                parse_qs(qs, keep_blank_values=True).items())
+
+
+class FakePlansServer(ThreadingMixIn, HTTPServer):
+    """
+    An HTTP server that acts like GrinnellPlans, for a :class:`Corpus`.
+
+    Optional keyword arguments:
+
+    latency --     seconds to wait before each response, or a
+                   (min, max) range to wait a random time in.
+    error_rate --  fraction of requests to fail, at random.
+    error_status -- HTTP status of the failures.
+    sidebar --     pages that show the autoread list.
+    server_tz --   timezone of the dates on the pages.
+    seed --        seed for the random latencies and failures.
+
+    Use it as a context manager to serve from a background thread.
+    ``requests`` counts the requests for each page.
+
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, corpus=None, host='127.0.0.1', port=0, latency=0,
+                 error_rate=0, error_status=500,
+                 sidebar=('home.php', 'read.php', 'edit.php'),
+                 server_tz='US/Central', seed=0):
+        if not isinstance(latency, (tuple, list)):
+            latency = (latency, latency)
+        elif len(latency) != 2:
+            raise ValueError('latency must be a number or a (min, max) pair')
+        HTTPServer.__init__(self, (host, port), Handler)
+        self.corpus = corpus or Corpus()
+        self.latency = tuple(latency) if any(latency) else None
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.sidebar = sidebar
+        self.tz = pytz.timezone(server_tz)
+        self.random = random.Random(seed)
+        self.sessions = {}
+        self.requests = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+    def count(self, page):
+        with self._lock:
+            self.requests[page] = self.requests.get(page, 0) + 1
+
+    def new_session(self, user):
+        session = uuid.uuid4().hex
+        with self._lock:
+            self.sessions[session] = user
+        return session
+
+    def session_user(self, cookie_header):
+        if not cookie_header:
+            return None
+        cookie = SimpleCookie(cookie_header)
+        if 'PHPSESSID' not in cookie:
+            return None
+        return self.sessions.get(cookie['PHPSESSID'].value)
+
+    def start(self):
+        """ Serve from a background thread """
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        kwargs={'poll_interval': 0.05})
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self._thread.join()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=100,
+                        help='number of users in the corpus')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, nargs='+', default=[0],
+                        metavar='SECONDS',
+                        help='delay before each response, or a range')
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help='fraction of requests to fail')
+    args = parser.parse_args()
+    if len(args.latency) > 2:
+        parser.error('--latency takes one or two values')
+    latency = args.latency[0] if len(args.latency) == 1 else args.latency
+
+    server = FakePlansServer(Corpus(args.users, seed=args.seed),
+                             host=args.host, port=args.port,
+                             latency=latency,
+                             error_rate=args.error_rate, seed=args.seed)
+    print('Serving %d plans at %s' % (args.users, server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""
+Tests for :mod:`clans.aio`, against a local server of recorded pages.
+
+"""
+
+import io
+import os
+import sys
+import tempfile
+import pytest
+
+if sys.version_info < (3, 6):
+    pytest.skip('asyncio client requires Python 3.6+',
+                allow_module_level=True)
+
+aiohttp = pytest.importorskip('aiohttp')
+import asyncio
+from aiohttp import web
+from http.cookiejar import LWPCookieJar
+
+from clans.aio import AsyncPlansConnection
+from clans.scraper import PlansError
+
+PAGEDIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pages')
+
+
+def page(name):
+    with io.open(os.path.join(PAGEDIR, name), 'rb') as fl:
+        return web.Response(body=fl.read(), content_type='text/html',
+                            charset='utf-8')
+
+
+async def index(request):
+    form = await request.post()
+    if request.cookies.get('PlansAuth') == 'ok':
+        raise web.HTTPFound('home.php')
+    if form.get('password') == 'password':
+        response = web.HTTPFound('home.php')
+        response.set_cookie('PlansAuth', 'ok', max_age=3600)
+        raise response
+    return page('search_empty.html')
+
+
+def logged_in(name):
+    async def handler(request):
+        if request.cookies.get('PlansAuth') != 'ok':
+            raise web.HTTPFound('index.php')
+        if name == 'read.html' and request.query['searchname'] == 'fobar':
+            return page('read_nonexistent.html')
+        return page(name)
+    return handler
+
+
+async def autofinger(request):
+    return web.json_response({'autofingerList': [
+        {'level': '1', 'usernames': ['gorp', 'climb']},
+        {'level': '2', 'usernames': []}]})
+
+
+def run(coro_func):
+    """Run ``coro_func(base_url)`` against a fresh local server."""
+    async def main():
+        app = web.Application()
+        app.router.add_post('/index.php', index)
+        for name in ('home', 'read', 'search', 'edit'):
+            app.router.add_get('/%s.php' % name, logged_in(name + '.html'))
+        app.router.add_post('/edit.php', logged_in('edit_success.html'))
+        app.router.add_post('/planwatch.php', logged_in('planwatch.html'))
+        app.router.add_get('/api/1/index.php', autofinger)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            return await coro_func('http://127.0.0.1:%d' % port)
+        finally:
+            await runner.cleanup()
+    return asyncio.run(main())
+
+
+def test_login():
+    async def go(url):
+        async with AsyncPlansConnection(base_url=url) as pc:
+            assert not await pc.plans_login('baldwint', 'wrong')
+            assert await pc.plans_login('baldwint', 'password')
+            assert pc.username == 'baldwint'
+            # cookie was set on the redirect, and is sent from now on
+            assert await pc.plans_login()
+            return pc
+    pc = run(go)
+    assert [c.name for c in pc.cookiejar] == ['PlansAuth']
+
+
+def test_cookie_file():
+    # cookies saved by the async connection can be loaded by clans
+    fd, name = tempfile.mkstemp(suffix='.cookie')
+    os.close(fd)
+    try:
+        async def go(url):
+            async with AsyncPlansConnection(LWPCookieJar(name),
+                                            base_url=url) as pc:
+                await pc.plans_login('baldwint', 'password')
+                pc.cookiejar.save()
+            jar = LWPCookieJar(name)
+            jar.load()
+            async with AsyncPlansConnection(jar, base_url=url) as pc:
+                return await pc.plans_login()
+        assert run(go)
+    finally:
+        os.unlink(name)
+
+
+def test_scraping():
+    async def go(url):
+        async with AsyncPlansConnection(base_url=url) as pc:
+            await pc.plans_login('baldwint', 'password')
+            plans = await asyncio.gather(*[pc.read_plan('gorp')
+                                           for i in range(20)])
+            search = await pc.search_plans('baldwint', planlove=True)
+            streamed = [result async for result in pc.search_plans_iter(
+                'baldwint', planlove=True, chunk_size=7)]
+            assert streamed == search
+            watch = await pc.planwatch(hours=12)
+            autofinger = await pc.get_autofinger(cached=False)
+            # the home page seen on login has the autoread sidebar
+            assert await pc.get_autofinger() == {
+                'Level 1': ['gorp', 'climb'], 'Level 2': ['rando'],
+                'Level 3': []}
+            edit_text, md5 = await pc.get_edit_text()
+            info = await pc.set_edit_text(edit_text, md5)
+            with pytest.raises(PlansError):
+                await pc.read_plan('fobar')
+            return plans, search, watch, autofinger, info
+    plans, search, watch, autofinger, info = run(go)
+    assert len(plans) == 20
+    header, text = plans[0]
+    assert header['username'] == 'gorp'
+    assert text.startswith('<b>Welcome</b>')
+    assert [un for un, n, snips in search] == ['gorp', 'climb', 'rando']
+    assert [un for un, t in watch] == ['gorp', 'climb', 'rando']
+    assert autofinger == {'Level 1': ['gorp', 'climb'], 'Level 2': []}
+    assert info == 'Plan changed successfully.'
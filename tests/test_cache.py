@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+Unit tests for :mod:`clans.cache`.
+
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+from datetime import datetime, timedelta
+import pytest
+
+if sys.version_info >= (3, 3):
+    import unittest.mock as mock
+else:
+    import mock
+
+from clans.cache import PlanCache
+from clans.scraper import PlansConnection, PlansError
+
+NOW = datetime.utcnow().replace(microsecond=0)
+HEADER = {'username': 'gorp',
+          'planname': 'clever catchphrase',
+          'lastupdated': NOW - timedelta(days=1),
+          'lastlogin': NOW - timedelta(hours=2)}
+
+
+@pytest.fixture
+def cache(request):
+    tmpdir = tempfile.mkdtemp(suffix='.clansprofile')
+    cache = PlanCache(os.path.join(tmpdir, 'plans.sqlite'))
+
+    def cleanup():
+        cache.close()
+        shutil.rmtree(tmpdir)
+    request.addfinalizer(cleanup)
+    return cache
+
+
+@pytest.fixture
+def pc():
+    pc = mock.Mock(spec=PlansConnection)
+    pc.read_plan.return_value = (HEADER, 'plan text')
+    pc.planwatch.return_value = []
+    return pc
+
+
+def test_store(cache):
+    assert cache.get('gorp') is None
+    cache.put('Gorp', HEADER, 'plan text', fetched=NOW)
+    assert cache.get('gorp') == (HEADER, 'plan text', NOW)
+
+
+def test_miss(cache, pc):
+    assert cache.read_plan(pc, 'gorp') == (HEADER, 'plan text')
+    pc.read_plan.assert_called_once_with('gorp')
+    assert cache.get('gorp')[:2] == (HEADER, 'plan text')
+
+
+def test_hit(cache, pc):
+    cache.put('gorp', HEADER, 'old text', fetched=NOW - timedelta(hours=3))
+    # planwatch shows no update, so the stored plan is used
+    assert cache.read_plan(pc, 'gorp') == (HEADER, 'old text')
+    pc.planwatch.assert_called_once_with(hours=5)
+    assert not pc.read_plan.called
+
+
+def test_updated(cache, pc):
+    cache.put('gorp', HEADER, 'old text', fetched=NOW - timedelta(hours=3))
+    pc.planwatch.return_value = [('gorp', NOW - timedelta(hours=1))]
+    assert cache.read_plan(pc, 'gorp') == (HEADER, 'plan text')
+    assert pc.read_plan.called
+
+
+def test_too_old(cache, pc):
+    cache.put('gorp', HEADER, 'old text', fetched=NOW - timedelta(days=30))
+    assert cache.read_plan(pc, 'gorp') == (HEADER, 'plan text')
+    assert not pc.planwatch.called
+
+
+def test_window(cache, pc):
+    # planwatch for longer than a few hours costs more than the plan
+    cache.put('gorp', HEADER, 'old text', fetched=NOW - timedelta(hours=8))
+    assert cache.read_plan(pc, 'gorp') == (HEADER, 'plan text')
+    assert not pc.planwatch.called
+    cache.put('gorp', HEADER, 'old text', fetched=NOW - timedelta(hours=8))
+    cache.max_hours = 12
+    assert cache.read_plan(pc, 'gorp') == (HEADER, 'old text')
+    pc.planwatch.assert_called_once_with(hours=10)
+
+
+def test_planwatch_fails(cache, pc):
+    cache.put('gorp', HEADER, 'old text', fetched=NOW)
+    pc.planwatch.side_effect = PlansError('oops')
+    assert cache.read_plan(pc, 'gorp') == (HEADER, 'plan text')
+
+
+def test_read_plans(cache, pc):
+    fetched = NOW - timedelta(hours=3)
+    for name in ('gorp', 'climb', 'rando'):
+        header = dict(HEADER, username=name)
+        cache.put(name, header, 'old %s' % name, fetched=fetched)
+    pc.planwatch.return_value = [('climb', NOW)]
+    err = PlansError('no such plan')
+    pc.read_plans.return_value = [
+        ('climb', (dict(HEADER, username='climb'), 'new climb'), None),
+        ('fobar', None, err)]
+    results = cache.read_plans(pc, ['gorp', 'climb', 'fobar', 'rando'])
+    assert [(name, result and result[1], e) for name, result, e in results] \
+        == [('gorp', 'old gorp', None), ('climb', 'new climb', None),
+            ('fobar', None, err), ('rando', 'old rando', None)]
+    pc.read_plans.assert_called_once_with(['climb', 'fobar'], max_workers=4)
+    # one planwatch serves every plan
+    assert pc.planwatch.call_count == 1
+    assert cache.get('climb')[1] == 'new climb'
@@ -0,0 +1,148 @@
+"""
+Tests for recording and replaying Plans traffic, with the fake Plans
+server in ``fakeplans.py``.
+
+"""
+
+import io
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from clans.cassette import use_cassette, load, CassetteError
+from clans.scraper import PlansConnection
+
+from fakeplans import FakePlansServer, Corpus, PASSWORD
+
+
+@pytest.fixture
+def cassette():
+    tmpdir = tempfile.mkdtemp()
+    yield os.path.join(tmpdir, 'traffic.jsonl.gz')
+    shutil.rmtree(tmpdir)
+
+
+def connect(url, **kwargs):
+    pc = PlansConnection(base_url=url)
+    use_cassette(pc.session, **kwargs)
+    return pc
+
+
+def session(pc):
+    """ A day's traffic, more or less """
+    assert pc.plans_login('user0', PASSWORD)
+    return [pc.get_autofinger(cached=False),
+            pc.read_plan('user1'),
+            list(pc.search_plans_iter('user0', planlove=True)),
+            pc.read_plans(['user2', 'user3', 'user4']),
+            pc.planwatch(hours=24)]
+
+
+def test_replay(cassette):
+    with FakePlansServer(Corpus(10)) as server:
+        url = server.url
+        recorded = session(connect(url, record=cassette))
+        served = sum(server.requests.values())
+    # the server is gone, but its responses are not
+    replayed = session(connect(url, replay=cassette))
+    assert replayed == recorded
+    assert len(load(cassette)) == served
+
+
+def test_appends(cassette):
+    with FakePlansServer(Corpus(10)) as server:
+        pc = connect(server.url, record=cassette)
+        pc.plans_login('user0', PASSWORD)
+        pc.read_plan('user1')
+        pc = connect(server.url, record=cassette)
+        pc.plans_login('user0', PASSWORD)
+        pc.read_plan('user2')
+    urls = [entry['url'].rsplit('/', 1)[-1] for entry in load(cassette)]
+    assert urls == ['index.php', 'home.php', 'read.php?searchname=user1',
+                    'index.php', 'home.php', 'read.php?searchname=user2']
+
+
+def test_streaming(cassette):
+    with FakePlansServer(Corpus(10)) as server:
+        pc = connect(server.url, record=cassette)
+        pc.plans_login('user0', PASSWORD)
+        response = pc.session.get(server.url + '/search.php',
+                                  params={'mysearch': 'user1'}, stream=True)
+        # nothing is read until asked for
+        assert not response._content_consumed
+        assert len(load(cassette)) == 2
+        chunks = list(response.iter_content(100))
+        results = list(pc.search_plans_iter('user1'))
+    assert results
+    entries = load(cassette)
+    assert len(entries) == 4
+    assert entries[2]['text'].encode('utf8') == b''.join(chunks)
+    assert entries[3]['text'] == entries[2]['text']
+
+
+def test_partial(cassette):
+    with FakePlansServer(Corpus(10)) as server:
+        pc = connect(server.url, record=cassette)
+        pc.plans_login('user0', PASSWORD)
+        response = pc.session.get(server.url + '/read.php',
+                                  params={'searchname': 'user1'}, stream=True)
+        first = response.raw.read(10)
+        response.close()
+    entry = load(cassette)[-1]
+    assert entry['partial']
+    assert entry['text'].encode('utf8') == first
+    # a body cut short is not served as if it were the whole page
+    pc = connect(server.url, replay=cassette)
+    pc.plans_login('user0', PASSWORD)
+    with pytest.raises(CassetteError):
+        pc.read_plan('user1')
+
+
+def test_no_passwords(cassette):
+    with FakePlansServer(Corpus(10)) as server:
+        connect(server.url, record=cassette).plans_login('user0', PASSWORD)
+    with io.open(cassette, 'rb') as fl:
+        assert PASSWORD.encode('ascii') not in fl.read()
+    login = load(cassette)[0]
+    assert 'password=&' in login['body'] or \
+        login['body'].endswith('password=')
+    assert 'Set-Cookie' not in login['headers']
+
+
+def test_replay_order(cassette):
+    with FakePlansServer(Corpus(10)) as server:
+        pc = connect(server.url, record=cassette)
+        pc.plans_login('user0', PASSWORD)
+        before = pc.read_plan('user0')[1]
+        text, md5 = pc.get_edit_text()
+        pc.set_edit_text('changed', md5)
+        after = pc.read_plan('user0')[1]
+    pc = connect(server.url, replay=cassette)
+    # a login with other credentials gets the recorded one
+    assert pc.plans_login('someone', 'else')
+    assert pc.read_plan('user0')[1] == before
+    assert pc.read_plan('user0')[1] == after
+    assert pc.read_plan('user0')[1] == after
+    with pytest.raises(CassetteError):
+        pc.read_plan('user9')
+
+
+def test_environment(cassette, monkeypatch, capsys):
+    from clans.ui import ClansSession
+    clansdir = os.path.dirname(cassette)
+    with FakePlansServer(Corpus(10)) as server:
+        with io.open(os.path.join(clansdir, 'clans.cfg'), 'w') as fl:
+            fl.write(u'[login]\nusername=user0\nurl=%s\n' % server.url)
+        monkeypatch.setenv('CLANS_RECORD', cassette)
+        ClansSession(clansdir).run(['list', '-p', PASSWORD])
+    recorded = capsys.readouterr()[0]
+    assert recorded
+    monkeypatch.delenv('CLANS_RECORD')
+    # replay from the profile as it was when recording began
+    for name in ('user0.cookie', 'user0.session'):
+        os.unlink(os.path.join(clansdir, name))
+    monkeypatch.setenv('CLANS_REPLAY', cassette)
+    ClansSession(clansdir).run(['list', '-p', PASSWORD])
+    assert capsys.readouterr()[0] == recorded
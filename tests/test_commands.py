@@ -14,6 +14,7 @@ def cs():
     from clans.ui import ClansSession
     cs = mock.Mock(spec=ClansSession)
     cs.args = dict()
+    cs.make_plan_cache.return_value = None
     return cs
 
 
@@ -48,11 +49,12 @@ def test_search(cs, pc, fmt, term, love):
     l = list()
     cs.args['term'] = term
     cs.args['love'] = love
-    pc.search_plans.return_value = l
+    cs.has_hook.return_value = True
+    pc.search_plans_iter.return_value = l
 
     ui.search(cs, pc, fmt)
     cs.hook.assert_any_call('pre_search', term, planlove=love)
-    pc.search_plans.assert_called_with(term, planlove=love)
+    pc.search_plans_iter.assert_called_with(term, planlove=love)
     cs.hook.assert_called_with('post_search', l)
     fmt.print_search_results.assert_called_with(l)
 
@@ -60,15 +62,31 @@ def test_search(cs, pc, fmt, term, love):
 def test_love(cs, pc, fmt):
     l = list()
     pc.username = 'foo'
-    pc.search_plans.return_value = l
+    cs.has_hook.return_value = True
+    pc.search_plans_iter.return_value = l
 
     ui.love(cs, pc, fmt)
     cs.hook.assert_any_call('pre_search', 'foo', planlove=True)
-    pc.search_plans.assert_called_with('foo', planlove=True)
+    pc.search_plans_iter.assert_called_with('foo', planlove=True)
     cs.hook.assert_called_with('post_search', l)
     fmt.print_search_results.assert_called_with(l)
 
 
+@pytest.mark.parametrize('command', [ui.search, ui.love])
+def test_search_streamed(cs, pc, fmt, command):
+    # with no post_search hooks, results go straight to the formatter
+    it = iter([])
+    pc.username = 'foo'
+    cs.args['term'] = 'foo'
+    cs.args['love'] = False
+    cs.has_hook.return_value = False
+    pc.search_plans_iter.return_value = it
+
+    command(cs, pc, fmt)
+    assert not any(c[0][0] == 'post_search' for c in cs.hook.call_args_list)
+    fmt.print_search_results.assert_called_with(it)
+
+
 def test_watch(cs, pc, fmt):
     l = list()
     pc.planwatch.return_value = l
@@ -76,4 +94,57 @@ def test_watch(cs, pc, fmt):
 
     ui.watch(cs, pc, fmt)
     pc.planwatch.assert_called_with(hours=12)
-    fmt.print_list.assert_called_with(l)
+    fmt.print_planwatch.assert_called_with(l)
+
+
+def test_read(cs, pc, fmt, monkeypatch):
+    pager = mock.Mock()
+    monkeypatch.setattr(ui, 'pager', pager)
+    cs.args['plan'] = ['foo']
+    pc.read_plan.return_value = ({'username': 'foo'}, 'plan')
+    fmt.filter_html.return_value = 'text'
+    fmt.iter_plan.return_value = ['head', 'page']
+
+    ui.read(cs, pc, fmt)
+    pc.read_plan.assert_called_with('foo')
+    # the page is formatted as the pager reads it
+    assert not fmt.iter_plan.called
+    assert ''.join(cs.page.call_args[0][0]) == 'headpage'
+    fmt.iter_plan.assert_called_with(plan='text', username='foo')
+
+
+def test_read_many(cs, pc, fmt, monkeypatch, capsys):
+    from clans.scraper import PlansError
+    pager = mock.Mock()
+    monkeypatch.setattr(ui, 'pager', pager)
+    cs.args['plan'] = ['foo', 'fobar', 'bar']
+    pc.read_plans.return_value = [
+        ('foo', ({'username': 'foo'}, 'plan'), None),
+        ('fobar', None, PlansError('no such plan')),
+        ('bar', ({'username': 'bar'}, 'plan'), None),
+        ]
+    fmt.iter_plan.side_effect = lambda plan, username: [username]
+    fmt.page_break = '\n\n'
+
+    with pytest.raises(SystemExit):
+        ui.read(cs, pc, fmt)
+    pc.read_plans.assert_called_with(['foo', 'fobar', 'bar'])
+    assert ''.join(cs.page.call_args[0][0]) == 'foo\n\nbar'
+    assert '[fobar]: no such plan' in capsys.readouterr()[1]
+
+
+def test_read_cached(cs, pc, fmt, monkeypatch):
+    monkeypatch.setattr(ui, 'pager', mock.Mock())
+    cache = cs.make_plan_cache.return_value = mock.Mock()
+    cache.read_plan.return_value = ({'username': 'foo'}, 'plan')
+    cache.read_plans.return_value = []
+    cs.args['plan'] = ['foo']
+
+    ui.read(cs, pc, fmt)
+    cache.read_plan.assert_called_with(pc, 'foo')
+    assert not pc.read_plan.called
+
+    cs.args['plan'] = ['foo', 'bar']
+    ui.read(cs, pc, fmt)
+    cache.read_plans.assert_called_with(pc, ['foo', 'bar'])
+    assert not pc.read_plans.called
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+Tests for :mod:`clans.daemon`.
+
+"""
+
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+from datetime import datetime
+
+import pytest
+
+if sys.version_info >= (3, 3):
+    import unittest.mock as mock
+else:
+    import mock
+
+if not hasattr(socket, 'AF_UNIX'):
+    pytest.skip('requires Unix domain sockets', allow_module_level=True)
+
+from clans import daemon
+
+
+@pytest.fixture
+def session():
+    profile_dir = tempfile.mkdtemp(suffix='.clansprofile')
+    with open(os.path.join(profile_dir, 'clans.cfg'), 'w') as fl:
+        fl.write('[login]\nusername=baldwint\n')
+    session = daemon.DaemonSession(profile_dir)
+    session._pc = mock.Mock()
+    session.serving = True
+    yield session
+    shutil.rmtree(profile_dir)
+
+
+@pytest.fixture
+def server(session):
+    path = daemon.socket_path(session.profile_dir)
+    server = daemon.DaemonServer(path, session)
+    thread = threading.Thread(target=server.serve_forever,
+                              kwargs={'poll_interval': 0.05})
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def test_watch(session, server, capsys):
+    session._pc.planwatch.return_value = [
+        ('gorp', datetime(2015, 1, 28)), ('climb', datetime(2015, 1, 27))]
+    status = daemon.run_client(session.profile_dir, ['watch', '3'])
+    assert status == 0
+    assert capsys.readouterr()[0] == 'gorp\nclimb\n'
+    session._pc.planwatch.assert_called_with(hours=3)
+    # the connection is kept for the next command
+    assert daemon.run_client(session.profile_dir, ['watch']) == 0
+    assert session._pc.planwatch.call_count == 2
+
+
+def test_read(session, server, capsys):
+    session._pc.read_plan.return_value = (
+        {'username': 'gorp', 'planname': 'Gorp',
+         'lastupdated': datetime(2015, 1, 28),
+         'lastlogin': datetime(2015, 1, 28)}, 'hello')
+    response = daemon.call(daemon.socket_path(session.profile_dir),
+                           ['read', 'gorp'])
+    assert response['page']
+    assert response['stdout'].endswith('hello')
+
+
+def test_autoread_refreshed(session, server, capsys):
+    # stands in for the autoread list seen by an earlier command
+    session._pc.autoread = {'Level 1': ['gorp']}
+
+    def get_autofinger(cached=True):
+        assert session._pc.autoread is None
+        return {'Level 1': ['climb']}
+    session._pc.get_autofinger.side_effect = get_autofinger
+    assert daemon.run_client(session.profile_dir, ['list']) == 0
+    assert 'climb' in capsys.readouterr()[0]
+
+
+def test_errors(session, server, capsys):
+    from clans.scraper import PlansError
+    session._pc.read_plan.side_effect = PlansError('Could not find plan')
+    assert daemon.run_client(session.profile_dir, ['read', 'fobar']) == 1
+    assert 'Could not find plan' in capsys.readouterr()[1]
+    # bad arguments are reported as usual
+    assert daemon.run_client(session.profile_dir, ['watch', 'x']) == 2
+    assert 'invalid int value' in capsys.readouterr()[1]
+
+
+@pytest.mark.parametrize('argv', [
+    ['edit'],
+    ['config', '--dir'],
+    ['watch', '-p', 'hunter2'],
+    ['watch', '--logout'],
+    ['watch', '-u', 'climb'],
+])
+def test_fallback(session, server, argv):
+    assert daemon.run_client(session.profile_dir, argv) is None
+    assert not session._pc.method_calls
+
+
+def test_relogin_falls_back(session, server):
+    def relogin(hours):
+        session._relogin(session._pc)
+    session._pc.planwatch.side_effect = relogin
+    assert daemon.run_client(session.profile_dir, ['watch']) is None
+    assert session._pc is None  # reconnects next time
+
+
+def test_no_daemon(session):
+    assert daemon.run_client(session.profile_dir, ['watch']) is None
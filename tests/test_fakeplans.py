@@ -0,0 +1,176 @@
+"""
+Tests for the fake Plans server in ``fakeplans.py``, driven by a real
+:class:`clans.scraper.PlansConnection`.
+
+"""
+
+import time
+from datetime import timedelta
+
+import pytest
+
+from clans.scraper import PlansConnection, PlansError
+
+from fakeplans import FakePlansServer, Corpus, PASSWORD
+
+
+@pytest.fixture
+def server():
+    with FakePlansServer(Corpus(30, seed=1)) as server:
+        yield server
+
+
+def login(server, username='user0'):
+    pc = PlansConnection(base_url=server.url)
+    assert pc.plans_login(username, PASSWORD)
+    return pc
+
+
+def test_login(server):
+    pc = PlansConnection(base_url=server.url)
+    assert not pc.plans_login('user0', 'wrong')
+    assert not pc.plans_login('nobody', PASSWORD)
+    assert pc.plans_login('user0', PASSWORD)
+    assert pc.username == 'user0'
+    # the session cookie is enough from now on
+    assert pc.plans_login()
+
+
+def test_logged_out(server):
+    pc = PlansConnection(base_url=server.url)
+    relogins = []
+
+    def relogin(pc):
+        relogins.append(pc)
+        return pc.plans_login('user0', PASSWORD)
+    pc.relogin = relogin
+    header, text = pc.read_plan('user1')
+    assert relogins == [pc]
+    assert header['username'] == 'user1'
+
+
+def test_relogin_once(server):
+    pc = PlansConnection(base_url=server.url)
+    relogins = []
+
+    def relogin(pc):
+        relogins.append(pc)
+        time.sleep(0.05)  # while the other threads are bounced too
+        return pc.plans_login('user0', PASSWORD)
+    pc.relogin = relogin
+    names = ['user1', 'user2', 'user3', 'user4']
+    results = pc.read_plans(names, max_workers=4)
+    assert relogins == [pc]
+    assert [(name, err) for name, result, err in results] == \
+        [(name, None) for name in names]
+    # a failed login is not tried again by the other threads
+    pc = PlansConnection(base_url=server.url)
+    pc.relogin = lambda pc: relogins.append(pc) or time.sleep(0.05)
+    results = pc.read_plans(names, max_workers=4)
+    assert relogins.count(pc) == 1
+    assert all(err is not None for name, result, err in results)
+
+
+def test_read(server):
+    pc = login(server)
+    user = server.corpus.get('user1')
+    header, text = pc.read_plan('user1')
+    assert header['username'] == 'user1'
+    assert header['planname'] == 'User1'
+    assert header['lastupdated'] == user.lastupdated
+    assert header['lastlogin'] == user.lastlogin
+    assert text.count('<br>') == user.plan.count('\n')
+    with pytest.raises(PlansError):
+        pc.read_plan('nobody')
+
+
+def test_autoread(server):
+    pc = login(server)
+    autoread = pc.get_autofinger(cached=False)
+    assert autoread == pc.autoread
+    unread = [name for names in autoread.values() for name in names]
+    assert unread
+    # reading a plan takes it off the list
+    pc.read_plan(unread[0])
+    assert unread[0] not in sum(pc.autoread.values(), [])
+    assert unread[0] not in sum(pc.get_autofinger(cached=False).values(), [])
+
+
+def test_search(server):
+    pc = login(server)
+    results = pc.search_plans('gorp')
+    assert results == list(pc.search_plans_iter('gorp'))
+    assert [(name, count) for name, count, snippets in results] == \
+        [(name, count) for name, count, lines in
+         server.corpus.search('gorp')]
+    assert pc.search_plans('no such words') == []
+
+
+def test_search_planlove(server):
+    pc = login(server)
+    user = server.corpus.get('user0')
+    user.plan = 'hi [user5] and [user5:five], not user5'
+    results = dict((name, (count, snippets)) for name, count, snippets
+                   in pc.search_plans('user5', planlove=True))
+    count, snippets = results['user0']
+    assert count == 2
+    assert snippets == [
+        'hi [<a href="read.php?searchname=user5" class="planlove">'
+        'user5</a>] and [<a href="read.php?searchname=user5" '
+        'class="planlove">five</a>], not user5']
+
+
+def test_planwatch(server):
+    pc = login(server)
+    results = pc.planwatch(hours=48)
+    times = [when for name, when in results]
+    assert times == sorted(times, reverse=True)
+    assert set(name for name, when in results) == set(
+        user.username for user in server.corpus.users.values()
+        if user.lastupdated > server.corpus.now - timedelta(hours=48))
+
+
+def test_edit(server):
+    pc = login(server)
+    text, md5 = pc.get_edit_text()
+    assert text.replace('\r\n', '\n') == server.corpus.get('user0').plan
+    new = u'<b>new</b> plan\r\nwith "love" for [user1] ★'
+    assert pc.set_edit_text(new, md5) == 'Plan changed successfully.'
+    assert pc.get_edit_text()[0] == new
+    # the old hash no longer matches
+    with pytest.raises(PlansError):
+        pc.set_edit_text('again', md5)
+    header, html = pc.read_plan('user0')
+    assert html == (u'<b>new</b> plan<br>\nwith &quot;love&quot; for '
+                    u'[<a href="read.php?searchname=user1" '
+                    u'class="planlove">user1</a>] ★\n')
+    assert pc.planwatch(hours=1)[0][0] == 'user0'
+
+
+def test_latency():
+    with FakePlansServer(Corpus(5), latency=0.05) as server:
+        pc = login(server)
+        start = time.time()
+        pc.read_plans(['user1', 'user2', 'user3', 'user4'], max_workers=4)
+        elapsed = time.time() - start
+    # the plans are read at the same time
+    assert 0.05 <= elapsed < 0.2
+
+
+def test_latency_range():
+    with FakePlansServer(Corpus(5), latency=(0, 0.01)) as server:
+        assert server.latency == (0, 0.01)
+    for latency in [(0.1, 0.2, 0.3), []]:
+        with pytest.raises(ValueError):
+            FakePlansServer(Corpus(5), latency=latency)
+
+
+def test_errors():
+    import requests
+    with FakePlansServer(Corpus(5), error_rate=0.5, error_status=503,
+                         seed=2) as server:
+        session = requests.Session()
+        statuses = [session.get(server.url + '/index.php').status_code
+                    for i in range(40)]
+    assert set(statuses) == set([200, 503])
+    assert server.requests == {'index.php': 40}
@@ -4,16 +4,23 @@ Unit tests for :mod:`clans.fmt`.
 
 """
 
+import re
 import sys
 if sys.version_info < (2, 7):
     import unittest2 as unittest
 else:
     import unittest
 
+if sys.version_info >= (3, 3):
+    import unittest.mock as mock
+else:
+    import mock
+
 import clans.fmt
 
 from io import StringIO
 from datetime import datetime
+from random import Random
 
 TEST_DATA = {
     'test_format_date': datetime(2015, 1, 28, 23, 46),
@@ -94,6 +101,24 @@ this is my plan
 
     # other tests
 
+    def test_iter_plan(self):
+        data = TEST_DATA['test_format_plan']
+        chunks = list(self.fmt.iter_plan(**dict(data)))
+        self.assertEqual(''.join(chunks), self.fmt.format_plan(**data))
+        self.assertEqual(chunks[-1], data['plan'])
+
+    def test_iter_search_results(self):
+        # each result is formatted as it arrives
+        seen = []
+        def results():
+            for result in TEST_DATA['test_print_search_results']:
+                seen.append(result)
+                yield result
+        chunks = self.fmt.iter_search_results(results())
+        first = next(chunks)
+        self.assertTrue(first.startswith(self.fmt.format_planlove('plan1')))
+        self.assertEqual(len(seen), 1)
+
     def test_print_list(self):
         lst = TEST_DATA['test_print_list']
         self.fmt.print_list(lst)
@@ -258,6 +283,64 @@ class TestJSON(FakeStdout):
         self.assertEqual(expect, output)
 
 
+class TestNDJSON(FakeStdout):
+
+    def setUp(self):
+        FakeStdout.setUp(self)
+        self.fmt = clans.fmt.NDJSONFormatter()
+
+    def test_format_plan(self):
+        data = TEST_DATA['test_format_plan']
+        text = self.fmt.format_plan(**data)
+        expect = ('{"username":"username",'
+                  '"lastupdated":"2013-08-05T13:22:00Z",'
+                  '"lastlogin":"2013-08-07T03:42:00Z",'
+                  '"planname":"clever catchphrase",'
+                  '"plan":"this is my plan\\n"}\n')
+        self.assertEqual(expect, text)
+
+    def test_print_list(self):
+        lst = TEST_DATA['test_print_list']
+        self.fmt.print_list(lst)
+        output = sys.stdout.getvalue()
+        self.assertEqual('"one"\n"two"\n"three"\n"four"\n', output)
+
+    def test_print_search_results(self):
+        results = TEST_DATA['test_print_search_results']
+        self.fmt.print_search_results(results)
+        output = sys.stdout.getvalue()
+        expect = u"""\
+{"username":"plan1","count":1,"snippets":["snip one <b>term</b> context"]}
+{"username":"plan2","count":2,"snippets":["snip one <b>term</b> context",\
+"snip two <b>term</b> context"]}
+{"username":"plan3","count":2,"snippets":\
+["snip <b>term</b> twice <b>term</b> twice"]}
+"""
+        self.assertEqual(expect, output)
+
+    def test_print_autoread(self):
+        autoread = TEST_DATA['test_print_autoread']
+        self.fmt.print_autoread(autoread)
+        lines = sys.stdout.getvalue().splitlines()
+        self.assertEqual(len(lines), 7)
+        self.assertEqual(lines[0], '{"level":"Level 1","username":"bff"}')
+        self.assertEqual(lines[-1], '{"level":"Level 3","username":"meh"}')
+
+    def test_print_planwatch(self):
+        self.fmt.print_planwatch([('gorp', datetime(2015, 1, 28, 23, 46))])
+        output = sys.stdout.getvalue()
+        expect = '{"username":"gorp","lastupdated":"2015-01-28T23:46:00Z"}\n'
+        self.assertEqual(expect, output)
+
+    def test_records_are_flushed(self):
+        # each record reaches the reader before the next is made
+        written = []
+        sys.stdout.flush = lambda: written.append(sys.stdout.getvalue())
+        self.fmt.print_list(TEST_DATA['test_print_list'])
+        self.assertEqual(written[0], '"one"\n')
+        self.assertEqual(len(written), 4)
+
+
 class TestText(TestRaw):
 
     def setUp(self):
@@ -293,6 +376,34 @@ class TestText(TestRaw):
         text = fmt.format_date(date)
         self.assertIn('January', text)
 
+    def test_date_locales(self):
+        # strftime is only used where it gives what babel does
+        from babel.dates import format_datetime
+        date = datetime(2015, 9, 28, 17, 46)
+        pattern = 'E MMM d YYYY, h:mm a'
+        for locale in ['en_US', 'en_GB', 'en_AU', 'en_IN', 'de_DE']:
+            with mock.patch('babel.dates.LC_TIME', locale):
+                fmt = clans.fmt.TextFormatter(date_format=pattern,
+                                              timezone='UTC')
+            expect = format_datetime(date, pattern, tzinfo=fmt.tzinfo,
+                                     locale=locale)
+            self.assertEqual(expect, fmt.format_date(date), locale)
+            self.assertEqual(fmt._strftime is not None, locale == 'en_US')
+
+    def test_date_formats(self):
+        # formats made with strftime match babel's
+        from babel.dates import format_datetime
+        dates = [datetime(2015, 1, 28, 23, 46), datetime(2014, 12, 29, 7),
+                 datetime(2015, 1, 1, 5, 59, 3), datetime(2012, 4, 12)]
+        for pattern in ['E MMMM d YYYY, h:mm a', 'EEEE, MMM dd yy HH:mm:ss',
+                        "M/d/y H:m:s '%'", 'short', 'd MMMM YYYY G']:
+            fmt = clans.fmt.TextFormatter(date_format=pattern,
+                                          timezone='US/Central')
+            for date in dates + dates:  # the second time, memoized
+                expect = format_datetime(date, pattern, tzinfo=fmt.tzinfo,
+                                         locale=fmt._locale)
+                self.assertEqual(expect, fmt.format_date(date))
+
     def test_format_plan(self):
         data = TEST_DATA['test_format_plan']
         text = self.fmt.format_plan(**data)
@@ -394,6 +505,41 @@ one    two    three  four
 """
         self.assertEqual(expect, output)
 
+    def test_unclosed_is_linear(self):
+        # the regexes used to search to the end for each unclosed tag
+        html = '<p class="sub">x' * 20000 + '<b>y</b>'
+        text = self.fmt.filter_html(html)
+        self.assertTrue(text.startswith('<p class="sub">x<p'))
+        # ...or to the end of the line, when a closing tag follows
+        html = '<a href="x" class="onplan">y' * 20000 + '<br></a>'
+        text = self.fmt.filter_html(html)
+        self.assertTrue(text.startswith('<a href="x" class="onplan">y<a'))
+        html = '<b>x' * 20000 + '<br></b>'
+        text = self.fmt.filter_html(html)
+        self.assertIn('<b>x\n</b>', text)
+
+    def test_sub_elements(self):
+        # same as the regex it replaces, on a soup of tags
+        tokens = ['<b>', '</b>', 'x', '\n', '<a href="u" class="onplan">',
+                  '<a href="v w" class="onplan">', '</a>', '<b']
+        random = Random(0)
+        for _ in range(2000):
+            html = ''.join(random.choice(tokens) for _ in range(10))
+            self.assertEqual(
+                re.sub(r'<b>(.+?)</b>', r'[\1]', html),
+                clans.fmt._sub_elements(re.compile('<b>'), '</b>',
+                                        r'[\1]', html))
+            self.assertEqual(
+                re.sub(r'<a href="([^\s]*)" class="onplan">(.+?)</a>',
+                       r'[\1|\2]', html),
+                clans.fmt._sub_elements(
+                    re.compile(r'<a href="([^\s]*)" class="onplan">'),
+                    '</a>', r'[\1|\2]', html))
+            self.assertEqual(
+                re.compile(r'<b>(.+?)</b>', re.DOTALL).sub(r'\1', html),
+                clans.fmt._sub_elements(re.compile('<b>'), '</b>',
+                                        r'\1', html, dotall=True))
+
 
 class TestColor(TestText):
 
@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+"""
+Correctness harness for the HTML parser backends of
+:class:`clans.scraper.PlansConnection`.
+
+Each backend is fed the same recorded Plans pages (in ``pages/``), and
+must give byte-identical output to the reference html5lib backend.
+
+"""
+
+import io
+import os
+import pytest
+import bs4
+
+from clans.scraper import PlansConnection, PlansError, PARSERS
+
+PAGEDIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pages')
+
+
+class FakeResponse(object):
+    """Stands in for a ``requests.Response`` serving a recorded page."""
+
+    def __init__(self, name, url='http://localhost/phplans/'):
+        with io.open(os.path.join(PAGEDIR, name), 'rb') as fl:
+            self.content = fl.read()
+        self.text = self.content.decode('utf8')
+        self.encoding = 'utf-8'
+        self.url = url + name.replace('.html', '.php')
+        self.status_code = 200
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+
+def connection(parser, pages):
+    """A PlansConnection that serves ``pages`` instead of the network."""
+    if bs4.builder.builder_registry.lookup(parser) is None:
+        pytest.skip('%s is not installed' % parser)
+    pc = PlansConnection(base_url='http://localhost/phplans',
+                         parser=parser)
+    pc.username = 'baldwint'
+    pc._get_page = lambda name, **kwargs: FakeResponse(pages[name])
+    return pc
+
+
+def read_plan(parser, page='read.html'):
+    pc = connection(parser, {'read.php': page})
+    return pc.read_plan('gorp')
+
+
+def search_plans(parser, page='search.html'):
+    pc = connection(parser, {'search.php': page})
+    return pc.search_plans('baldwint', planlove=True)
+
+
+def test_unknown_parser():
+    with pytest.raises(PlansError):
+        PlansConnection(parser='regex')
+
+
+def test_read_plan_reference():
+    header, plan = read_plan('html5lib')
+    assert header['username'] == 'gorp'
+    assert header['planname'] == 'Gorp & Friends'
+    assert header['lastupdated'].isoformat() == '2015-01-28T23:46:00'
+    assert plan.startswith('<b>Welcome</b> to my plan, where I say '
+                           '&quot;things&quot; &amp; <i>stuff</i>.<br>\n')
+    assert ('[<a href="read.php?searchname=baldwint" class="planlove">'
+            'baldwint</a>]') in plan
+    assert '<hr>' in plan and '<br/>' not in plan
+
+
+def test_search_plans_reference():
+    results = search_plans('html5lib')
+    assert [(un, n) for un, n, snips in results] == [
+        ('gorp', 2), ('climb', 1), ('rando', 1)]
+    assert len(results[0][2]) == 2
+
+
+@pytest.mark.parametrize('parser', PARSERS)
+def test_read_plan(parser):
+    assert read_plan(parser) == read_plan('html5lib')
+
+
+@pytest.mark.parametrize('parser', PARSERS)
+def test_read_nonexistent(parser):
+    with pytest.raises(PlansError) as exc:
+        read_plan(parser, 'read_nonexistent.html')
+    assert 'Could not find plan' in str(exc.value)
+
+
+@pytest.mark.parametrize('parser', PARSERS)
+def test_search_plans(parser):
+    assert search_plans(parser) == search_plans('html5lib')
+
+
+@pytest.mark.parametrize('parser', PARSERS)
+def test_search_no_results(parser):
+    assert search_plans(parser, 'search_empty.html') == []
+
+
+@pytest.mark.parametrize('parser', PARSERS)
+def test_planwatch(parser):
+    pc = connection(parser, {'planwatch.php': 'planwatch.html'})
+    reference = connection('html5lib', {'planwatch.php': 'planwatch.html'})
+    assert pc.planwatch() == reference.planwatch()
+    assert [un for un, t in pc.planwatch()] == ['gorp', 'climb', 'rando']
+
+
+@pytest.mark.parametrize('parser', PARSERS)
+def test_get_edit_text(parser):
+    pc = connection(parser, {'edit.php': 'edit.html'})
+    plan, md5 = pc.get_edit_text()
+    assert plan.startswith(u'<b>Welcome</b> to my plan')
+    assert plan.endswith(u'\r\n')
+
+
+@pytest.mark.parametrize('parser', PARSERS)
+def test_set_edit_text(parser):
+    pc = connection(parser, {'edit.php': 'edit_success.html'})
+    assert pc.set_edit_text(u'new plan', 'abc') == 'Plan changed successfully.'
+
+
+@pytest.mark.parametrize('parser', PARSERS)
+def test_read_plan_sliced(parser):
+    pc = connection(parser, {'read.php': 'read.html'})
+    pc.slice_text = True
+    header, plan = pc.read_plan('gorp')
+    ref_header, ref_plan = read_plan('html5lib')
+    assert header == ref_header
+    # sliced text is byte-for-byte what the server sent
+    page = FakeResponse('read.html').text
+    assert plan in page
+    assert plan.startswith('<b>Welcome</b> to my plan')
+    assert plan.endswith('the end\n')
+    assert 'Non-breaking&nbsp;&nbsp;spaces' in plan
+    # and matches the reserialized text, entities aside
+    assert plan.split('Non-breaking')[0] == ref_plan.split('Non-breaking')[0]
+
+
+@pytest.mark.parametrize('parser', PARSERS)
+def test_read_nonexistent_sliced(parser):
+    pc = connection(parser, {'read.php': 'read_nonexistent.html'})
+    pc.slice_text = True
+    with pytest.raises(PlansError):
+        pc.read_plan('fobar')
+
+
+def served(pc, replace):
+    """ Serve read.html to ``pc``, with the markup changed by ``replace`` """
+    def get_page(name, **kwargs):
+        response = FakeResponse('read.html')
+        for old, new in replace:
+            response.content = response.content.replace(old, new)
+        response.text = response.content.decode('utf8')
+        return response
+    pc._get_page = get_page
+
+
+@pytest.mark.parametrize('parser', PARSERS)
+def test_read_plan_markup(parser):
+    # markup other than the fast path expects is read in full
+    pc = connection(parser, {})
+    served(pc, [(b'<div class="plan_text">',
+                 b"<div class='plan_text wide'>")])
+    assert pc.read_plan('gorp') == read_plan('html5lib')
+
+
+def test_read_plan_no_alert():
+    pc = connection('html5lib', {})
+    served(pc, [(b'plan_text', b'not_plan_text'),
+                (b'alertmessage', b'not_alertmessage')])
+    with pytest.raises(PlansError):
+        pc.read_plan('gorp')
+
+
+@pytest.mark.parametrize('content,span', [
+    (b'<div class="plan_text">plan</div>', (23, 27)),
+    (b'<div class="plan_text"><div>a</div>b</div><div>', (23, 36)),
+    (b'<div class="plan_text">unterminated', None),
+    (b'<div class="alertmessage"></div>', None),
+])
+def test_find_div(content, span):
+    from clans.scraper import _find_div, PLAN_TEXT_TAG
+    assert _find_div(content, PLAN_TEXT_TAG) == span
+
+
+def test_plan_header_parser():
+    from clans.scraper import PlanHeaderParser
+    parser = PlanHeaderParser()
+    parser.feed(FakeResponse('read.html').text)
+    parser.close()
+    assert parser.page_id == 'planread'
+    assert parser.username == 'baldwint'
+    assert parser.header == {
+        'username': 'gorp',
+        'planname': 'Gorp & Friends',
+        'lastupdated': 'Wed January 28th 2015, 5:46 PM',
+        'lastlogin': 'Thu April 12th 2012, 3:06 PM',
+        }
+    # pages without a plan header leave it unset
+    parser = PlanHeaderParser()
+    parser.feed(FakeResponse('read_nonexistent.html').text)
+    assert parser.header is None
+
+
+@pytest.mark.parametrize('parser', PARSERS)
+@pytest.mark.parametrize('chunk_size', [7, 100, 8192])
+def test_search_plans_iter(parser, chunk_size):
+    pc = connection(parser, {'search.php': 'search.html'})
+    results = pc.search_plans_iter('baldwint', planlove=True,
+                                   chunk_size=chunk_size)
+    assert list(results) == search_plans('html5lib')
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5, 7, 31, 1000])
+def test_div_scanner(chunk_size):
+    from clans.scraper import _DivScanner, _find_div, RESULT_GROUP_TAG
+    content = (b'<html><div class="result_user_group">a<DIV>b</div>'
+               b'c</div><div>x</div><div class="result_user_group">'
+               b'</div><div class="result_user_group"><div><divx>'
+               b'</div></div>tail<div class="result_user_group">open')
+    expected, pos = [], 0
+    span = _find_div(content, RESULT_GROUP_TAG)
+    while span is not None:
+        start, pos = span
+        expected.append(content[start - len(RESULT_GROUP_TAG):pos])
+        span = _find_div(content, RESULT_GROUP_TAG, pos)
+    scanner = _DivScanner(RESULT_GROUP_TAG)
+    divs = []
+    for i in range(0, len(content), chunk_size):
+        divs.extend(scanner.feed(content[i:i + chunk_size]))
+    assert len(expected) == 3
+    assert divs == expected
+
+
+def test_search_plans_iter_empty():
+    pc = connection('html5lib', {'search.php': 'search_empty.html'})
+    assert list(pc.search_plans_iter('fobar')) == []
+
+
+@pytest.mark.parametrize('max_workers', [1, 4, 20])
+def test_read_plans(max_workers):
+    pc = connection('html5lib', {})
+
+    def get_page(name, get=None, **kwargs):
+        if get['searchname'] == 'fobar':
+            return FakeResponse('read_nonexistent.html')
+        return FakeResponse('read.html')
+    pc._get_page = get_page
+    names = ['gorp', 'fobar', 'climb', 'gorp']
+    results = pc.read_plans(names, max_workers=max_workers)
+    assert [name for name, result, err in results] == names
+    assert results[0][1] == read_plan('html5lib')
+    assert results[0][2] is None
+    assert results[1][1] is None
+    assert isinstance(results[1][2], PlansError)
+
+
+def test_relogin():
+    pc = connection('html5lib', {})
+    del pc._get_page
+    login_page = FakeResponse('read_nonexistent.html')
+    login_page.url = 'http://localhost/phplans/index.php'
+    login_page.history = ['redirect']
+    plan_page = FakeResponse('read.html')
+    plan_page.history = []
+    pc.session.send = lambda *args, **kwargs: pages.pop(0)
+    logins = []
+
+    def relogin(pc):
+        logins.append(pc)
+        return True
+    pc.relogin = relogin
+    pages = [login_page, plan_page]
+    assert pc.read_plan('gorp') == read_plan('html5lib')
+    assert logins == [pc]
+    # without a way to log back in, the request is not retried
+    pc.relogin = None
+    pages = [login_page, plan_page]
+    with pytest.raises(PlansError):
+        pc.read_plan('gorp')
+
+
+AUTOREAD = {'Level 1': ['gorp', 'climb'], 'Level 2': ['rando'], 'Level 3': []}
+
+
+def test_page_parser_autoread():
+    from clans.scraper import PlansPageParser
+    parser = PlansPageParser()
+    parser.feed(FakeResponse('home.html').text)
+    assert parser.autoread == AUTOREAD
+    parser = PlansPageParser()
+    parser.feed(FakeResponse('search.html').text)
+    assert parser.autoread is None
+
+
+@pytest.mark.parametrize('page,name', [
+    ('home.html', 'index.php'),
+    ('read.html', 'read.php'),
+    ('edit.html', 'edit.php'),
+])
+def test_autoread_piggyback(page, name):
+    pc = connection('html5lib', {name: page,
+                                 'api/1/index.php': 'autofinger.json'})
+    pc.username = None
+    if name == 'index.php':
+        assert pc.plans_login()
+    elif name == 'read.php':
+        pc.read_plan('gorp')
+    else:
+        pc.username = 'baldwint'
+        pc.get_edit_text()
+    assert pc.get_autofinger() == AUTOREAD
+    # can still ask the API
+    assert pc.get_autofinger(cached=False) == {'Level 1': ['gorp']}
+
+
+def test_autofinger_not_seen():
+    pc = connection('html5lib', {'api/1/index.php': 'autofinger.json'})
+    assert pc.get_autofinger() == {'Level 1': ['gorp']}
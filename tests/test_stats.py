@@ -0,0 +1,204 @@
+import threading
+import time
+
+import pytest
+
+from clans.stats import Stats
+
+from fakeplans import FakePlansServer, Corpus, PASSWORD
+
+
+def test_spans():
+    stats = Stats()
+    with stats.span('outer'):
+        time.sleep(0.01)
+        for i in range(2):
+            with stats.span('inner'):
+                time.sleep(0.01)
+    calls, total, own = stats.spans['outer']
+    assert calls == 1
+    assert total >= 0.03
+    assert 0.01 <= own < total - 0.015
+    calls, total, own = stats.spans['inner']
+    assert calls == 2
+    assert own == total
+
+
+def test_span_error():
+    stats = Stats()
+    with pytest.raises(ValueError):
+        with stats.span('fails'):
+            raise ValueError()
+    assert stats.spans['fails'][0] == 1
+    with stats.span('next'):
+        pass
+    assert stats.spans['next'][1] == stats.spans['next'][2]
+
+
+def test_threads():
+    stats = Stats()
+
+    def work():
+        for i in range(100):
+            with stats.span('work'):
+                stats.count('items')
+
+    with stats.span('main'):
+        threads = [threading.Thread(target=work) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert stats.spans['work'][0] == 400
+    assert stats.counters == {'items': 400}
+    # spans on other threads are not part of this one's
+    assert stats.spans['main'][1] == stats.spans['main'][2]
+
+
+def test_report():
+    stats = Stats()
+    stats.add_span('short', 0.001)
+    stats.add_span('long', 0.5, 0.25)
+    stats.count('bytes', 1234)
+    lines = stats.report().split('\n')
+    assert lines[0].split() == ['span', 'calls', 'total', 'own']
+    assert lines[1].split() == ['long', '1', '500.0', 'ms', '250.0', 'ms']
+    assert lines[2].split() == ['short', '1', '1.0', 'ms', '1.0', 'ms']
+    assert lines[-1].split() == ['bytes', '1234']
+    stats.reset()
+    assert stats.report().count('\n') == 0
+
+
+def test_trace():
+    stats = Stats(trace=True)
+    with stats.span('outer', kind='test') as details:
+        with stats.span('inner'):
+            pass
+        details['more'] = 1
+    assert [e['name'] for e in stats.events] == ['inner', 'outer']
+    inner, outer = stats.events
+    assert outer['ph'] == 'X'
+    assert outer['args'] == {'kind': 'test', 'more': 1}
+    assert 'args' not in inner
+    assert outer['ts'] <= inner['ts']
+    assert inner['ts'] + inner['dur'] <= outer['ts'] + outer['dur']
+    # nothing is kept unless tracing
+    stats = Stats()
+    with stats.span('outer'):
+        pass
+    assert stats.events == []
+
+
+def test_iterate():
+    stats = Stats(trace=True)
+
+    def chunks():
+        for i in range(3):
+            with stats.span('inside'):
+                pass
+            yield i
+    assert list(stats.iterate('step', chunks())) == [0, 1, 2]
+    # one more step finds the end
+    assert stats.spans['step'][0] == 4
+    assert stats.spans['inside'][0] == 3
+
+
+def test_write_trace():
+    import io
+    import json
+    stats = Stats(trace=True)
+    with stats.span('main'):
+        with stats.span('child', url='http://example.com/'):
+            pass
+    fl = io.StringIO()
+    stats.write_trace(fl, command='test')
+    trace = json.loads(fl.getvalue())
+    assert trace['otherData'] == {'command': 'test'}
+    names = [(e['ph'], e['name']) for e in trace['traceEvents']]
+    assert names == [('M', 'thread_name'), ('X', 'child'), ('X', 'main')]
+    assert trace['traceEvents'][0]['args'] == {'name': 'MainThread'}
+
+
+def test_connection():
+    from clans.scraper import PlansConnection
+    with FakePlansServer(Corpus(10)) as server:
+        pc = PlansConnection(base_url=server.url)
+        pc.plans_login('user0', PASSWORD)
+        pc.read_plan('user1')
+        list(pc.search_plans_iter('gorp'))
+    for name in ('plans_login', 'read_plan', 'connect', 'transfer',
+                 'decode', 'parse', 'extract'):
+        assert name in pc.stats.spans
+    assert pc.stats.spans['read_plan'][0] == 1
+    assert pc.stats.counters['requests'] == 3
+    assert pc.stats.counters['redirects'] == 1
+    assert pc.stats.counters['status 200'] == 3
+    assert pc.stats.counters['bytes'] > 1000
+
+
+def test_stats_flag(tmpdir, capsys):
+    import io
+    from clans.ui import ClansSession
+    with FakePlansServer(Corpus(10)) as server:
+        with io.open(str(tmpdir.join('clans.cfg')), 'w') as fl:
+            fl.write(u'[login]\nusername=user0\nurl=%s\n' % server.url)
+        cs = ClansSession(str(tmpdir))
+        events = []
+        cs.stats.reset = lambda: events.extend(cs.stats.events)
+        cs.run(['list', '-p', PASSWORD])
+        assert 'connect' not in capsys.readouterr()[1]
+        # no events are kept without --trace
+        assert not cs.stats.trace and events == []
+        ClansSession(str(tmpdir)).run(['watch', '--stats'])
+    err = capsys.readouterr()[1].split('\n')
+    assert err[0].split() == ['span', 'calls', 'total', 'own']
+    # the command takes longest
+    assert err[1].split()[:2] == ['watch', '1']
+    assert 'planwatch' in '\n'.join(err)
+
+
+def test_trace_flag(tmpdir, capsys):
+    import io
+    import json
+    from clans.ui import ClansSession
+    tracefile = str(tmpdir.join('trace.json'))
+    with FakePlansServer(Corpus(10)) as server:
+        with io.open(str(tmpdir.join('clans.cfg')), 'w') as fl:
+            fl.write(u'[login]\nusername=user0\nurl=%s\n'
+                     u'[extensions]\nnewlove=\n' % server.url)
+        ClansSession(str(tmpdir)).run(['love', '-p', PASSWORD,
+                                       '--trace', tracefile])
+    with io.open(tracefile) as fl:
+        trace = json.load(fl)
+    assert trace['otherData']['command'] == 'love'
+    names = set(e['name'] for e in trace['traceEvents'])
+    for name in ('load_config', 'import newlove', 'load_extensions',
+                 'newlove.post_search', 'plans_login', 'connect', 'parse',
+                 'format', 'love'):
+        assert name in names
+    urls = [e['args']['url'] for e in trace['traceEvents']
+            if e['name'] == 'connect']
+    assert urls[-1].endswith('/search.php?mysearch=user0&planlove=1')
+    assert PASSWORD not in json.dumps(trace)
+
+
+def test_profile_flag(tmpdir, capsys):
+    import io
+    import pstats
+    from clans.ui import ClansSession
+    with FakePlansServer(Corpus(10)) as server:
+        with io.open(str(tmpdir.join('clans.cfg')), 'w') as fl:
+            fl.write(u'[login]\nusername=user0\nurl=%s\n' % server.url)
+        ClansSession(str(tmpdir)).run(['love', '-p', PASSWORD,
+                                       '--profile-memory'])
+    err = capsys.readouterr()[1]
+    profiles = tmpdir.join('profiles')
+    files = sorted(path.basename for path in profiles.listdir())
+    assert [name.split('.', 1)[1] for name in files] == \
+        ['memory.txt', 'pstats']
+    assert all(name.startswith('love-') for name in files)
+    assert str(profiles.join(files[1])) in err
+    functions = pstats.Stats(str(profiles.join(files[1]))).stats
+    assert any(name == 'search_plans_iter' for path, line, name in functions)
+    with io.open(str(profiles.join(files[0]))) as fl:
+        assert fl.readline().startswith('peak ')
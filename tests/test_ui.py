@@ -17,6 +17,7 @@ else:
     import mock
 
 import clans.ui
+import clans.scraper
 import tempfile
 import os
 import shutil
@@ -62,6 +63,43 @@ class TestExternalEditor(SubprocessMocked):
         self.assertEqual(edited, u"hi there loser")
 
 
+class TestPager(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.out = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self.out)
+
+    def chunks(self, seen):
+        for chunk in [u'one\n', u'two \u2605\n']:
+            seen.append(chunk)
+            yield chunk
+
+    def test_streamed_to_pager(self):
+        seen = []
+        cmd = 'cat > %s' % self.out
+        with mock.patch('clans.ui._pager_command', return_value=cmd):
+            clans.ui.pager(self.chunks(seen))
+        self.assertEqual(len(seen), 2)
+        with open(self.out, 'rb') as fl:
+            self.assertEqual(fl.read().decode('utf8', 'replace')[:4],
+                             u'one\n')
+
+    def test_pager_quits_early(self):
+        # the pager exits without reading; the rest is thrown away
+        with mock.patch('clans.ui._pager_command', return_value='true'):
+            clans.ui.pager(u'x' * 10**6 for _ in range(10))
+
+    def test_not_a_terminal(self):
+        with mock.patch('clans.ui._pager_command', return_value=''):
+            with mock.patch('sys.stdout') as stdout:
+                clans.ui.pager(self.chunks([]))
+        written = ''.join(c[0][0] for c in stdout.write.call_args_list)
+        self.assertEqual(written, u'one\ntwo \u2605\n')
+
+
 class WithClansdir(unittest.TestCase):
 
     def setUp(self):
@@ -100,5 +138,207 @@ class TestSession(WithClansdir):
         self.assertEqual(username, 'baldwint')
 
 
+class TestPlanCache(WithClansdir):
+
+    def session(self, cls=clans.ui.ClansSession, hours=6):
+        with open(os.path.join(self.clansdir, 'clans.cfg'), 'w') as fl:
+            fl.write("[clans]\ncache=yes\ncache_hours=%s\n" % hours)
+        cs = cls(self.clansdir)
+        cs.args = {'logout': False}
+        return cs
+
+    def test_closed(self):
+        import sqlite3
+        cs = self.session()
+        cache = cs.make_plan_cache()
+        cs.finish()
+        self.assertRaises(sqlite3.ProgrammingError, cache.get, 'gorp')
+
+    def test_cache_hours(self):
+        cs = self.session(hours=2)
+        self.assertEqual(cs.make_plan_cache().max_hours, 2)
+        cs.finish()
+
+    def test_daemon_keeps_open(self):
+        from clans.daemon import DaemonSession
+        cs = self.session(DaemonSession)
+        cache = cs.make_plan_cache()
+        cs.finish()
+        self.assertIs(cs.make_plan_cache(), cache)
+        self.assertEqual(cache.get('gorp'), None)
+        cache.close()
+
+
+class TestStartup(WithClansdir):
+
+    # too slow to import on every run; only commands that need
+    # these modules should pay for them
+    HEAVY = ['bs4', 'requests', 'html5lib', 'dateutil', 'pytz',
+             'babel', 'colorama', 'appdirs', 'http.cookiejar']
+
+    def test_lazy_imports(self):
+        import subprocess
+        import json
+        script = ('import sys, json, clans.ui; '
+                  'clans.ui.ClansSession(sys.argv[1]); '
+                  'print(json.dumps(sorted(sys.modules)))')
+        out = subprocess.check_output([sys.executable, '-c', script,
+                                       self.clansdir])
+        imported = set(json.loads(out.decode('utf8')))
+        self.assertEqual([m for m in self.HEAVY if m in imported], [])
+
+
+class TestHooks(WithClansdir):
+
+    EXTENSION = (
+        "import time\n"
+        "def post_load_commands(cs):\n"
+        "    time.sleep(0.05)\n"
+        "def pre_search(cs, term, planlove=False):\n"
+        "    pass\n")
+
+    def setUp(self):
+        WithClansdir.setUp(self)
+        with open(os.path.join(self.clansdir, 'slowext.py'), 'w') as fl:
+            fl.write(self.EXTENSION)
+        sys.path.insert(0, self.clansdir)
+
+    def tearDown(self):
+        sys.path.remove(self.clansdir)
+        sys.modules.pop('slowext', None)
+        WithClansdir.tearDown(self)
+
+    def session(self, budget=''):
+        with open(os.path.join(self.clansdir, 'clans.cfg'), 'w') as fl:
+            fl.write("[clans]\nhook_budget=%s\n"
+                     "[extensions]\nslow=slowext\n" % budget)
+        with mock.patch('sys.stderr') as stderr:
+            cs = clans.ui.ClansSession(self.clansdir)
+        warnings = ''.join(call[1][0] for call in stderr.write.mock_calls)
+        return cs, warnings
+
+    def test_hook_timing(self):
+        cs, warnings = self.session()
+        self.assertEqual(warnings, '')
+        calls, total, own = cs.stats.spans['slow.post_load_commands']
+        self.assertEqual(calls, 1)
+        self.assertTrue(total >= 0.05)
+        cs.hook('pre_search', 'term')
+        self.assertEqual(cs.stats.spans['slow.pre_search'][0], 1)
+        event = cs.stats.events[-1]
+        self.assertEqual(event['args'], {'extension': 'slow',
+                                         'hook': 'pre_search'})
+
+    def test_bad_hook_budget(self):
+        with open(os.path.join(self.clansdir, 'clans.cfg'), 'w') as fl:
+            fl.write("[clans]\nhook_budget=fast\n")
+        with mock.patch('sys.stderr') as stderr:
+            with self.assertRaises(SystemExit) as cm:
+                clans.ui.ClansSession(self.clansdir)
+        self.assertEqual(cm.exception.code, 1)
+        error = ''.join(call[1][0] for call in stderr.write.mock_calls)
+        self.assertTrue(error.startswith('hook_budget must be a number'))
+
+    def test_dispatch(self):
+        cs, warnings = self.session()
+        self.assertTrue(cs.has_hook('pre_search'))
+        self.assertFalse(cs.has_hook('post_search'))
+        self.assertEqual(cs.hook('post_search', []), [None])
+        # extensions added later are called from then on
+        ext = type(sys)('lateext')
+        ext.post_search = lambda cs, results: results.append('late')
+        cs.add_extension('late', ext)
+        self.assertTrue(cs.has_hook('post_search'))
+        results = []
+        # one value for each extension, in order
+        self.assertEqual(cs.hook('post_search', results), [None, None])
+        self.assertEqual(results, ['late'])
+        ext.pre_search = lambda cs, term, planlove=False: term
+        cs.add_extension('late', ext)
+        self.assertEqual(cs.hook('pre_search', 'term'), [None, 'term'])
+
+    def test_hook_budget(self):
+        cs, warnings = self.session(budget='20')
+        self.assertTrue(warnings.startswith(
+            'Extension "slow" took '))
+        self.assertTrue('in post_load_commands (hook_budget is 20 ms)'
+                        in warnings)
+        self.assertEqual(cs.stats.counters['slow hooks'], 1)
+        # fast hooks are let off
+        cs.hook('pre_search', 'term')
+        self.assertEqual(cs.stats.counters['slow hooks'], 1)
+
+
+def make_cookie(name, value, expires):
+    if sys.version_info >= (3, 3):
+        from http.cookiejar import Cookie
+    else:
+        from cookielib import Cookie
+    return Cookie(0, name, value, None, False, 'www.grinnellplans.com',
+                  False, False, '/', True, False, expires, False,
+                  None, None, {})
+
+
+class TestLoginSkipped(WithClansdir):
+
+    def setUp(self):
+        super(TestLoginSkipped, self).setUp()
+        self.real_pc = clans.scraper.PlansConnection
+        clans.scraper.PlansConnection = mock.Mock()
+        self.pc = clans.scraper.PlansConnection.return_value
+        self.pc.username = 'baldwint'
+        self.pc.plans_login.return_value = True
+
+    def tearDown(self):
+        clans.scraper.PlansConnection = self.real_pc
+        super(TestLoginSkipped, self).tearDown()
+
+    def connect(self, expires=2 ** 31, **config):
+        cs = clans.ui.ClansSession(self.clansdir)
+        for key, value in config.items():
+            cs.config.set('login', key, value)
+        cs.username = 'baldwint'
+        cs.args = {'password': None, 'logout': False}
+        pc = cs.make_plans_connection()
+        cs.cookie.set_cookie(make_cookie('PHPSESSID', 'abc', expires))
+        cs.finish()
+        return cs, pc
+
+    def test_login_verified_once(self):
+        cs, pc = self.connect()
+        self.assertEqual(pc.plans_login.call_count, 1)
+        self.assertTrue(os.path.exists(cs._session_info_loc()))
+        # the next connection takes the server's word from last time
+        self.pc.username = None
+        cs, pc = self.connect()
+        self.assertEqual(pc.plans_login.call_count, 1)
+        self.assertEqual(pc.username, 'baldwint')
+
+    def test_verify_interval(self):
+        self.connect(verify_interval='0')
+        self.connect(verify_interval='0')
+        self.assertEqual(self.pc.plans_login.call_count, 2)
+
+    def test_cookie_expired(self):
+        self.connect(expires=1)
+        self.connect()
+        self.assertEqual(self.pc.plans_login.call_count, 2)
+
+    def test_logout(self):
+        cs, pc = self.connect()
+        cs.args['logout'] = True
+        cs.finish()
+        self.assertFalse(os.path.exists(cs._session_info_loc()))
+        self.connect()
+        self.assertEqual(self.pc.plans_login.call_count, 2)
+
+    def test_relogin(self):
+        cs, pc = self.connect()
+        relogin = clans.scraper.PlansConnection.call_args[1]['relogin']
+        cs.args['password'] = 'hunter2'
+        self.assertTrue(relogin(pc))
+        pc.plans_login.assert_called_with('baldwint', 'hunter2')
+
+
 if __name__ == "__main__":
     unittest.main()
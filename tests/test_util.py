@@ -56,6 +56,38 @@ def test_parse_plans_date(string, result):
     assert util.parse_plans_date(string) == result
 
 
+@pytest.mark.parametrize('string', [
+    'Wed January 28th 2015, 5:46 PM',
+    'Sat March 1st 2014, 12:00 AM',
+    'Mon March 9th 2015, 12:59 PM',
+    'Sun November 1st 2015, 1:30 AM',   # happens twice, as DST ends
+    'Sun March 8th 2015, 2:30 AM',      # doesn't happen, as DST starts
+    ])
+def test_parse_plans_date_fast(string):
+    # the fast path agrees with dateutil
+    import dateutil.parser
+    assert util._parse_local_date(string) == dateutil.parser.parse(string)
+
+
+@pytest.mark.parametrize('string,tz_name,result', [
+    # other formats are left to dateutil
+    ('2015-01-28 17:46', 'US/Central', datetime(2015, 1, 28, 23, 46)),
+    ('Wed January 28th 2015, 5:46 PM', 'UTC', datetime(2015, 1, 28, 17, 46)),
+    # Lord Howe Island springs forward half an hour, at 2 AM
+    ('Sun October 6th 2024, 2:47 AM', 'Australia/Lord_Howe',
+        datetime(2024, 10, 5, 15, 47)),
+])
+def test_parse_plans_date_other(string, tz_name, result):
+    assert util.parse_plans_date(string, tz_name) == result
+
+
+def test_parse_plans_dates():
+    strings = ['Wed January 28th 2015, 5:46 PM',
+               'Thu April 12th 2012, 3:06 PM']
+    assert util.parse_plans_dates(strings) == [
+        datetime(2015, 1, 28, 23, 46), datetime(2012, 4, 12, 20, 6)]
+
+
 @pytest.mark.parametrize('dic,result', [
     # respect the order of ordered dicts
     (OrderedDict((("bae", "come over"),
@@ -76,3 +108,28 @@ def test_parse_plans_date(string, result):
 def test_json_output(dic, result):
     thing = util.json_output(dic)
     assert util.json_output(dic) == result
+
+
+@pytest.fixture(params=['stdlib', 'fast'])
+def json_backend(request, monkeypatch):
+    if request.param == 'stdlib':
+        monkeypatch.setattr(util, '_fast_dumps', False)
+    else:
+        fast = util._load_fast_dumps()
+        if not fast:
+            pytest.skip('neither orjson nor ujson is installed')
+        monkeypatch.setattr(util, '_fast_dumps', fast)
+    return request.param
+
+
+@pytest.mark.parametrize('dic,result', [
+    (OrderedDict((("me", "cant"), ("bae", ["come", "over"]))),
+     u'{"me":"cant","bae":["come","over"]}'),
+    ({"me": "cant", "bae": {"z": 1, "a": None}},
+     u'{"bae":{"a":null,"z":1},"me":"cant"}'),
+    ({"when": datetime(2013, 5, 1, 3, 26, 56), "what": u"\u2605/\""},
+     u'{"what":"\u2605/\\"","when":"2013-05-01T03:26:56Z"}'),
+    ([["plan1", 1, ["snip"]]], u'[["plan1",1,["snip"]]]'),
+])
+def test_json_output_compact(json_backend, dic, result):
+    assert util.json_output(dic, compact=True) == result